@@ -0,0 +1,81 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module creates the boto3 clients of the function. Clients are only created when a run needs
+them, and are kept for warm invocations. They use short connect timeouts, TCP keep-alive and a
+connection pool that is sized for the number of threads that share the client. The RAM client
+uses standard retries, which do not rate limit the client, so throttles reach the remediation
+engine, which adapts its concurrency to them. The other clients use adaptive retries.
+"""
+
+import threading
+from typing import Optional
+
+import boto3
+from botocore.config import Config
+
+from lf_stale_ram_invite_monitor.instrumentation import instrumentation
+
+DEFAULT_CONNECT_TIMEOUT_IN_SECS = 2
+DEFAULT_READ_TIMEOUT_IN_SECS = 20
+# Retries per call after the first attempt. Adaptive mode also rate limits the client once it is throttled.
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRIES = {"mode": "adaptive", "max_attempts": DEFAULT_MAX_ATTEMPTS}
+# The SDK default of 3 attempts, a read timeout after a disassociate is retried like any other transient error.
+# Adaptive mode would also rate limit the client on throttles, which is left to the AIMD limiter of the remediation engine.
+RAM_RETRIES = {"mode": "standard", "total_max_attempts": 3}
+# Retry config per service, the other services use DEFAULT_RETRIES.
+SERVICE_RETRIES = {"ram": RAM_RETRIES}
+# The botocore default, matches the default number of remediation workers.
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+
+def client_config(max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS, service_name: Optional[str] = None) -> Config:
+    """
+    The botocore config of the client of a service, with a pool of `max_pool_connections` connections.
+    """
+    return Config(
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT_IN_SECS,
+        read_timeout=DEFAULT_READ_TIMEOUT_IN_SECS,
+        retries=dict(SERVICE_RETRIES.get(service_name, DEFAULT_RETRIES)),
+        max_pool_connections=max(1, max_pool_connections),
+        tcp_keepalive=True,
+    )
+
+
+class ClientFactory:
+    """
+    Creates the clients of a boto3 session on first use, one per service and pool size, and keeps
+    them. The session is the default one, unless one is given, for example with the credentials of
+    an assumed role.
+    """
+
+    def __init__(self, session: Optional[boto3.session.Session] = None, region_name: Optional[str] = None):
+        self.session = session
+        self.region_name = region_name
+        self._clients: dict[tuple[str, int], object] = {}
+        self._lock = threading.Lock()
+
+    def client(self, service_name: str, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS):
+        """
+        The client of a service, with at least `max_pool_connections` pooled connections.
+        """
+        max_pool_connections = max(DEFAULT_MAX_POOL_CONNECTIONS, max_pool_connections)
+        key = (service_name, max_pool_connections)
+        with self._lock:
+            if key not in self._clients:
+                # boto3.client shares the default session, which is not thread safe to create clients from.
+                session = self.session if self.session is not None else boto3.session.Session()
+                self.session = session
+                client = session.client(service_name, region_name=self.region_name, config=client_config(max_pool_connections, service_name))
+                instrumentation.instrument_client(client)
+                self._clients[key] = client
+            return self._clients[key]
+
+    @property
+    def created_count(self) -> int:
+        """
+        Number of clients that were created.
+        """
+        return len(self._clients)
@@ -6,55 +6,539 @@ This module contains functions and classes that help with interacting with Dynam
 is used to store and retrieve permissions for expired RAM shares. It hopes a snapshot before
 we start revoking permissions so that those permissions can be regranted in the event of an error
 occurs before doing grants.
+Failed resource shares are kept in a retry queue with an attempt count and the time of the next
+attempt, and expire through the DynamoDB TTL when they keep failing. The same table holds the index
+of the resource shares behind Lake Formation permissions, the invitations that were seen in
+RAM and Lake Formation events, queued until they reach the invitation timeout, and the remediation
+history of the resource shares that were recreated recently.
 """
 
+import heapq
 import json
+import threading
+import time
+import zlib
+from typing import Iterable, Iterator, Optional
 
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor.instrumentation import instrumentation
 
 logger = Logger()
-tracer = Tracer()
+
+# Key of the item that holds the continuation cursor of an unfinished run. Resource share arns never start with "#".
+CHECKPOINT_KEY = "#checkpoint"
+
+# Items written before the retry queue only hold the principals in LEGACY_PRINCIPALS_ATTRIBUTE. They are copied into the
+# retry queue by utility/migrate_retry_queue.py.
+LEGACY_PRINCIPALS_ATTRIBUTE = "aws_account"
+
+
+# Resource shares that need a retry carry this value in RETRY_QUEUE_ATTRIBUTE, which is the partition key of a sparse
+# index sorted by the time of the next attempt. Other items, like the checkpoint, do not show up in the index.
+RETRY_QUEUE_INDEX = "retry-queue-index"
+RETRY_QUEUE_ATTRIBUTE = "retry_queue"
+RETRY_QUEUE_NAME = "retry"
+# Invitations that were seen in RAM and Lake Formation events are queued in the same index under PENDING_QUEUE_NAME,
+# sorted by the time they reach the invitation timeout. Their items are stored under "pending#<key>", where the key
+# is a resource share arn, or "principal#<account id>" when the event did not name the resource share.
+PENDING_QUEUE_NAME = "pending"
+PENDING_KEY_PREFIX = "pending#"
+# The remediation history of a resource share is stored under "history#<resource share arn>" and queued in the same
+# index under HISTORY_QUEUE_NAME, sorted by the time the resource share was last recreated.
+HISTORY_QUEUE_NAME = "history"
+HISTORY_KEY_PREFIX = "history#"
+# Entries of the Lake Formation permission -> RAM share index are stored under "index#<resource share arn>" and
+# queued in the same index under SHARE_INDEX_QUEUE_NAME, sorted by the time they were indexed, so they are read with
+# a query. Entries written before carry no queue and are not read, which rebuilds the index once. The time of the
+# last refreshes is stored under SHARE_INDEX_METADATA_KEY.
+SHARE_INDEX_QUEUE_NAME = "share-index"
+SHARE_INDEX_KEY_PREFIX = "index#"
+SHARE_INDEX_METADATA_KEY = "#share-index"
+# The sorted arns of the indexed resource shares with Lake Formation permissions are also stored on their own, in chunks
+# under "#share-index-arns#<chunk>", so runs with a recent index read them without the entries.
+SHARE_INDEX_ARNS_KEY_PREFIX = "#share-index-arns#"
+MAX_SHARE_INDEX_ARNS_PER_ITEM = 1000
+# Every queue is spread over QUEUE_PARTITION_COUNT partitions of the index, "<queue>#<partition>", so a large queue is not
+# a hot partition. The partition of an item is a stable hash of its key, and a queue is read from all of its partitions.
+QUEUE_PARTITION_COUNT = 4
+# A resource share that was not recreated for this long starts over with a cycle count of 1.
+HISTORY_TTL_IN_SECS = 7 * 24 * 60 * 60
+
+RETRY_BASE_DELAY_IN_SECS = 5 * 60
+RETRY_MAX_DELAY_IN_SECS = 6 * 60 * 60
+# Resource shares that keep failing are removed by the DDB TTL after this time, and need manual action.
+RETRY_TTL_IN_SECS = 7 * 24 * 60 * 60
+
+# BatchWriteItem and BatchGetItem limits.
+MAX_ITEMS_PER_BATCH_WRITE = 25
+MAX_KEYS_PER_BATCH_GET = 100
+MAX_UNPROCESSED_RETRIES = 5
+UNPROCESSED_BACKOFF_BASE_IN_SECS = 0.05
+
+
+def legacy_principals(item: dict) -> set[str]:
+    """
+    The principals of an item that was written before the retry queue, which holds a single
+    account id, or a JSON list of them.
+    """
+    value = item[LEGACY_PRINCIPALS_ATTRIBUTE]["S"]
+    try:
+        principals = json.loads(value)
+    except json.JSONDecodeError:
+        return {value}
+    # A single account id parses as a number, which drops its leading zeros.
+    return {str(principal) for principal in principals} if isinstance(principals, list) else {value}
+
+
+def queue_partition(queue_name: str, key: str) -> str:
+    """
+    The partition of the retry queue index that the item with the given key is stored in.
+    """
+    return f"{queue_name}#{zlib.crc32(key.encode('utf-8')) % QUEUE_PARTITION_COUNT}"
+
+
+def queue_partitions(queue_name: str) -> list[str]:
+    """
+    All partitions of a queue in the retry queue index.
+    """
+    return [f"{queue_name}#{partition}" for partition in range(QUEUE_PARTITION_COUNT)]
 
 
 class DdbManager:
     """
     Class that interacts with DDB by retrieving, updating, or saving Permissions for a RAM Share.
+    The DDB table is used as a retry queue: only the resource shares that are due for a retry are
+    read, and changes are buffered and written in batches.
     """
 
-    def __init__(self, ddb_client, table_name):
+    def __init__(self, ddb_client, table_name, resource_share_arn_prefix: Optional[str] = None):
         self.ddb_client = ddb_client
         self.ddb_table_name = table_name
+        # Only retry the resource shares with this prefix, like "arn:aws:ram:eu-west-1:123456789012:", when several targets share the table.
+        self.resource_share_arn_prefix = resource_share_arn_prefix
+        # Resource share arn -> item to write, or None to delete it.
+        self._pending_writes: dict[str, Optional[dict]] = {}
+        # Attempts and first failure time of the retry items that were read in this run.
+        self._retry_state: dict[str, tuple[int, int]] = {}
+        self._lock = threading.RLock()
+        instrumentation.instrument_client(ddb_client)
 
-    def get_previously_failed_accounts_for_resource_share(self) -> dict[str, str]:
+    def get_previously_failed_accounts_for_resource_share(self) -> dict[str, set[str]]:
         """
-        Get all permissions from the DDB table.
+        Get the principals that failed to be re-associated and are due for a retry, grouped by resource share arn.
         """
-        scan_paginator = self.ddb_client.get_paginator("scan")
-        permissions_from_ddb: dict[str, str] = {}
+        permissions_from_ddb: dict[str, set[str]] = dict(self.iter_previously_failed_accounts_for_resource_share())
 
-        for item_page in scan_paginator.paginate(TableName=self.ddb_table_name, Select="ALL_ATTRIBUTES"):
+        logger.info(f"Retrieved {len(permissions_from_ddb)} resource shares that are due for a retry from DDB")
+        return permissions_from_ddb
+
+    def iter_previously_failed_accounts_for_resource_share(self) -> Iterator[tuple[str, set[str]]]:
+        """
+        Yield the resource shares and principals that failed to be re-associated and are due for a
+        retry, one query page at a time.
+        """
+        for item in self._iter_due_items(RETRY_QUEUE_NAME, self.resource_share_arn_prefix):
+            resource_share_arn = item["resourceShareArn"]["S"]
+            with self._lock:
+                self._retry_state[resource_share_arn] = (int(item["attempts"]["N"]), int(item["first_failed_at"]["N"]))
+            yield resource_share_arn, set(item["principals"]["SS"])
+
+    def copy_legacy_items(self, source_table_name: str) -> int:
+        """
+        Write the items of the source table from before the retry queue into the retry queue of
+        this table, due straight away. The sparse retry queue index does not return them, so they
+        would never be retried otherwise. The source is the table of an earlier version of the
+        monitor, or this table. Returns the number of items.
+        """
+        now = int(time.time())
+        requests = []
+        scan_paginator = self.ddb_client.get_paginator("scan")
+        page_iterator = scan_paginator.paginate(
+            TableName=source_table_name,
+            FilterExpression="attribute_exists(resourceShareArn) AND attribute_exists(#principals) AND attribute_not_exists(#queue)",
+            ExpressionAttributeNames={"#principals": LEGACY_PRINCIPALS_ATTRIBUTE, "#queue": RETRY_QUEUE_ATTRIBUTE},
+        )
+        for item_page in instrumentation.timed_iter("ddb_load", page_iterator):
             for item in item_page["Items"]:
-                permissions_from_ddb[item["resourceShareArn"]["S"]] = json.loads(item["aws_account"]["S"])
+                retry_item = self._retry_item(item["resourceShareArn"]["S"], legacy_principals(item), 0, now, now)
+                retry_item["next_attempt_at"] = {"N": str(now)}
+                requests.append({"PutRequest": {"Item": retry_item}})
+        for i in range(0, len(requests), MAX_ITEMS_PER_BATCH_WRITE):
+            self._batch_write(requests[i : i + MAX_ITEMS_PER_BATCH_WRITE])
+        return len(requests)
 
-        logger.info(f"Retrieved {len(permissions_from_ddb)} accounts for shares from DDB: {permissions_from_ddb}")
-        return permissions_from_ddb
+    def _iter_due_items(self, queue_name: str, key_prefix: Optional[str] = None) -> Iterator[dict]:
+        """
+        Yield the items of a queue in the retry queue index that are due, oldest first, optionally
+        only the ones whose key starts with `key_prefix`.
+        """
+        now = int(time.time())
+        # The TTL can take a while to remove expired items.
+        filter_expression = "attribute_not_exists(expires_at) OR expires_at > :now"
+        expression_attribute_values = {":now": {"N": str(now)}}
+        if key_prefix is not None:
+            # AND takes precedence over OR.
+            filter_expression = "attribute_not_exists(expires_at) AND begins_with(resourceShareArn, :prefix) OR expires_at > :now AND begins_with(resourceShareArn, :prefix)"
+            expression_attribute_values[":prefix"] = {"S": key_prefix}
+        return self._iter_queue_items(queue_name, "#queue = :queue AND next_attempt_at <= :now", filter_expression, expression_attribute_values)
+
+    def _iter_queue_items(self, queue_name: str, key_condition_expression: str, filter_expression: Optional[str], expression_attribute_values: dict) -> Iterator[dict]:
+        """
+        Yield the items of a queue that match the expressions, from all of its partitions, ordered
+        by next_attempt_at. The partitions are paged through side by side.
+        """
+        query_paginator = self.ddb_client.get_paginator("query")
+        partition_items = []
+        for partition in queue_partitions(queue_name):
+            parameters = {
+                "TableName": self.ddb_table_name,
+                "IndexName": RETRY_QUEUE_INDEX,
+                "KeyConditionExpression": key_condition_expression,
+                "ExpressionAttributeNames": {"#queue": RETRY_QUEUE_ATTRIBUTE},
+                "ExpressionAttributeValues": {**expression_attribute_values, ":queue": {"S": partition}},
+            }
+            if filter_expression is not None:
+                parameters["FilterExpression"] = filter_expression
+            page_iterator = instrumentation.timed_iter("ddb_load", query_paginator.paginate(**parameters))
+            partition_items.append(item for item_page in page_iterator for item in item_page["Items"])
+        return heapq.merge(*partition_items, key=lambda item: int(item["next_attempt_at"]["N"]))
+
+    def get_next_due_at(self) -> Optional[int]:
+        """
+        Get the earliest time in epoch an item of the retry queue or of the pending invitations becomes due, if any.
+        """
+        now = int(time.time())
+        due_times = []
+        for partition in queue_partitions(RETRY_QUEUE_NAME) + queue_partitions(PENDING_QUEUE_NAME):
+            with instrumentation.phase("ddb_load"):
+                response = self.ddb_client.query(
+                    TableName=self.ddb_table_name,
+                    IndexName=RETRY_QUEUE_INDEX,
+                    KeyConditionExpression="#queue = :queue AND next_attempt_at > :now",
+                    ExpressionAttributeNames={"#queue": RETRY_QUEUE_ATTRIBUTE},
+                    ExpressionAttributeValues={":queue": {"S": partition}, ":now": {"N": str(now)}},
+                    Limit=1,
+                )
+            due_times.extend(int(item["next_attempt_at"]["N"]) for item in response["Items"])
+        return min(due_times) if due_times else None
+
+    def add_pending_invitations(self, invitations: dict[str, dict[str, int]], timeout_in_secs: int):
+        """
+        Queue invitations, grouped by key and then by principal with the time the invitation was
+        sent in epoch, until they reach the timeout. Invitations that are already queued for the
+        same key are kept. For a principal that is queued twice the latest time is kept, as a new
+        invitation restarts the timeout.
+        """
+        keys = sorted(invitations)
+        stored_items = self._batch_get_items([PENDING_KEY_PREFIX + key for key in keys])
+        requests = []
+        for key in keys:
+            merged = dict(invitations[key])
+            if PENDING_KEY_PREFIX + key in stored_items:
+                for principal, sent_at in json.loads(stored_items[PENDING_KEY_PREFIX + key]["invitations"]["S"]).items():
+                    merged[principal] = max(sent_at, merged.get(principal, sent_at))
+            requests.append({"PutRequest": {"Item": self._pending_item(key, merged, timeout_in_secs)}})
+
+        for i in range(0, len(requests), MAX_ITEMS_PER_BATCH_WRITE):
+            self._batch_write(requests[i : i + MAX_ITEMS_PER_BATCH_WRITE])
+        logger.info(f"Queued the invitations of {len(requests)} resource shares or principals")
+
+    @staticmethod
+    def _pending_item(key: str, invitations: dict[str, int], timeout_in_secs: int) -> dict:
+        """
+        A pending invitation item, due when its oldest invitation reaches the timeout.
+        """
+        due_at = min(invitations.values()) + timeout_in_secs
+        return {
+            "resourceShareArn": {"S": PENDING_KEY_PREFIX + key},
+            "invitations": {"S": json.dumps(invitations, sort_keys=True)},
+            RETRY_QUEUE_ATTRIBUTE: {"S": queue_partition(PENDING_QUEUE_NAME, PENDING_KEY_PREFIX + key)},
+            "next_attempt_at": {"N": str(due_at)},
+            "expires_at": {"N": str(due_at + RETRY_TTL_IN_SECS)},
+        }
+
+    def iter_due_pending_invitations(self) -> Iterator[tuple[str, dict[str, int]]]:
+        """
+        Yield the key and the invitations of every pending invitation item that reached the timeout.
+        """
+        for item in self._iter_due_items(PENDING_QUEUE_NAME):
+            yield item["resourceShareArn"]["S"][len(PENDING_KEY_PREFIX) :], json.loads(item["invitations"]["S"])
+
+    def complete_pending_invitations(self, keys: list[str], requeued: dict[str, dict[str, int]], timeout_in_secs: int):
+        """
+        Remove the pending invitation items that were processed, except for the invitations in
+        `requeued` that did not reach the timeout yet. Those replace the processed item of the same
+        key, or are merged into the items of other keys.
+        """
+        requests = [{"DeleteRequest": {"Key": {"resourceShareArn": {"S": PENDING_KEY_PREFIX + key}}}} for key in keys if key not in requeued]
+        requests.extend({"PutRequest": {"Item": self._pending_item(key, invitations, timeout_in_secs)}} for key, invitations in requeued.items() if key in keys)
+        for i in range(0, len(requests), MAX_ITEMS_PER_BATCH_WRITE):
+            self._batch_write(requests[i : i + MAX_ITEMS_PER_BATCH_WRITE])
+
+        merged = {key: invitations for key, invitations in requeued.items() if key not in keys}
+        if merged:
+            self.add_pending_invitations(merged, timeout_in_secs)
 
-    def add_resource_share_to_ddb(self, resource_share_arn: str, aws_account_id: str):
+    def iter_remediation_history(self, recreated_since: int = 0) -> Iterator[tuple[str, int, int]]:
         """
-        Add a resource share to the DDB table.
+        Yield the resource share arn, the time it was last recreated and its cycle count, of the
+        resource shares that were recreated since `recreated_since` in epoch, oldest first.
         """
-        try:
-            self.ddb_client.put_item(TableName=self.ddb_table_name, Item={"resourceShareArn": {"S": resource_share_arn}, "aws_account": {"S": aws_account_id}})
-        except self.ddb_client.meta.client.exceptions.InternalServerError as e:
-            logger.critical(f"Failed to put item in DDB to retry later! {resource_share_arn}. ")
-            raise e
+        now = int(time.time())
+        filter_expression = "expires_at > :now"
+        expression_attribute_values = {":since": {"N": str(recreated_since)}, ":now": {"N": str(now)}}
+        if self.resource_share_arn_prefix is not None:
+            filter_expression = "expires_at > :now AND begins_with(resourceShareArn, :prefix)"
+            expression_attribute_values[":prefix"] = {"S": HISTORY_KEY_PREFIX + self.resource_share_arn_prefix}
+        for item in self._iter_queue_items(HISTORY_QUEUE_NAME, "#queue = :queue AND next_attempt_at >= :since", filter_expression, expression_attribute_values):
+            yield item["resourceShareArn"]["S"][len(HISTORY_KEY_PREFIX) :], int(item["next_attempt_at"]["N"]), int(item["cycle_count"]["N"])
+
+    def save_remediation_history(self, entries: dict[str, tuple[int, int]]):
+        """
+        Save the time the resource shares were last recreated and their cycle count, keyed by resource share arn.
+        """
+        requests = [
+            {
+                "PutRequest": {
+                    "Item": {
+                        "resourceShareArn": {"S": HISTORY_KEY_PREFIX + resource_share_arn},
+                        RETRY_QUEUE_ATTRIBUTE: {"S": queue_partition(HISTORY_QUEUE_NAME, HISTORY_KEY_PREFIX + resource_share_arn)},
+                        "next_attempt_at": {"N": str(last_recreated_at)},
+                        "cycle_count": {"N": str(cycle_count)},
+                        "expires_at": {"N": str(last_recreated_at + HISTORY_TTL_IN_SECS)},
+                    }
+                }
+            }
+            for resource_share_arn, (last_recreated_at, cycle_count) in entries.items()
+        ]
+        for i in range(0, len(requests), MAX_ITEMS_PER_BATCH_WRITE):
+            self._batch_write(requests[i : i + MAX_ITEMS_PER_BATCH_WRITE])
+
+    def add_resource_share_to_ddb(self, resource_share_arn: str, aws_account_ids: set[str]):
+        """
+        Queue the principals that still need to be re-associated for a resource share for a retry.
+        Principals already stored for the resource share are kept, unless the resource share was
+        removed in this run.
+        """
+        now = int(time.time())
+        with self._lock:
+            attempts, first_failed_at = self._retry_state.get(resource_share_arn, (0, now))
+            pending = self._pending_writes.get(resource_share_arn)
+            if pending is not None:
+                pending["principals"].update(aws_account_ids)
+            else:
+                # Without a pending delete the item may exist with principals that are not due yet, which are merged on flush.
+                merge = resource_share_arn not in self._pending_writes
+                self._pending_writes[resource_share_arn] = {"principals": set(aws_account_ids), "attempts": attempts + 1, "first_failed_at": first_failed_at, "merge": merge}
+            self._flush_if_full()
 
     def remove_resource_share_from_ddb(self, resource_share_arn: str):
         """
-        Remove the resource share from the DDB table.
+        Remove the resource share from the retry queue.
+        """
+        with self._lock:
+            self._pending_writes[resource_share_arn] = None
+            self._flush_if_full()
+
+    def _flush_if_full(self):
+        """
+        Write the buffered changes once they fill a batch.
+        """
+        if len(self._pending_writes) >= MAX_ITEMS_PER_BATCH_WRITE:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered changes to the retry queue with BatchWriteItem.
+        """
+        with self._lock:
+            pending_writes = self._pending_writes
+            self._pending_writes = {}
+            if not pending_writes:
+                return
+
+            stored_items = self._batch_get_items([resource_share_arn for resource_share_arn, pending in pending_writes.items() if pending is not None and pending["merge"]])
+            now = int(time.time())
+            requests = []
+            for resource_share_arn, pending in pending_writes.items():
+                if pending is None:
+                    requests.append({"DeleteRequest": {"Key": {"resourceShareArn": {"S": resource_share_arn}}}})
+                    continue
+                principals, attempts, first_failed_at = pending["principals"], pending["attempts"], pending["first_failed_at"]
+                if resource_share_arn in stored_items:
+                    stored_item = stored_items[resource_share_arn]
+                    principals = principals | set(stored_item["principals"]["SS"])
+                    attempts = max(attempts, int(stored_item["attempts"]["N"]) + 1)
+                    first_failed_at = min(first_failed_at, int(stored_item["first_failed_at"]["N"]))
+                requests.append({"PutRequest": {"Item": self._retry_item(resource_share_arn, principals, attempts, first_failed_at, now)}})
+
+            for i in range(0, len(requests), MAX_ITEMS_PER_BATCH_WRITE):
+                self._batch_write(requests[i : i + MAX_ITEMS_PER_BATCH_WRITE])
+
+    @staticmethod
+    def _retry_item(resource_share_arn: str, aws_account_ids: set[str], attempts: int, first_failed_at: int, now: int) -> dict:
+        """
+        A retry queue item. The next attempt is pushed back exponentially with the number of attempts.
+        """
+        delay = min(RETRY_MAX_DELAY_IN_SECS, RETRY_BASE_DELAY_IN_SECS * 2 ** (attempts - 1))
+        return {
+            "resourceShareArn": {"S": resource_share_arn},
+            "principals": {"SS": sorted(aws_account_ids)},
+            RETRY_QUEUE_ATTRIBUTE: {"S": queue_partition(RETRY_QUEUE_NAME, resource_share_arn)},
+            "attempts": {"N": str(attempts)},
+            "first_failed_at": {"N": str(first_failed_at)},
+            "next_attempt_at": {"N": str(now + delay)},
+            "expires_at": {"N": str(first_failed_at + RETRY_TTL_IN_SECS)},
+        }
+
+    def _batch_write(self, requests: list[dict]):
+        """
+        Call BatchWriteItem and retry the unprocessed items with an exponential backoff.
+        """
+        request_items = {self.ddb_table_name: requests}
+        instrumentation.increment("ddb_items_written", len(requests))
+        for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+            try:
+                with instrumentation.phase("persistence"):
+                    response = self.ddb_client.batch_write_item(RequestItems=request_items)
+            except self.ddb_client.exceptions.InternalServerError as e:
+                logger.critical(f"Failed to write {len(requests)} items in DDB to retry later! {self._request_keys(requests)}")
+                raise e
+            request_items = response.get("UnprocessedItems", {})
+            if not request_items:
+                return
+            time.sleep(UNPROCESSED_BACKOFF_BASE_IN_SECS * 2**attempt)
+
+        logger.critical(f"Failed to write items in DDB to retry later! {self._request_keys(request_items[self.ddb_table_name])}")
+        raise RuntimeError(f"DDB did not process {len(request_items[self.ddb_table_name])} items after {MAX_UNPROCESSED_RETRIES} retries")
+
+    def _batch_get_items(self, resource_share_arns: list[str]) -> dict[str, dict]:
+        """
+        Get the stored items of the given resource shares with BatchGetItem.
+        """
+        items: dict[str, dict] = {}
+        for i in range(0, len(resource_share_arns), MAX_KEYS_PER_BATCH_GET):
+            request_items = {self.ddb_table_name: {"Keys": [{"resourceShareArn": {"S": resource_share_arn}} for resource_share_arn in resource_share_arns[i : i + MAX_KEYS_PER_BATCH_GET]], "ConsistentRead": True}}
+            for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+                with instrumentation.phase("ddb_load"):
+                    response = self.ddb_client.batch_get_item(RequestItems=request_items)
+                for item in response["Responses"].get(self.ddb_table_name, []):
+                    if RETRY_QUEUE_ATTRIBUTE in item:
+                        items[item["resourceShareArn"]["S"]] = item
+                request_items = response.get("UnprocessedKeys", {})
+                if not request_items:
+                    break
+                time.sleep(UNPROCESSED_BACKOFF_BASE_IN_SECS * 2**attempt)
+            else:
+                raise RuntimeError(f"DDB did not return {len(request_items[self.ddb_table_name]['Keys'])} items after {MAX_UNPROCESSED_RETRIES} retries")
+        return items
+
+    @staticmethod
+    def _request_keys(requests: list[dict]) -> list[str]:
+        """
+        The resource share arns of BatchWriteItem requests, for logging.
+        """
+        return [(request["PutRequest"]["Item"] if "PutRequest" in request else request["DeleteRequest"]["Key"])["resourceShareArn"]["S"] for request in requests]
+
+    def get_checkpoint(self) -> Optional[dict]:
+        """
+        Get the continuation cursor and pending resource shares of an unfinished run, if any.
+        """
+        with instrumentation.phase("ddb_load"):
+            item = self.ddb_client.get_item(TableName=self.ddb_table_name, Key={"resourceShareArn": {"S": CHECKPOINT_KEY}}, ConsistentRead=True).get("Item")
+        if item is None:
+            return None
+        checkpoint = json.loads(item["checkpoint"]["S"])
+        logger.info(f"Resuming from checkpoint with {len(checkpoint['pending'])} pending shares, saved at {item['updated_at']['N']}")
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: dict):
+        """
+        Save the continuation cursor and the resource shares that were read but not remediated yet.
+        """
+        with instrumentation.phase("persistence"):
+            self.ddb_client.put_item(TableName=self.ddb_table_name, Item={"resourceShareArn": {"S": CHECKPOINT_KEY}, "checkpoint": {"S": json.dumps(checkpoint)}, "updated_at": {"N": str(int(time.time()))}})
+        logger.info(f"Saved checkpoint with {len(checkpoint['pending'])} pending shares")
+
+    def remove_checkpoint(self):
+        """
+        Remove the checkpoint once a run has gone through all RAM pages.
+        """
+        with instrumentation.phase("persistence"):
+            self.ddb_client.delete_item(TableName=self.ddb_table_name, Key={"resourceShareArn": {"S": CHECKPOINT_KEY}})
+
+    def get_share_index(self) -> tuple[dict[str, dict], dict]:
         """
-        try:
-            self.ddb_client.delete_item(TableName=self.ddb_table_name, Key={"resourceShareArn": {"S": resource_share_arn}})
-        except self.ddb_client.exceptions.ResourceNotFoundException:
-            # Ignore this error because it would be called from removing DDB item.
-            logger.info(f"DDB Failed to find item for {resource_share_arn}. Ignoring.")
+        Get the entries of the share index, keyed by resource share arn, and the index metadata.
+        """
+        entries: dict[str, dict] = {}
+        for item in self._iter_queue_items(SHARE_INDEX_QUEUE_NAME, "#queue = :queue", None, {}):
+            entries[item["resourceShareArn"]["S"][len(SHARE_INDEX_KEY_PREFIX) :]] = {
+                "principals": set(item["principals"]["SS"]) if "principals" in item else set(),
+                "resources": json.loads(item["resources"]["S"]),
+                "share_updated_at": float(item["share_updated_at"]["N"]),
+                "indexed_at": int(item["indexed_at"]["N"]),
+            }
+
+        metadata = self.get_share_index_metadata()
+        logger.info(f"Retrieved {len(entries)} share index entries from DDB")
+        return entries, metadata
+
+    def get_share_index_metadata(self) -> dict:
+        """
+        Get the metadata of the share index, empty when there is no index yet.
+        """
+        with instrumentation.phase("ddb_load"):
+            item = self.ddb_client.get_item(TableName=self.ddb_table_name, Key={"resourceShareArn": {"S": SHARE_INDEX_METADATA_KEY}}, ConsistentRead=True).get("Item")
+        return json.loads(item["metadata"]["S"]) if item is not None else {}
+
+    def get_share_index_arns(self, metadata: dict) -> Optional[list[str]]:
+        """
+        Get the sorted arns of the indexed resource shares with Lake Formation permissions, or None
+        when the index was saved without them.
+        """
+        if "arn_chunk_count" not in metadata:
+            return None
+        resource_share_arns: list[str] = []
+        for chunk in range(metadata["arn_chunk_count"]):
+            with instrumentation.phase("ddb_load"):
+                item = self.ddb_client.get_item(TableName=self.ddb_table_name, Key={"resourceShareArn": {"S": f"{SHARE_INDEX_ARNS_KEY_PREFIX}{chunk}"}}, ConsistentRead=True).get("Item")
+            if item is None:
+                return None
+            resource_share_arns.extend(item["resource_share_arns"]["SS"])
+        logger.info(f"Retrieved the arns of {len(resource_share_arns)} indexed resource shares from DDB")
+        return sorted(resource_share_arns)
+
+    def save_share_index(self, entries: dict[str, dict], removed_resource_share_arns: Iterable[str], metadata: dict, resource_share_arns: Optional[list[str]] = None):
+        """
+        Write the changed entries of the share index, delete the removed ones and save the metadata.
+        The arns of the resource shares with Lake Formation permissions replace the stored ones when
+        they are given.
+        """
+        requests = []
+        for resource_share_arn, entry in entries.items():
+            item = {
+                "resourceShareArn": {"S": SHARE_INDEX_KEY_PREFIX + resource_share_arn},
+                RETRY_QUEUE_ATTRIBUTE: {"S": queue_partition(SHARE_INDEX_QUEUE_NAME, SHARE_INDEX_KEY_PREFIX + resource_share_arn)},
+                "next_attempt_at": {"N": str(entry["indexed_at"])},
+                "resources": {"S": json.dumps(entry["resources"], sort_keys=True)},
+                "share_updated_at": {"N": str(entry["share_updated_at"])},
+                "indexed_at": {"N": str(entry["indexed_at"])},
+            }
+            # String sets can not be empty.
+            if entry["principals"]:
+                item["principals"] = {"SS": sorted(entry["principals"])}
+            requests.append({"PutRequest": {"Item": item}})
+        requests.extend({"DeleteRequest": {"Key": {"resourceShareArn": {"S": SHARE_INDEX_KEY_PREFIX + resource_share_arn}}}} for resource_share_arn in removed_resource_share_arns)
+        if resource_share_arns is not None:
+            chunks = [resource_share_arns[i : i + MAX_SHARE_INDEX_ARNS_PER_ITEM] for i in range(0, len(resource_share_arns), MAX_SHARE_INDEX_ARNS_PER_ITEM)]
+            # String sets can not be empty, no arns are stored as no chunks.
+            requests.extend({"PutRequest": {"Item": {"resourceShareArn": {"S": f"{SHARE_INDEX_ARNS_KEY_PREFIX}{chunk}"}, "resource_share_arns": {"SS": arns}}}} for chunk, arns in enumerate(chunks))
+            requests.extend({"DeleteRequest": {"Key": {"resourceShareArn": {"S": f"{SHARE_INDEX_ARNS_KEY_PREFIX}{chunk}"}}}} for chunk in range(len(chunks), metadata.get("arn_chunk_count", 0)))
+            metadata["arn_chunk_count"] = len(chunks)
+
+        for i in range(0, len(requests), MAX_ITEMS_PER_BATCH_WRITE):
+            self._batch_write(requests[i : i + MAX_ITEMS_PER_BATCH_WRITE])
+        self.ddb_client.put_item(TableName=self.ddb_table_name, Item={"resourceShareArn": {"S": SHARE_INDEX_METADATA_KEY}, "metadata": {"S": json.dumps(metadata)}})
+        logger.info(f"Saved {len(entries)} share index entries")
@@ -0,0 +1,267 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module spreads the remediation of expired RAM shares over several invocations of the same
+Lambda function. A coordinator enumerates the expired shares and partitions them into shards by
+hashing the resource share arn, so a share always lands on the same shard. Batches of a shard are
+sent to worker invocations one after the other, while different shards run in parallel. The next
+batch of a shard is only submitted to the pool once the previous one is done, so no pool thread
+sits waiting on another batch. How a
+batch reaches a worker is up to the dispatcher, which makes it possible to run everything
+in-process.
+"""
+
+import json
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+DEFAULT_MAX_SHARES_PER_INVOCATION = 1000
+
+
+def shard_for(resource_share_arn: str, shard_count: int) -> int:
+    """
+    Returns the shard of a resource share. The hash is stable across invocations and Python processes.
+    """
+    return zlib.crc32(resource_share_arn.encode("utf-8")) % shard_count
+
+
+class LambdaShardDispatcher:  # pylint: disable=too-few-public-methods
+    """
+    Sends a batch of shares to a synchronous invocation of the given Lambda function.
+    """
+
+    def __init__(self, lambda_client, function_name: str):
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+
+    def dispatch(self, worker_event: dict) -> dict:
+        """
+        Invoke a worker and return its response.
+        """
+        response = self.lambda_client.invoke(FunctionName=self.function_name, InvocationType="RequestResponse", Payload=json.dumps(worker_event))
+        payload = json.loads(response["Payload"].read())
+        if "FunctionError" in response:
+            raise RuntimeError(f"Worker invocation failed: {payload}")
+        return payload
+
+
+class LocalShardDispatcher:  # pylint: disable=too-few-public-methods
+    """
+    Runs a batch of shares by calling the handler in-process. Used when there is no concurrency
+    left for workers, and as a stand-in for Lambda in tests.
+    """
+
+    def __init__(self, handler: Callable[[dict, object], dict], context=None):
+        self.handler = handler
+        self.context = context
+
+    def dispatch(self, worker_event: dict) -> dict:
+        """
+        Call the handler and return its response.
+        """
+        return self.handler(json.loads(json.dumps(worker_event)), self.context)
+
+
+class ShardResult:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Aggregated counts of all worker invocations of a single shard.
+    """
+
+    def __init__(self, shard: int):
+        self.shard = shard
+        self.invocation_count = 0
+        self.share_count = 0
+        self.recreated_count = 0
+        self.failed_count = 0
+        # Counts of the verification phases of the workers.
+        self.verified_count = 0
+        self.pending_count = 0
+        self.verification_failed_count = 0
+        self.unprocessed_shares: list[tuple[str, set[str]]] = []
+
+    def as_dict(self) -> dict:
+        """
+        The shard result as it is reported in the handler response.
+        """
+        return {
+            "shard": self.shard,
+            "invocation_count": self.invocation_count,
+            "share_count": self.share_count,
+            "recreated_count": self.recreated_count,
+            "failed_count": self.failed_count,
+            "verified_count": self.verified_count,
+            "pending_count": self.pending_count,
+            "verification_failed_count": self.verification_failed_count,
+            "unprocessed_count": len(self.unprocessed_shares),
+        }
+
+
+class ShardCoordinator:  # pylint: disable=too-many-instance-attributes
+    """
+    Partitions a stream of expired shares into shards and hands them to workers through a dispatcher.
+    """
+
+    def __init__(self, dispatcher, shard_count: int, max_parallel_workers: int, max_shares_per_invocation: int = DEFAULT_MAX_SHARES_PER_INVOCATION, *, batch_event: Optional[Callable[[list], dict]] = None):  # pylint: disable=too-many-arguments
+        self.dispatcher = dispatcher
+        # Adds the fields of a single batch to the worker event.
+        self.batch_event = batch_event
+        self.shard_count = max(1, shard_count)
+        self.max_parallel_workers = max(1, max_parallel_workers)
+        self.max_shares_per_invocation = max(1, max_shares_per_invocation)
+        self.stopped_early = False
+        self.results = [ShardResult(shard) for shard in range(self.shard_count)]
+        # Batches of a shard that wait for the running batch of the same shard.
+        self._pending_batches: dict[int, deque] = defaultdict(deque)
+        self._running_shards: set[int] = set()
+        self._outstanding_batches = 0
+        self._lock = threading.Lock()
+        self._all_batches_done = threading.Condition(self._lock)
+        # Limits the batches waiting for a worker, so the stream is not read ahead into memory.
+        self._queued_batches = threading.BoundedSemaphore(2 * self.max_parallel_workers)
+
+    @property
+    def recreated_count(self) -> int:
+        """
+        Invitations recreated by all workers.
+        """
+        return sum(result.recreated_count for result in self.results)
+
+    @property
+    def failed_count(self) -> int:
+        """
+        Invitations that failed in all workers, including batches that could not be dispatched.
+        """
+        return sum(result.failed_count for result in self.results)
+
+    @property
+    def verification(self) -> dict:
+        """
+        Verification counts of all workers.
+        """
+        return {
+            "verified_count": sum(result.verified_count for result in self.results),
+            "pending_count": sum(result.pending_count for result in self.results),
+            "failed_count": sum(result.verification_failed_count for result in self.results),
+        }
+
+    @property
+    def share_count(self) -> int:
+        """
+        Resource shares that were sent to workers.
+        """
+        return sum(result.share_count for result in self.results)
+
+    @property
+    def unprocessed_shares(self) -> list[tuple[str, set[str]]]:
+        """
+        Shares that workers did not get to before their deadline.
+        """
+        return [share for result in self.results for share in result.unprocessed_shares]
+
+    def run(self, expired_ram_shares: Iterable[tuple[str, set[str], bool]], worker_event: dict, should_stop: Optional[Callable[[], bool]] = None):
+        """
+        Dispatch every expired share to the worker of its shard, and wait for all workers.
+        """
+        logger.info(f"Fanning out over {self.shard_count} shards with up to {self.max_parallel_workers} parallel workers")
+        buffers: dict[int, list] = {shard: [] for shard in range(self.shard_count)}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel_workers, thread_name_prefix="shard-dispatch") as executor:
+            expired_ram_shares_iterator = iter(expired_ram_shares)
+            while True:
+                # Check before taking the next share, so a share is never taken from the stream and then dropped.
+                if should_stop is not None and should_stop():
+                    self.stopped_early = True
+                    logger.info("Stopping early, no new RAM shares will be dispatched in this run")
+                    break
+                try:
+                    resource_share_arn, aws_account_ids, previously_failed = next(expired_ram_shares_iterator)
+                except StopIteration:
+                    break
+                shard = shard_for(resource_share_arn, self.shard_count)
+                buffers[shard].append([resource_share_arn, sorted(aws_account_ids), previously_failed])
+                if len(buffers[shard]) >= self.max_shares_per_invocation:
+                    self._submit(executor, shard, buffers[shard], worker_event)
+                    buffers[shard] = []
+
+            for shard, shares in buffers.items():
+                if shares:
+                    self._submit(executor, shard, shares, worker_event)
+
+            # Batches are chained from done callbacks, so the pool has to stay open until the last one is done.
+            with self._all_batches_done:
+                self._all_batches_done.wait_for(lambda: self._outstanding_batches == 0)
+
+    def _submit(self, executor: ThreadPoolExecutor, shard: int, shares: list, worker_event: dict):
+        """
+        Queue a batch for a shard. Batches of the same shard never run at the same time.
+        """
+        self._queued_batches.acquire()  # pylint: disable=consider-using-with
+        with self._lock:
+            self._outstanding_batches = self._outstanding_batches + 1
+            if shard in self._running_shards:
+                self._pending_batches[shard].append((shares, worker_event))
+                return
+            self._running_shards.add(shard)
+        self._start_batch(executor, shard, shares, worker_event)
+
+    def _start_batch(self, executor: ThreadPoolExecutor, shard: int, shares: list, worker_event: dict):
+        """
+        Submit a batch to the pool, and chain the next batch of the shard once it is done.
+        """
+        future = executor.submit(self._dispatch_batch, shard, shares, worker_event)
+        future.add_done_callback(lambda _future: self._batch_done(executor, shard))
+
+    def _batch_done(self, executor: ThreadPoolExecutor, shard: int):
+        """
+        Submit the next pending batch of the shard, or mark the shard as idle.
+        """
+        self._queued_batches.release()
+        with self._lock:
+            self._outstanding_batches = self._outstanding_batches - 1
+            if not self._pending_batches[shard]:
+                self._running_shards.discard(shard)
+                self._all_batches_done.notify_all()
+                return
+            shares, worker_event = self._pending_batches[shard].popleft()
+        self._start_batch(executor, shard, shares, worker_event)
+
+    def _dispatch_batch(self, shard: int, shares: list, worker_event: dict):
+        """
+        Send a single batch to a worker and add its counts to the shard result.
+        """
+        result = self.results[shard]
+        started_at = time.monotonic()
+        try:
+            batch_event = self.batch_event(shares) if self.batch_event is not None else {}
+            response = self.dispatcher.dispatch({**worker_event, **batch_event, "mode": "worker", "shard": shard, "shares": shares})
+            unprocessed_shares = [(resource_share_arn, set(aws_account_ids)) for resource_share_arn, aws_account_ids, _previously_failed in response.get("unprocessed_shares", [])]
+            recreated_count = int(response.get("recreated_count", 0))
+            failed_count = int(response.get("failed_count", 0))
+            verification = response.get("verification", {})
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Failed to dispatch {len(shares)} shares of shard {shard}: {e}")
+            # Nothing is known about what the worker did, so the whole batch has to be retried.
+            unprocessed_shares = [(resource_share_arn, set(aws_account_ids)) for resource_share_arn, aws_account_ids, _previously_failed in shares]
+            recreated_count = 0
+            failed_count = sum(len(aws_account_ids) for _resource_share_arn, aws_account_ids, _previously_failed in shares)
+            verification = {}
+
+        with self._lock:
+            result.invocation_count = result.invocation_count + 1
+            result.share_count = result.share_count + len(shares)
+            result.recreated_count = result.recreated_count + recreated_count
+            result.failed_count = result.failed_count + failed_count
+            result.verified_count = result.verified_count + int(verification.get("verified_count", 0))
+            result.pending_count = result.pending_count + int(verification.get("pending_count", 0))
+            result.verification_failed_count = result.verification_failed_count + int(verification.get("failed_count", 0))
+            result.unprocessed_shares.extend(unprocessed_shares)
+        logger.info(f"Shard {shard} processed {len(shares)} shares in {time.monotonic() - started_at:.2f} seconds")
@@ -0,0 +1,277 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module collects the numbers that are needed to size the memory, timeout and concurrency of
+the function: the time spent in each phase of a run, and the count, latency, throttles and
+retries of every AWS API operation, taken from botocore event hooks. They are added to the
+handler response and emitted as CloudWatch embedded metric format (EMF) metrics. A run can also
+be profiled with cProfile.
+"""
+
+import contextlib
+import io
+import random
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import EphemeralMetrics, MetricUnit
+
+from lf_stale_ram_invite_monitor.remediation_engine import THROTTLING_ERROR_CODES
+
+logger = Logger()
+
+METRICS_NAMESPACE = "LfStaleRamInviteMonitor"
+# Upper bounds of the API latency histogram buckets, the last bucket takes everything above.
+LATENCY_BUCKETS_IN_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# EMF takes up to 100 values per metric, the latency samples of an operation are a random sample of its calls.
+LATENCY_SAMPLE_SIZE = 100
+# Keys that are put in the request context of botocore calls.
+OPERATION_CONTEXT_KEY = "lf_stale_ram_invite_monitor_operation"
+STARTED_AT_CONTEXT_KEY = "lf_stale_ram_invite_monitor_started_at"
+DEFAULT_PROFILE_PATH = "/tmp/lf_stale_ram_invite_monitor.prof"  # nosec B108
+DEFAULT_PROFILE_TOP = 25
+
+
+class OperationStats:  # pylint: disable=too-many-instance-attributes
+    """
+    Counts, latency histogram and latency samples of a single API operation.
+    """
+
+    def __init__(self):
+        self.call_count = 0
+        self.error_count = 0
+        self.throttled_count = 0
+        self.retry_count = 0
+        self.total_latency_in_ms = 0.0
+        self.max_latency_in_ms = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_IN_MS) + 1)
+        self.latency_samples_in_ms: list[float] = []
+
+    def record(self, latency_in_ms: float, error_code: Optional[str] = None, retry_count: int = 0):
+        """
+        Record a call. The latency includes the retries botocore made.
+        """
+        self.call_count = self.call_count + 1
+        self.retry_count = self.retry_count + retry_count
+        if error_code is not None:
+            self.error_count = self.error_count + 1
+            if error_code in THROTTLING_ERROR_CODES:
+                self.throttled_count = self.throttled_count + 1
+        self.total_latency_in_ms = self.total_latency_in_ms + latency_in_ms
+        self.max_latency_in_ms = max(self.max_latency_in_ms, latency_in_ms)
+        bucket = next((index for index, upper_bound in enumerate(LATENCY_BUCKETS_IN_MS) if latency_in_ms <= upper_bound), len(LATENCY_BUCKETS_IN_MS))
+        self.latency_buckets[bucket] = self.latency_buckets[bucket] + 1
+        # Reservoir sampling, every call has the same chance to be in the samples.
+        if len(self.latency_samples_in_ms) < LATENCY_SAMPLE_SIZE:
+            self.latency_samples_in_ms.append(latency_in_ms)
+        else:
+            index = random.randrange(self.call_count)  # nosec B311
+            if index < LATENCY_SAMPLE_SIZE:
+                self.latency_samples_in_ms[index] = latency_in_ms
+
+    @property
+    def average_latency_in_ms(self) -> float:
+        """
+        Average latency of the calls.
+        """
+        return self.total_latency_in_ms / self.call_count if self.call_count else 0.0
+
+    def as_dict(self) -> dict:
+        """
+        The stats as they are reported in the handler response. Empty histogram buckets are left out.
+        """
+        bucket_names = [f"<={upper_bound}" for upper_bound in LATENCY_BUCKETS_IN_MS] + [f">{LATENCY_BUCKETS_IN_MS[-1]}"]
+        return {
+            "calls": self.call_count,
+            "errors": self.error_count,
+            "throttled": self.throttled_count,
+            "retries": self.retry_count,
+            "average_latency_in_ms": round(self.average_latency_in_ms, 1),
+            "max_latency_in_ms": round(self.max_latency_in_ms, 1),
+            "latency_histogram_in_ms": {name: count for name, count in zip(bucket_names, self.latency_buckets) if count},
+        }
+
+
+class Instrumentation:
+    """
+    Phase timings, counters and API call stats of a single run. Like the logger, a single instance
+    is shared by all modules, and it is reset at the start of every invocation.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.phases: dict[str, float] = {}
+        self.counters: dict[str, int] = {}
+        self.operations: dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Start a new run.
+        """
+        with self._lock:
+            self.started_at = time.monotonic()
+            self.phases = {}
+            self.counters = {}
+            self.operations = {}
+
+    def add_phase_time(self, phase: str, elapsed_in_secs: float):
+        """
+        Add time to a phase. Phases are timed on every thread that works on them, so they can add up to more than the run.
+        """
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + elapsed_in_secs
+
+    @contextlib.contextmanager
+    def phase(self, phase: str):
+        """
+        Time the block as part of the phase.
+        """
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase_time(phase, time.monotonic() - started_at)
+
+    def timed_iter(self, phase: str, iterable: Iterable) -> Iterator:
+        """
+        Iterate over `iterable`, timing the time spent waiting for each item as part of the phase.
+        """
+        iterator = iter(iterable)
+        while True:
+            started_at = time.monotonic()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_phase_time(phase, time.monotonic() - started_at)
+                return
+            self.add_phase_time(phase, time.monotonic() - started_at)
+            yield item
+
+    def increment(self, counter: str, count: int = 1):
+        """
+        Add to a counter, like the number of RAM pages fetched.
+        """
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def record_call(self, operation: str, latency_in_ms: float, error_code: Optional[str] = None, retry_count: int = 0):
+        """
+        Record an API call of an operation, like "ram.AssociateResourceShare".
+        """
+        with self._lock:
+            if operation not in self.operations:
+                self.operations[operation] = OperationStats()
+            self.operations[operation].record(latency_in_ms, error_code, retry_count)
+
+    def instrument_client(self, client):
+        """
+        Register the hooks that record every API call of a boto3 client. Registering the same client again has no effect.
+        """
+        events = getattr(getattr(client, "meta", None), "events", None)
+        if events is None:
+            return
+        events.register("before-call", self._before_call, unique_id="lf-stale-ram-invite-monitor-before-call")
+        events.register("after-call", self._after_call, unique_id="lf-stale-ram-invite-monitor-after-call")
+        events.register("after-call-error", self._after_call_error, unique_id="lf-stale-ram-invite-monitor-after-call-error")
+
+    def _before_call(self, event_name: str, model, context: dict, **_kwargs):
+        """
+        Remember the operation and the start of a call in its request context.
+        """
+        context[OPERATION_CONTEXT_KEY] = f"{event_name.split('.')[1]}.{model.name}"
+        context[STARTED_AT_CONTEXT_KEY] = time.monotonic()
+
+    def _after_call(self, parsed: dict, context: dict, **_kwargs):
+        """
+        Record a call that got a response, including error responses.
+        """
+        if STARTED_AT_CONTEXT_KEY not in context:
+            return
+        metadata = parsed.get("ResponseMetadata", {}) if isinstance(parsed, dict) else {}
+        error_code = parsed.get("Error", {}).get("Code") if isinstance(parsed, dict) else None
+        self.record_call(context[OPERATION_CONTEXT_KEY], (time.monotonic() - context[STARTED_AT_CONTEXT_KEY]) * 1000, error_code, int(metadata.get("RetryAttempts", 0)))
+
+    def _after_call_error(self, context: dict, exception: Exception, **_kwargs):
+        """
+        Record a call that did not get a response, like a connection error.
+        """
+        if STARTED_AT_CONTEXT_KEY not in context:
+            return
+        self.record_call(context[OPERATION_CONTEXT_KEY], (time.monotonic() - context[STARTED_AT_CONTEXT_KEY]) * 1000, type(exception).__name__)
+
+    def as_dict(self) -> dict:
+        """
+        The instrumentation as it is reported in the handler response.
+        """
+        with self._lock:
+            elapsed_in_secs = time.monotonic() - self.started_at
+            pages_fetched = self.counters.get("pages_fetched", 0)
+            shares_processed = self.counters.get("shares_processed", 0)
+            return {
+                "elapsed_in_secs": round(elapsed_in_secs, 3),
+                "phases_in_secs": {phase: round(elapsed, 3) for phase, elapsed in sorted(self.phases.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "pages_per_second": round(pages_fetched / elapsed_in_secs, 2) if elapsed_in_secs > 0 else 0.0,
+                "shares_per_second": round(shares_processed / elapsed_in_secs, 2) if elapsed_in_secs > 0 else 0.0,
+                "api_calls": {operation: stats.as_dict() for operation, stats in sorted(self.operations.items())},
+            }
+
+    def add_metrics(self, metrics):
+        """
+        Add the phase timings and counters to the Powertools metrics of the invocation, and flush
+        the stats of every API operation as metrics with an Operation dimension. The latency samples
+        of an operation are all added to its ApiLatency metric, so CloudWatch can compute its percentiles.
+        """
+        report = self.as_dict()
+        for phase, elapsed_in_secs in report["phases_in_secs"].items():
+            metrics.add_metric(name=f"{phase.title().replace('_', '')}Duration", unit=MetricUnit.Seconds, value=elapsed_in_secs)
+        for counter, count in report["counters"].items():
+            metrics.add_metric(name=counter.title().replace("_", ""), unit=MetricUnit.Count, value=count)
+        metrics.add_metric(name="PagesPerSecond", unit=MetricUnit.CountPerSecond, value=report["pages_per_second"])
+        metrics.add_metric(name="SharesPerSecond", unit=MetricUnit.CountPerSecond, value=report["shares_per_second"])
+
+        with self._lock:
+            operations = [(operation, stats, list(stats.latency_samples_in_ms)) for operation, stats in self.operations.items()]
+        for operation, stats, latency_samples_in_ms in operations:
+            operation_metrics = EphemeralMetrics(namespace=metrics.namespace, service=metrics.service)
+            operation_metrics.add_dimension(name="Operation", value=operation)
+            # Powertools flushes a metric once it has 100 values, the samples come first so the last flush is never empty.
+            for latency_in_ms in latency_samples_in_ms:
+                operation_metrics.add_metric(name="ApiLatency", unit=MetricUnit.Milliseconds, value=latency_in_ms)
+            operation_metrics.add_metric(name="ApiCalls", unit=MetricUnit.Count, value=stats.call_count)
+            operation_metrics.add_metric(name="ApiErrors", unit=MetricUnit.Count, value=stats.error_count)
+            operation_metrics.add_metric(name="ApiThrottles", unit=MetricUnit.Count, value=stats.throttled_count)
+            operation_metrics.add_metric(name="ApiRetries", unit=MetricUnit.Count, value=stats.retry_count)
+            operation_metrics.add_metric(name="ApiAverageLatency", unit=MetricUnit.Milliseconds, value=stats.average_latency_in_ms)
+            operation_metrics.add_metric(name="ApiMaxLatency", unit=MetricUnit.Milliseconds, value=stats.max_latency_in_ms)
+            operation_metrics.flush_metrics()
+
+
+# Shared by all modules, see Instrumentation.
+instrumentation = Instrumentation()
+
+
+@contextlib.contextmanager
+def profiled(path: str = DEFAULT_PROFILE_PATH, top: int = DEFAULT_PROFILE_TOP):
+    """
+    Profile the block with cProfile, save the stats to `path` and log the functions with the most
+    cumulative time. Only the calling thread is profiled, the time of the worker threads shows up
+    in the API call stats.
+    """
+    import cProfile  # pylint: disable=import-outside-toplevel
+    import pstats  # pylint: disable=import-outside-toplevel
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(top)
+        logger.info(f"Saved the profile of the run to {path}\n{output.getvalue()}")
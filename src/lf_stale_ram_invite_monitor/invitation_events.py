@@ -0,0 +1,172 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module turns the CloudTrail events of RAM and Lake Formation, as EventBridge delivers them,
+into pending invitations, and streams the pending invitations that reached the timeout. In the
+incremental mode the function queues the invitations as they are sent, and only looks up the
+ones that are due, instead of paging through every association of the account on every run.
+"""
+
+import datetime
+from typing import Iterator, Optional
+
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor.invitation_log import invitation_log
+from lf_stale_ram_invite_monitor.lf_permission_fixer import get_account_id
+from lf_stale_ram_invite_monitor.ram_manager import LAKE_FORMATION_SHARE_PREFIX, RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL, RamManager
+
+logger = Logger()
+
+CLOUDTRAIL_DETAIL_TYPE = "AWS API Call via CloudTrail"
+# Lake Formation grants do not name the resource share, their invitations are queued by principal.
+PRINCIPAL_KEY_PREFIX = "principal#"
+
+
+def parse_time(event_time: str) -> int:
+    """
+    The epoch of a CloudTrail event time, like 2024-05-01T10:00:00Z.
+    """
+    return int(datetime.datetime.fromisoformat(event_time.replace("Z", "+00:00")).timestamp())
+
+
+def _external_account_id(principal: str, own_account_id: Optional[str]) -> Optional[str]:
+    """
+    The account id of a principal of another account, which gets a RAM invitation, or None.
+    """
+    try:
+        account_id = get_account_id(principal)
+    except ValueError:
+        # Organizations, organizational units and service principals do not get invitations.
+        return None
+    return account_id if account_id != own_account_id else None
+
+
+def parse_invitation_event(event: dict) -> dict[str, dict[str, int]]:
+    """
+    The invitations sent by a RAM or Lake Formation API call, keyed by resource share arn, or by
+    "principal#<account id>" for Lake Formation grants, and then by principal with the time of the
+    call in epoch. Other events, and calls that failed, have no invitations.
+    """
+    if event.get("detail-type") != CLOUDTRAIL_DETAIL_TYPE or "detail" not in event:
+        return {}
+    detail = event["detail"]
+    if "errorCode" in detail or "eventTime" not in detail:
+        return {}
+    sent_at = parse_time(detail["eventTime"])
+    own_account_id = detail["recipientAccountId"] if "recipientAccountId" in detail else event.get("account")
+    request = detail.get("requestParameters") or {}
+    response = detail.get("responseElements") or {}
+    invitations: dict[str, dict[str, int]] = {}
+
+    if detail.get("eventSource") == "ram.amazonaws.com" and detail.get("eventName") == "AssociateResourceShare":
+        # The associations in the response carry the name of the resource share, the request does not.
+        associations = response["resourceShareAssociations"] if "resourceShareAssociations" in response else [{"resourceShareArn": request["resourceShareArn"], "associatedEntity": principal} for principal in request.get("principals", [])]
+        for association in associations:
+            account_id = _external_account_id(association["associatedEntity"], own_account_id)
+            if account_id is not None and association.get("associationType", "PRINCIPAL") == "PRINCIPAL" and association.get("resourceShareName", LAKE_FORMATION_SHARE_PREFIX).startswith(LAKE_FORMATION_SHARE_PREFIX):
+                invitations.setdefault(association["resourceShareArn"], {})[account_id] = sent_at
+    elif detail.get("eventSource") == "ram.amazonaws.com" and detail.get("eventName") == "CreateResourceShare":
+        resource_share = response.get("resourceShare") or {}
+        if "resourceShareArn" in resource_share and resource_share.get("name", "").startswith(LAKE_FORMATION_SHARE_PREFIX):
+            for principal in request.get("principals", []):
+                account_id = _external_account_id(principal, own_account_id)
+                if account_id is not None:
+                    invitations.setdefault(resource_share["resourceShareArn"], {})[account_id] = sent_at
+    elif detail.get("eventSource") == "lakeformation.amazonaws.com" and detail.get("eventName") in ("GrantPermissions", "BatchGrantPermissions"):
+        invitations = _granted_invitations(detail["eventName"], request, response, own_account_id, sent_at)
+
+    return invitations
+
+
+def _granted_invitations(event_name: str, request: dict, response: dict, own_account_id: Optional[str], sent_at: int) -> dict[str, dict[str, int]]:
+    """
+    The invitations of the principals of a Lake Formation grant, keyed by "principal#<account id>",
+    as the grant does not tell which resource share it used. Failed entries of a batch are left out.
+    """
+    entries = request["entries"] if event_name == "BatchGrantPermissions" and "entries" in request else [request]
+    failed_ids = {failure["requestEntry"]["id"] for failure in response.get("failures", []) if "requestEntry" in failure and "id" in failure["requestEntry"]}
+    invitations: dict[str, dict[str, int]] = {}
+    for entry in entries:
+        if "id" in entry and entry["id"] in failed_ids:
+            continue
+        account_id = _external_account_id(entry.get("principal", {}).get("dataLakePrincipalIdentifier", ""), own_account_id)
+        if account_id is not None:
+            invitations[PRINCIPAL_KEY_PREFIX + account_id] = {account_id: sent_at}
+    return invitations
+
+
+def parse_invitation_events(events: list[dict]) -> dict[str, dict[str, int]]:
+    """
+    The invitations of a list of events, the latest call wins for a principal that shows up twice.
+    """
+    invitations: dict[str, dict[str, int]] = {}
+    for event in events:
+        for key, sent_invitations in parse_invitation_event(event).items():
+            for principal, sent_at in sent_invitations.items():
+                invitations.setdefault(key, {})[principal] = max(sent_at, invitations.get(key, {}).get(principal, sent_at))
+    logger.info(f"Found invitations for {len(invitations)} resource shares or principals in {len(events)} events")
+    return invitations
+
+
+class DueInvitationStream:  # pylint: disable=too-few-public-methods
+    """
+    Iterates over (resource share arn, principals, previously failed) like ExpiredShareStream, for
+    the resource shares that failed on a previous run and the pending invitations that reached the
+    timeout. The due invitations are checked in RAM a batch at a time: the ones that are still
+    associating after the timeout are handed out, the ones that were sent again later are queued
+    again, and the accepted or removed ones are dropped.
+    """
+
+    def __init__(self, ram_manager: RamManager, ddb_manager, timeout_in_secs: int):
+        self.ram_manager = ram_manager
+        self.ddb_manager = ddb_manager
+        self.timeout_in_secs = timeout_in_secs
+        self.due_count = 0
+        self.requeued_count = 0
+
+    def __iter__(self) -> Iterator[tuple[str, set[str], bool]]:
+        for resource_share_arn, aws_account_ids in self.ddb_manager.iter_previously_failed_accounts_for_resource_share():
+            yield resource_share_arn, aws_account_ids, True
+
+        batch: list[tuple[str, dict[str, int]]] = []
+        for key, invitations in self.ddb_manager.iter_due_pending_invitations():
+            batch.append((key, invitations))
+            if len(batch) == RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL:
+                yield from self._check_batch(batch)
+                batch = []
+        if batch:
+            yield from self._check_batch(batch)
+
+        logger.info(f"Checked {self.due_count} due pending invitation items, {self.requeued_count} invitations were queued again")
+
+    def _check_batch(self, batch: list[tuple[str, dict[str, int]]]) -> Iterator[tuple[str, set[str], bool]]:
+        """
+        Look up the associations of a batch of due items, hand out the expired invitations and
+        update the queue once all of them were taken, so the items of a run that stops early stay queued.
+        """
+        self.due_count = self.due_count + len(batch)
+        resource_share_arns = [key for key, _invitations in batch if not key.startswith(PRINCIPAL_KEY_PREFIX)]
+        associations = self.ram_manager.get_principal_associations(resource_share_arns) if resource_share_arns else {}
+
+        expired: dict[str, set[str]] = {}
+        requeued: dict[str, dict[str, int]] = {}
+        for key, invitations in batch:
+            if key.startswith(PRINCIPAL_KEY_PREFIX):
+                candidates = self.ram_manager.get_principal_invitations(key[len(PRINCIPAL_KEY_PREFIX) :])
+            else:
+                candidates = [association for association in associations.get(key, []) if association["associatedEntity"] in invitations]
+            for association in candidates:
+                if association["status"] != "ASSOCIATING" or not association["resourceShareName"].startswith(LAKE_FORMATION_SHARE_PREFIX):
+                    continue
+                if self.ram_manager.is_expired(association):
+                    invitation_log.expired_invitation(association, association["creationTime"].timestamp())
+                    expired.setdefault(association["resourceShareArn"], set()).add(association["associatedEntity"])
+                else:
+                    requeued.setdefault(association["resourceShareArn"], {})[association["associatedEntity"]] = int(association["creationTime"].timestamp())
+                    self.requeued_count = self.requeued_count + 1
+
+        for resource_share_arn, aws_account_ids in expired.items():
+            yield resource_share_arn, aws_account_ids, False
+        self.ddb_manager.complete_pending_invitations([key for key, _invitations in batch], requeued, self.timeout_in_secs)
@@ -0,0 +1,149 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module rolls the per invitation log records of a run up into summaries. The expired
+invitations and the dry run actions are counted per status and per principal account, and the
+oldest expired invitations are kept, so a run logs a summary every interval and at its end instead
+of a line per invitation. The detailed records are logged at DEBUG, and a sample of them at INFO.
+"""
+
+import heapq
+import random
+import threading
+import time
+from typing import Optional
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+# Part of the detailed records that is logged at INFO, 1 logs every record like before.
+DEFAULT_LOG_SAMPLE_RATE = 0.0
+DEFAULT_LOG_SUMMARY_INTERVAL_IN_SECS = 60
+# Number of oldest invitations and principal accounts with the most records in a summary.
+DEFAULT_LOG_TOP_COUNT = 10
+
+EXPIRED = "expired"
+DRY_RUN_DISASSOCIATE = "dry_run_disassociate"
+DRY_RUN_ASSOCIATE = "dry_run_associate"
+DRY_RUN_MESSAGES = {DRY_RUN_DISASSOCIATE: "[Dry Run] Would have disassociated %s from %s", DRY_RUN_ASSOCIATE: "[Dry Run] Would have associated %s with %s"}
+
+
+class InvitationLog:  # pylint: disable=too-many-instance-attributes
+    """
+    The rolled up invitation records of a single run. Like the logger, a single instance is shared
+    by all modules, and it is reset at the start of every invocation.
+    """
+
+    def __init__(self):
+        self.sample_rate = DEFAULT_LOG_SAMPLE_RATE
+        self.summary_interval_in_secs = DEFAULT_LOG_SUMMARY_INTERVAL_IN_SECS
+        self.top_count = DEFAULT_LOG_TOP_COUNT
+        self.status_counts: dict[str, int] = {}
+        self.account_counts: dict[str, int] = {}
+        self.sampled_count = 0
+        self.summary_count = 0
+        # Min heap on the negated creation time, the newest of the kept invitations is dropped first.
+        self._oldest: list[tuple[float, str, str]] = []
+        self._next_summary_at = time.monotonic() + DEFAULT_LOG_SUMMARY_INTERVAL_IN_SECS
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, sample_rate: float = DEFAULT_LOG_SAMPLE_RATE, summary_interval_in_secs: float = DEFAULT_LOG_SUMMARY_INTERVAL_IN_SECS, top_count: int = DEFAULT_LOG_TOP_COUNT):
+        """
+        Start a new run.
+        """
+        with self._lock:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+            self.summary_interval_in_secs = summary_interval_in_secs
+            self.top_count = max(0, top_count)
+            self.status_counts = {}
+            self.account_counts = {}
+            self.sampled_count = 0
+            self.summary_count = 0
+            self._oldest = []
+            self._next_summary_at = time.monotonic() + summary_interval_in_secs
+
+    def _sampled(self) -> bool:
+        """
+        Whether the detailed record is logged at INFO.
+        """
+        return self.sample_rate >= 1.0 or (self.sample_rate > 0.0 and random.random() < self.sample_rate)  # nosec B311
+
+    def expired_invitation(self, association: dict, created_at: float):
+        """
+        Record an associating invitation that reached the timeout.
+        """
+        with self._lock:
+            self.status_counts[EXPIRED] = self.status_counts.get(EXPIRED, 0) + 1
+            self.account_counts[association["associatedEntity"]] = self.account_counts.get(association["associatedEntity"], 0) + 1
+            if self.top_count > 0:
+                entry = (-created_at, association["resourceShareName"], association["associatedEntity"])
+                if len(self._oldest) < self.top_count:
+                    heapq.heappush(self._oldest, entry)
+                elif entry > self._oldest[0]:
+                    heapq.heapreplace(self._oldest, entry)
+            sampled = self._sampled()
+            self.sampled_count = self.sampled_count + sampled
+        if sampled:
+            logger.info("Found Invitation for expiration: %s of %s that was created at %s epoch (%d seconds ago)", association["associatedEntity"], association["resourceShareName"], created_at, time.time() - created_at)
+        else:
+            logger.debug("Found Invitation for expiration: %s of %s that was created at %s epoch", association["associatedEntity"], association["resourceShareName"], created_at)
+        self._log_summary_when_due()
+
+    def dry_run_action(self, status: str, resource_share_arn: str, principals: list[str]):
+        """
+        Record the principals a dry run would have disassociated or associated.
+        """
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + len(principals)
+            sampled = self._sampled()
+            self.sampled_count = self.sampled_count + sampled
+        if sampled:
+            logger.info(DRY_RUN_MESSAGES[status], principals, resource_share_arn)
+        else:
+            logger.debug(DRY_RUN_MESSAGES[status], principals, resource_share_arn)
+        self._log_summary_when_due()
+
+    def _log_summary_when_due(self):
+        """
+        Log the summary so far when the interval has passed since the last one.
+        """
+        if time.monotonic() < self._next_summary_at:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_summary_at:
+                return
+            self._next_summary_at = time.monotonic() + self.summary_interval_in_secs
+        self.log_summary()
+
+    def log_summary(self):
+        """
+        Log the summary of the records so far, when there are any.
+        """
+        summary = self.as_dict()
+        if summary["status_counts"]:
+            self.summary_count = self.summary_count + 1
+            logger.info(f"Invitation summary: {summary}")
+
+    def as_dict(self, now: Optional[float] = None) -> dict:
+        """
+        The counts per status, the principal accounts with the most expired invitations and the
+        oldest expired invitations.
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            top_accounts = sorted(self.account_counts.items(), key=lambda item: (-item[1], item[0]))[: self.top_count]
+            oldest = sorted(self._oldest, reverse=True)
+            return {
+                "status_counts": dict(sorted(self.status_counts.items())),
+                "account_count": len(self.account_counts),
+                "top_accounts": [{"account_id": account_id, "count": count} for account_id, count in top_accounts],
+                "oldest_invitations": [{"resource_share_name": resource_share_name, "principal": principal, "created_at": int(-negated_created_at), "age_in_secs": int(now + negated_created_at)} for negated_created_at, resource_share_name, principal in oldest],
+                "sampled_count": self.sampled_count,
+            }
+
+
+# Shared by all modules, see InvitationLog.
+invitation_log = InvitationLog()
@@ -11,85 +11,599 @@ This Lambda function is designed to be called periodically, for example once a d
 a day.
 """
 
-import boto3
-import botocore
-from aws_lambda_powertools import Logger, Tracer
+import contextlib
+import json
+import os
+import time
+from typing import Callable, Iterable, Optional
 
+from aws_lambda_powertools import Logger, Metrics, Tracer
+
+from lf_stale_ram_invite_monitor.clients import ClientFactory
 from lf_stale_ram_invite_monitor.ddb_manager import DdbManager
-from lf_stale_ram_invite_monitor.ram_manager import RamManager
+from lf_stale_ram_invite_monitor.instrumentation import DEFAULT_PROFILE_PATH, METRICS_NAMESPACE, instrumentation, profiled
+from lf_stale_ram_invite_monitor.invitation_log import DEFAULT_LOG_SAMPLE_RATE, DEFAULT_LOG_SUMMARY_INTERVAL_IN_SECS, DEFAULT_LOG_TOP_COUNT, invitation_log
+from lf_stale_ram_invite_monitor.pipeline import ExpiredShareStream
+from lf_stale_ram_invite_monitor.ram_manager import DEFAULT_SHARE_CACHE_TTL_IN_SECS, FULL_SCAN, LAKE_FORMATION_SHARES, SHARE_INDEX, EnumerationOptions, RamManager
+from lf_stale_ram_invite_monitor.remediation_engine import DEFAULT_MAX_CONCURRENCY, RemediationEngine
+from lf_stale_ram_invite_monitor.remediation_history import DEFAULT_CHURN_COOLDOWN_IN_SECS, DEFAULT_MAX_RECREATE_CYCLES, RemediationHistory
+from lf_stale_ram_invite_monitor.scheduler import DEFAULT_MAX_INTERVAL_IN_SECS, DEFAULT_MIN_INTERVAL_IN_SECS, NEXT_RUN_SCHEDULE_NAME_ENV, NEXT_RUN_SCHEDULER_ROLE_ARN_ENV, NextRunScheduler, choose_next_run_at
+from lf_stale_ram_invite_monitor.verification import DEFAULT_VERIFICATION_BUDGET_IN_SECS, RemediationVerifier, VerificationSummary
+
+# The modules of the modes and strategies that only some runs use are imported when they are needed, to keep the cold start short.
 
 tracer = Tracer()
 logger = Logger()
+metrics = Metrics(namespace=os.environ.get("POWERTOOLS_METRICS_NAMESPACE", METRICS_NAMESPACE))
 
-ddb_client = boto3.client("dynamodb")
-ram_client = boto3.client("ram")
+# The clients are created on first use and kept for warm invocations.
+clients = ClientFactory()
 
 ELEVEN_HOURS_IN_SECS = 11 * 60 * 60
+# Time left for the shares in flight and saving the checkpoint once no new shares are taken.
+DEFAULT_DEADLINE_MARGIN_IN_MS = 30 * 1000
+DEFAULT_MAX_SELF_INVOCATIONS = 10
+# Set by the template to LambdaReservedConcurrentExecutions, the coordinator keeps its workers within it.
+RESERVED_CONCURRENCY_ENV = "RESERVED_CONCURRENT_EXECUTIONS"
 
 
-@tracer.capture_lambda_handler
-def lambda_handler(event, _context):
+def deadline_reached(context, margin_in_ms: int, deadline_epoch_in_ms: Optional[int] = None):
     """
-    Main Lambda handler.
+    Returns a function that tells whether the Lambda invocation, or the coordinator that invoked
+    it, is about to time out.
     """
+    checks = []
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        checks.append(lambda: context.get_remaining_time_in_millis() < margin_in_ms)
+    if deadline_epoch_in_ms is not None:
+        checks.append(lambda: int(time.time() * 1000) > deadline_epoch_in_ms - margin_in_ms)
+    if not checks:
+        return None
+    return lambda: any(check() for check in checks)
+
+
+def resume_in_new_invocation(event: dict, context):
+    """
+    Asynchronously invoke this function again to carry on from the checkpoint.
+    """
+    resume_depth: int = int(event["resume_depth"]) if "resume_depth" in event else 0
+    max_self_invocations: int = int(event["max_self_invocations"]) if "max_self_invocations" in event else DEFAULT_MAX_SELF_INVOCATIONS
+    if resume_depth >= max_self_invocations:
+        logger.warning(f"Reached {max_self_invocations} self invocations, the next scheduled run will resume from the checkpoint")
+        return False
+
+    lambda_client = clients.client("lambda")
+    lambda_client.invoke(FunctionName=context.invoked_function_arn, InvocationType="Event", Payload=json.dumps({**event, "resume_depth": resume_depth + 1}))
+    logger.info("Invoked a new run to resume from the checkpoint")
+    return True
+
+
+def schedule_next_run(event: dict, context, ram_manager: RamManager, ddb_manager: DdbManager, stopped_early: bool) -> int:
+    """
+    Choose the time of the next run: when the earliest associating invitation that was read, or
+    the earliest queued share, becomes due, or as soon as possible when this run stopped early.
+    With predictive_scheduling the run is scheduled with EventBridge Scheduler.
+    """
+    min_interval_in_seconds: int = int(event["next_run_min_interval_in_seconds"]) if "next_run_min_interval_in_seconds" in event else DEFAULT_MIN_INTERVAL_IN_SECS
+    max_interval_in_seconds: int = int(event["next_run_max_interval_in_seconds"]) if "next_run_max_interval_in_seconds" in event else DEFAULT_MAX_INTERVAL_IN_SECS
+    due_times = [0] if stopped_early else [ram_manager.next_expiry_at, ddb_manager.get_next_due_at()]
+    next_run_at = choose_next_run_at(due_times, min_interval_in_seconds, max_interval_in_seconds)
+
+    predictive_scheduling = str(event["predictive_scheduling"]).lower() == "true" if "predictive_scheduling" in event else False
+    if predictive_scheduling and context is not None and hasattr(context, "invoked_function_arn") and NEXT_RUN_SCHEDULE_NAME_ENV in os.environ and NEXT_RUN_SCHEDULER_ROLE_ARN_ENV in os.environ:
+        scheduler = NextRunScheduler(clients.client("scheduler"), os.environ[NEXT_RUN_SCHEDULE_NAME_ENV], os.environ[NEXT_RUN_SCHEDULER_ROLE_ARN_ENV])
+        scheduler.schedule(next_run_at, context.invoked_function_arn, event)
+    return next_run_at
+
+
+def get_worker_concurrency() -> Optional[int]:
+    """
+    Executions of the reserved concurrency of the function that are left for workers next to the
+    coordinator, None when the concurrency of the function is not reserved.
+    """
+    reserved_concurrency = int(os.environ[RESERVED_CONCURRENCY_ENV]) if RESERVED_CONCURRENCY_ENV in os.environ else 0
+    # One execution is taken by the coordinator itself.
+    return reserved_concurrency - 1 if reserved_concurrency > 0 else None
 
-    try:
-        logger.info("Getting expired RAM invitations...")
-        timeout_in_seconds: int = event["ram_timeout_in_seconds"] if "ram_timeout_in_seconds" in event else ELEVEN_HOURS_IN_SECS
-        dry_run = event["dry_run"] if "dry_run" in event else True
 
-        ram_manager = RamManager(ram_client, timeout_in_seconds, dry_run)
-        ddb_manager = DdbManager(ddb_client, event["ddb_table_name"])
+def uses_local_workers(event: dict, context) -> bool:
+    """
+    Workers run in-process when the event asks for it, when there is no Lambda context, or when the
+    reserved concurrency leaves no execution for them, as every worker invocation would be throttled.
+    """
+    if ("dispatcher" in event and event["dispatcher"] == "local") or context is None or not hasattr(context, "invoked_function_arn"):
+        return True
+    return get_worker_concurrency() == 0
+
+
+def create_shard_dispatcher(event: dict, context):
+    """
+    Workers are invoked through Lambda, unless they run locally, see uses_local_workers.
+    """
+    from lf_stale_ram_invite_monitor.fan_out import LambdaShardDispatcher, LocalShardDispatcher  # pylint: disable=import-outside-toplevel
+
+    if uses_local_workers(event, context):
+        if get_worker_concurrency() == 0 and context is not None and hasattr(context, "invoked_function_arn"):
+            logger.warning(f"{RESERVED_CONCURRENCY_ENV} is 1, so there is no concurrency left for worker invocations. The shards are run in this invocation, raise LambdaReservedConcurrentExecutions to fan out")
+        # Local workers share the instrumentation of the coordinator.
+        return LocalShardDispatcher(handle, context)
+    return LambdaShardDispatcher(clients.client("lambda"), context.invoked_function_arn)
+
+
+def get_max_parallel_workers(event: dict, context) -> int:
+    """
+    Number of workers that can run next to the coordinator within the reserved concurrency of the function.
+    """
+    worker_concurrency = get_worker_concurrency()
+    max_parallel_workers: int = int(event["max_parallel_workers"]) if "max_parallel_workers" in event else max(1, worker_concurrency or 0)
+    if worker_concurrency is not None and not uses_local_workers(event, context):
+        max_parallel_workers = min(max_parallel_workers, worker_concurrency)
+    return max(1, max_parallel_workers)
+
+
+def get_ram_timeout_in_seconds(event: dict) -> int:
+    """
+    Age after which an associating RAM invitation is expired.
+    """
+    return int(event["ram_timeout_in_seconds"]) if "ram_timeout_in_seconds" in event else ELEVEN_HOURS_IN_SECS
+
+
+def is_dry_run(event: dict) -> bool:
+    """
+    A dry run only reports the expired RAM invitations. The template passes the flag as a string.
+    """
+    return str(event["dry_run"]).lower() == "true" if "dry_run" in event else True
 
-        # Get all expired RAM shares.
-        expired_ram_shares: dict[str, str] = ram_manager.get_new_expired_ram_invitations()
 
-        previously_failed_accounts: dict[str, str] = ddb_manager.get_previously_failed_accounts_for_resource_share()
-        expired_ram_shares.update(previously_failed_accounts)
+def create_ddb_manager(event: dict) -> DdbManager:
+    """
+    Create the DDB manager of the table of the function, with a connection for every concurrent remediation.
+    """
+    max_concurrency: int = int(event["max_concurrency"]) if "max_concurrency" in event else DEFAULT_MAX_CONCURRENCY
+    return DdbManager(clients.client("dynamodb", max_pool_connections=max_concurrency), event["ddb_table_name"])
+
+
+def create_ram_manager(event: dict, ddb_manager: DdbManager) -> RamManager:
+    """
+    Create the RAM manager for the enumeration strategy of the event. The share_index strategy
+    enumerates the Lake Formation shares of the share index, see read_share_index.
+    """
+    enumeration_strategy: str = event["enumeration_strategy"] if "enumeration_strategy" in event else FULL_SCAN
+    share_cache_ttl_in_seconds: int = int(event["share_cache_ttl_in_seconds"]) if "share_cache_ttl_in_seconds" in event else DEFAULT_SHARE_CACHE_TTL_IN_SECS
+    max_concurrency: int = int(event["max_concurrency"]) if "max_concurrency" in event else DEFAULT_MAX_CONCURRENCY
+    ram_client = clients.client("ram", max_pool_connections=max_concurrency)
+    if enumeration_strategy != SHARE_INDEX:
+        return RamManager(ram_client, get_ram_timeout_in_seconds(event), is_dry_run(event), enumeration=EnumerationOptions(enumeration_strategy, share_cache_ttl_in_seconds))
+
+    ram_manager = RamManager(ram_client, get_ram_timeout_in_seconds(event), is_dry_run(event), enumeration=EnumerationOptions(LAKE_FORMATION_SHARES, share_cache_ttl_in_seconds))
+    # Workers are handed their shares by the coordinator, which already read the index.
+    if "mode" not in event or event["mode"] != "worker":
+        ram_manager.share_arns = read_share_index(event, ddb_manager, ram_manager)
+    return ram_manager
+
+
+def read_share_index(event: dict, ddb_manager: DdbManager, ram_manager: RamManager) -> list[str]:
+    """
+    The arns of the Lake Formation shares of the share index. Only the arns of a recent index are
+    read, an index that is older than the refresh interval is refreshed first.
+    """
+    from lf_stale_ram_invite_monitor.share_index import DEFAULT_FULL_REFRESH_INTERVAL_IN_SECS, DEFAULT_REFRESH_INTERVAL_IN_SECS, DdbShareIndexStore, ShareIndex  # pylint: disable=import-outside-toplevel
+
+    refresh_interval_in_seconds: int = int(event["share_index_refresh_interval_in_seconds"]) if "share_index_refresh_interval_in_seconds" in event else DEFAULT_REFRESH_INTERVAL_IN_SECS
+    full_refresh_interval_in_seconds: int = int(event["share_index_full_refresh_interval_in_seconds"]) if "share_index_full_refresh_interval_in_seconds" in event else DEFAULT_FULL_REFRESH_INTERVAL_IN_SECS
+    share_index = ShareIndex(DdbShareIndexStore(ddb_manager), ram_manager, clients.client("lakeformation"), full_refresh_interval_in_seconds)
+    return share_index.recent_resource_share_arns(refresh_interval_in_seconds)
+
+
+def record_invitation_events(event: dict, context) -> dict:  # pylint: disable=unused-argument
+    """
+    Queue the invitations of the RAM and Lake Formation events that EventBridge delivered, until they reach the timeout.
+    """
+    from lf_stale_ram_invite_monitor.invitation_events import parse_invitation_events  # pylint: disable=import-outside-toplevel
+
+    invitations = parse_invitation_events(event["events"] if "events" in event else [])
+    if invitations:
+        create_ddb_manager(event).add_pending_invitations(invitations, get_ram_timeout_in_seconds(event))
+    queued_count = sum(len(principals) for principals in invitations.values())
+    return {"message": f"Queued {queued_count} RAM invitations", "queued_count": queued_count}
+
+
+def verify_remediation(event: dict, context, ram_manager: RamManager, ddb_manager: DdbManager, summary) -> Optional[VerificationSummary]:
+    """
+    Check that the recreated invitations reached RAM, within the verification budget and the time
+    left in the invocation. Returns None when nothing was sent to RAM.
+    """
+    budget_in_seconds: float = float(event["verification_budget_in_seconds"]) if "verification_budget_in_seconds" in event else DEFAULT_VERIFICATION_BUDGET_IN_SECS
+    deadline_margin_in_ms: int = int(event["deadline_margin_in_ms"]) if "deadline_margin_in_ms" in event else DEFAULT_DEADLINE_MARGIN_IN_MS
+    # Workers also have to be done before the deadline of their coordinator.
+    deadline_epoch_in_ms: Optional[int] = int(event["deadline_epoch_in_ms"]) if "deadline_epoch_in_ms" in event else None
+    if budget_in_seconds <= 0 or ram_manager.dry_run or not summary.recreated_shares:
+        return None
+    # The remediation stops at the margin, the verification gets half of it.
+    verifier = RemediationVerifier(ram_manager, ddb_manager, budget_in_seconds)
+    with instrumentation.phase("verification"):
+        return verifier.verify(summary.recreated_shares, deadline_reached(context, deadline_margin_in_ms // 2, deadline_epoch_in_ms))
+
+
+def create_remediation_history(event: dict, ddb_manager: DdbManager) -> Optional[RemediationHistory]:
+    """
+    Load the remediation history when the event sets a churn cooldown or a cycle limit, otherwise
+    the history is neither read nor written.
+    """
+    churn_cooldown_in_seconds: int = int(event["churn_cooldown_in_seconds"]) if "churn_cooldown_in_seconds" in event else DEFAULT_CHURN_COOLDOWN_IN_SECS
+    max_recreate_cycles: int = int(event["max_recreate_cycles"]) if "max_recreate_cycles" in event else DEFAULT_MAX_RECREATE_CYCLES
+    if churn_cooldown_in_seconds <= 0 and max_recreate_cycles <= 0:
+        return None
+    remediation_history = RemediationHistory(ddb_manager, churn_cooldown_in_seconds, max_recreate_cycles)
+    remediation_history.load()
+    return remediation_history
+
+
+def worker_remediation_history(event: dict, ddb_manager: DdbManager) -> Optional[RemediationHistory]:
+    """
+    The remediation history of the shares of a worker, as the coordinator sent it. The worker only
+    records the history when the coordinator asks for it, and does not load it again.
+    """
+    if "remediation_history" not in event:
+        return None
+    remediation_history = RemediationHistory(ddb_manager)
+    remediation_history.entries = {resource_share_arn: (int(last_recreated_at), int(cycle_count)) for resource_share_arn, (last_recreated_at, cycle_count) in event["remediation_history"].items()}
+    return remediation_history
+
+
+def record_remediation_history(remediation_history: Optional[RemediationHistory], ram_manager: RamManager, summary):
+    """
+    Save the resource shares that were recreated in the remediation history. A dry run did not
+    change RAM, so it has nothing to record.
+    """
+    if remediation_history is not None and not ram_manager.dry_run:
+        remediation_history.record(summary.recreated_shares)
+
+
+def run_worker(event: dict, context) -> dict:
+    """
+    Remediate the shares of a single shard that were handed out by a coordinator.
+    """
+    ddb_manager = create_ddb_manager(event)
+    ram_manager = create_ram_manager(event, ddb_manager)
+    shares = iter([(resource_share_arn, set(aws_account_ids), previously_failed) for resource_share_arn, aws_account_ids, previously_failed in event["shares"]])
+    max_concurrency: int = int(event["max_concurrency"]) if "max_concurrency" in event else DEFAULT_MAX_CONCURRENCY
+    deadline_margin_in_ms: int = int(event["deadline_margin_in_ms"]) if "deadline_margin_in_ms" in event else DEFAULT_DEADLINE_MARGIN_IN_MS
+    deadline_epoch_in_ms: Optional[int] = int(event["deadline_epoch_in_ms"]) if "deadline_epoch_in_ms" in event else None
+
+    with instrumentation.phase("remediation"):
+        summary = RemediationEngine(ram_manager, ddb_manager, max_concurrency).remediate(shares, deadline_reached(context, deadline_margin_in_ms, deadline_epoch_in_ms))
+    instrumentation.increment("shares_processed", summary.share_count)
+    # The coordinator already left out the suppressed shares, the worker only records the recreated ones.
+    record_remediation_history(worker_remediation_history(event, ddb_manager), ram_manager, summary)
+    verification = verify_remediation(event, context, ram_manager, ddb_manager, summary)
+
+    # Whatever is left in the iterator was not started, the coordinator saves it for a retry.
+    unprocessed_shares = [[resource_share_arn, sorted(aws_account_ids), previously_failed] for resource_share_arn, aws_account_ids, previously_failed in shares]
+    message = f"Shard {event['shard'] if 'shard' in event else 0}: Recreated {summary.recreated_count} RAM invitations. Failed = {summary.failed_count}"
+    logger.info(message)
+    response = {"message": message, "recreated_count": summary.recreated_count, "failed_count": summary.failed_count, "unprocessed_shares": unprocessed_shares, "throughput": summary.throughput()}
+    if verification is not None:
+        response["verification"] = verification.as_dict()
+    return response
+
+
+class RemediationRun:  # pylint: disable=too-many-instance-attributes
+    """
+    A run of the standalone, incremental or coordinator mode. The expired RAM shares are streamed
+    into the remediation while RAM is still being paged through, and the response is built up
+    along the way.
+    """
+
+    def __init__(self, event: dict, context, should_stop: Optional[Callable[[], bool]]):
+        self.event = event
+        self.context = context
+        self.should_stop = should_stop
+        self.ddb_manager = create_ddb_manager(event)
+        self.ram_manager = create_ram_manager(event, self.ddb_manager)
+        self.checkpoint: Optional[dict] = None
+        self.resumed = False
+        self.response: dict = {}
+        self.remediation_history: Optional[RemediationHistory] = None
+
+    def stream_expired_shares(self) -> ExpiredShareStream:
+        """
+        Stream the expired RAM shares, starting where the previous run stopped if it ran out of time.
+        """
+        self.checkpoint = self.ddb_manager.get_checkpoint()
+        return ExpiredShareStream(self.ram_manager, self.ddb_manager, self.checkpoint, self.should_stop)
+
+    def filter_shares(self, expired_ram_shares: Iterable) -> Iterable:
+        """
+        The shares are enumerated while they are remediated, the enumeration is the time spent
+        waiting for the next share. Resource shares that were recreated recently, or too many times
+        in a row, are taken out of the stream.
+        """
+        timed_expired_ram_shares = instrumentation.timed_iter("enumeration", expired_ram_shares)
+        self.remediation_history = create_remediation_history(self.event, self.ddb_manager)
+        if self.remediation_history is not None:
+            timed_expired_ram_shares = self.remediation_history.filter(timed_expired_ram_shares)
+        return timed_expired_ram_shares
+
+    def remediate(self, expired_ram_shares: Iterable):
+        """
+        Remediate the shares in this invocation, then record and verify the recreated ones.
+        """
+        max_concurrency: int = int(self.event["max_concurrency"]) if "max_concurrency" in self.event else DEFAULT_MAX_CONCURRENCY
+        with instrumentation.phase("remediation"):
+            summary = RemediationEngine(self.ram_manager, self.ddb_manager, max_concurrency).remediate(expired_ram_shares, self.should_stop)
+        instrumentation.increment("shares_processed", summary.share_count)
+        record_remediation_history(self.remediation_history, self.ram_manager, summary)
+        self.response["throughput"] = summary.throughput()
+        verification = verify_remediation(self.event, self.context, self.ram_manager, self.ddb_manager, summary)
+        if verification is not None:
+            self.response["verification"] = verification.as_dict()
+        return summary
+
+    def save_checkpoint(self, expired_ram_shares: ExpiredShareStream, summary):
+        """
+        Save where the stream stopped when the run ran out of time, and carry on in a new
+        invocation when the event asks for it. A run that got through removes the checkpoint.
+        """
+        if expired_ram_shares.stopped_early:
+            # The stream stopped between two RAM pages, which the consumer took for the end of the shares.
+            summary.stopped_early = True
+        if summary.stopped_early and not expired_ram_shares.exhausted:
+            self.ddb_manager.save_checkpoint(expired_ram_shares.checkpoint())
+            if "resume_mode" in self.event and self.event["resume_mode"] == "self_invoke":
+                self.resumed = resume_in_new_invocation(self.event, self.context)
+        elif self.checkpoint is not None:
+            self.ddb_manager.remove_checkpoint()
+
+    def finish(self, summary) -> dict:
+        """
+        Schedule the next run and summarize the run in the response.
+        """
+        if self.remediation_history is not None:
+            self.response["churn"] = self.remediation_history.as_dict()
+        suppressed = self.remediation_history is not None and (self.remediation_history.cooldown_count > 0 or len(self.remediation_history.parked_shares) > 0)
+        next_run_at = schedule_next_run(self.event, self.context, self.ram_manager, self.ddb_manager, summary.stopped_early and not self.resumed)
+        self.response["next_run_at"] = next_run_at
 
         # If there are no expired RAM shares, return.
-        if not expired_ram_shares:
+        if summary.share_count == 0 and not summary.stopped_early and not suppressed:
             logger.info("No expired RAM shares found.")
             return {
                 "message": "No expired RAM shares found.",
                 "recreated_count": 0,
                 "failed_count": 0,
+                "next_run_at": next_run_at,
             }
 
-        refreshed_ram_shares: int = 0
-        failed_ram_shares_count: int = 0
-
-        for resource_share_arn, aws_account_id in expired_ram_shares.items():
-            try:
-                ram_manager.deassociate_account_from_ram_share(resource_share_arn, aws_account_id)
-                try:
-                    ram_manager.associate_account_with_ram_share(resource_share_arn, aws_account_id)
-                    refreshed_ram_shares = refreshed_ram_shares + 1
-                    if resource_share_arn in previously_failed_accounts:
-                        ddb_manager.remove_resource_share_from_ddb(resource_share_arn)
-                except botocore.exceptions.ClientError as e:  # pylint: disable=broad-except
-                    logger.error(f"ERROR: Failed to reassociate RAM invite for {aws_account_id} for RAM Resource: {resource_share_arn}: {e}")
-                    ddb_manager.add_resource_share_to_ddb(resource_share_arn, aws_account_id)
-                    failed_ram_shares_count = failed_ram_shares_count + 1
-            except ram_client.exceptions.UnknownResourceException:
-                logger.info(f"Resource share {resource_share_arn} no longer exists. Removing from DDB.")
-                if resource_share_arn in previously_failed_accounts:
-                    ddb_manager.remove_resource_share_from_ddb(resource_share_arn)
-            except Exception as e:  # pylint: disable=broad-except
-                logger.error(f"Failed to process RAM share for account {aws_account_id} for {resource_share_arn}: {e}")
-                failed_ram_shares_count = failed_ram_shares_count + 1
-                continue
-
         # Summary
-        message = f"Recreated {refreshed_ram_shares} RAM invitations. Failed = {failed_ram_shares_count}"
+        message = f"Recreated {summary.recreated_count} RAM invitations. Failed = {summary.failed_count}"
+        if "verification" in self.response:
+            message = message + f". Verified = {self.response['verification']['verified_count']}, Pending = {self.response['verification']['pending_count']}, Failed verification = {self.response['verification']['failed_count']}"
+        if suppressed:
+            message = message + f". Skipped in cooldown = {self.response['churn']['cooldown_count']}, Parked = {self.response['churn']['parked_count']}"
+        if summary.stopped_early:
+            message = message + ". Stopped before the Lambda timeout, the remaining RAM shares will be processed " + ("by a new invocation" if self.resumed else "by the next scheduled run")
         logger.info(message)
-        return {"message": message, "recreated_count": refreshed_ram_shares, "failed_count": failed_ram_shares_count}
-    except Exception as e:  # pylint: disable=broad-except
-        raise e
+        return {"message": message, "recreated_count": summary.recreated_count, "failed_count": summary.failed_count, "completed": not summary.stopped_early, **self.response}
+
+
+def run_standalone(event: dict, context) -> dict:
+    """
+    Remediate the expired RAM shares in this invocation.
+    """
+    deadline_margin_in_ms: int = int(event["deadline_margin_in_ms"]) if "deadline_margin_in_ms" in event else DEFAULT_DEADLINE_MARGIN_IN_MS
+    run = RemediationRun(event, context, deadline_reached(context, deadline_margin_in_ms))
+    expired_ram_shares = run.stream_expired_shares()
+    summary = run.remediate(run.filter_shares(expired_ram_shares))
+    run.save_checkpoint(expired_ram_shares, summary)
+    return run.finish(summary)
+
+
+def run_incremental(event: dict, context) -> dict:
+    """
+    Remediate the queued invitations that are due. They stay queued when the run stops early, so
+    the incremental mode does not need a checkpoint.
+    """
+    from lf_stale_ram_invite_monitor.invitation_events import DueInvitationStream  # pylint: disable=import-outside-toplevel
+
+    deadline_margin_in_ms: int = int(event["deadline_margin_in_ms"]) if "deadline_margin_in_ms" in event else DEFAULT_DEADLINE_MARGIN_IN_MS
+    run = RemediationRun(event, context, deadline_reached(context, deadline_margin_in_ms))
+    expired_ram_shares = DueInvitationStream(run.ram_manager, run.ddb_manager, get_ram_timeout_in_seconds(event))
+    summary = run.remediate(run.filter_shares(expired_ram_shares))
+    run.response["due_count"] = expired_ram_shares.due_count
+    return run.finish(summary)
+
+
+def create_worker_event(event: dict, context) -> dict:
+    """
+    The event of the worker invocations: the event of the coordinator without its own settings,
+    and the deadline the workers have to be done by.
+    """
+    deadline_margin_in_ms: int = int(event["deadline_margin_in_ms"]) if "deadline_margin_in_ms" in event else DEFAULT_DEADLINE_MARGIN_IN_MS
+    worker_event = {key: value for key, value in event.items() if key not in ("mode", "shard_count", "max_parallel_workers", "resume_mode", "resume_depth", "churn_cooldown_in_seconds", "max_recreate_cycles")}
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        # Workers have to be done before the coordinator needs the time to wrap up.
+        worker_event["deadline_epoch_in_ms"] = int(time.time() * 1000) + context.get_remaining_time_in_millis() - deadline_margin_in_ms
+    return worker_event
+
+
+def dispatch_shards(event: dict, context, expired_ram_shares: Iterable[tuple[str, set[str], bool]], ddb_manager: DdbManager, should_stop: Optional[Callable[[], bool]] = None, *, remediation_history: Optional[RemediationHistory] = None):  # pylint: disable=too-many-arguments
+    """
+    Partition the expired shares into shards and remediate them in worker invocations, until `should_stop` returns True.
+    Workers get the remediation history of their shares along with them.
+    """
+    from lf_stale_ram_invite_monitor.fan_out import DEFAULT_MAX_SHARES_PER_INVOCATION, ShardCoordinator  # pylint: disable=import-outside-toplevel
+
+    max_parallel_workers = get_max_parallel_workers(event, context)
+    shard_count: int = int(event["shard_count"]) if "shard_count" in event else max_parallel_workers
+    max_shares_per_invocation: int = int(event["max_shares_per_invocation"]) if "max_shares_per_invocation" in event else DEFAULT_MAX_SHARES_PER_INVOCATION
+
+    coordinator = ShardCoordinator(create_shard_dispatcher(event, context), shard_count, max_parallel_workers, max_shares_per_invocation, batch_event=remediation_history.worker_event if remediation_history is not None else None)
+    coordinator.run(expired_ram_shares, create_worker_event(event, context), should_stop)
+
+    for resource_share_arn, aws_account_ids in coordinator.unprocessed_shares:
+        ddb_manager.add_resource_share_to_ddb(resource_share_arn, aws_account_ids)
+    ddb_manager.flush()
+    return coordinator
+
+
+def run_coordinator(event: dict, context) -> dict:
+    """
+    Enumerate the expired RAM shares and remediate them in worker invocations, see dispatch_shards.
+    """
+    deadline_margin_in_ms: int = int(event["deadline_margin_in_ms"]) if "deadline_margin_in_ms" in event else DEFAULT_DEADLINE_MARGIN_IN_MS
+    # The coordinator keeps twice the margin, to wait for its workers and save what they did not get to.
+    run = RemediationRun(event, context, deadline_reached(context, 2 * deadline_margin_in_ms))
+    expired_ram_shares = run.stream_expired_shares()
+    timed_expired_ram_shares = run.filter_shares(expired_ram_shares)
+    with instrumentation.phase("remediation"):
+        summary = dispatch_shards(event, context, timed_expired_ram_shares, run.ddb_manager, run.should_stop, remediation_history=run.remediation_history)
+    instrumentation.increment("shares_processed", summary.share_count)
+    run.response["shards"] = [result.as_dict() for result in summary.results]
+    if any(result.verified_count or result.pending_count or result.verification_failed_count for result in summary.results):
+        run.response["verification"] = summary.verification
+    run.save_checkpoint(expired_ram_shares, summary)
+    return run.finish(summary)
+
+
+def create_target_clients(target) -> ClientFactory:
+    """
+    The clients of a sweep target, with the credentials of its role when it has one.
+    """
+    if target.role_arn is None:
+        return ClientFactory(region_name=target.region_name)
+
+    from lf_stale_ram_invite_monitor.targets import assume_role_session  # pylint: disable=import-outside-toplevel
+
+    return ClientFactory(assume_role_session(clients.client("sts"), target), target.region_name)
+
+
+def create_target_managers(event: dict, target, caller_identity: Optional[dict]) -> tuple[RamManager, DdbManager]:
+    """
+    The RAM manager of a sweep target, with its own RAM client, and the DDB manager of its retries.
+    They are kept in the table of this function, under the ARN prefix of the target's resource shares.
+    """
+    from lf_stale_ram_invite_monitor.targets import DEFAULT_MAX_PARALLEL_TARGETS  # pylint: disable=import-outside-toplevel
+
+    max_parallel_targets: int = int(event["max_parallel_targets"]) if "max_parallel_targets" in event else DEFAULT_MAX_PARALLEL_TARGETS
+    max_concurrency: int = int(event["max_concurrency_per_target"]) if "max_concurrency_per_target" in event else DEFAULT_MAX_CONCURRENCY
+    enumeration_strategy: str = event["enumeration_strategy"] if "enumeration_strategy" in event else FULL_SCAN
+    share_cache_ttl_in_seconds: int = int(event["share_cache_ttl_in_seconds"]) if "share_cache_ttl_in_seconds" in event else DEFAULT_SHARE_CACHE_TTL_IN_SECS
+    if target.role_arn is not None:
+        partition, account_id = target.role_arn.split(":")[1], target.account_id
+    else:
+        partition, account_id = caller_identity["Arn"].split(":")[1], caller_identity["Account"]
+
+    ram_client = create_target_clients(target).client("ram", max_pool_connections=max_concurrency)
+    ram_manager = RamManager(ram_client, get_ram_timeout_in_seconds(event), is_dry_run(event), enumeration=EnumerationOptions(enumeration_strategy, share_cache_ttl_in_seconds, account_id=account_id))
+    # The targets share the table of this function, and with it a single DynamoDB client.
+    ddb_client = clients.client("dynamodb", max_pool_connections=max_parallel_targets * max_concurrency)
+    return ram_manager, DdbManager(ddb_client, event["ddb_table_name"], f"arn:{partition}:ram:{target.region_name}:{account_id}:")
+
+
+def remediate_target(event: dict, context, target, caller_identity: Optional[dict], should_stop: Optional[Callable[[], bool]]):
+    """
+    Remediate the expired RAM invitations of a single sweep target.
+    """
+    from lf_stale_ram_invite_monitor.targets import TargetResult  # pylint: disable=import-outside-toplevel
+
+    max_concurrency: int = int(event["max_concurrency_per_target"]) if "max_concurrency_per_target" in event else DEFAULT_MAX_CONCURRENCY
+    ram_manager, ddb_manager = create_target_managers(event, target, caller_identity)
+    stream = ExpiredShareStream(ram_manager, ddb_manager, should_stop=should_stop)
+    expired_ram_shares = instrumentation.timed_iter("enumeration", stream)
+    remediation_history = create_remediation_history(event, ddb_manager)
+    if remediation_history is not None:
+        expired_ram_shares = remediation_history.filter(expired_ram_shares)
+    with instrumentation.phase("remediation"):
+        summary = RemediationEngine(ram_manager, ddb_manager, max_concurrency).remediate(expired_ram_shares, should_stop)
+    instrumentation.increment("shares_processed", summary.share_count)
+    record_remediation_history(remediation_history, ram_manager, summary)
+    verification = verify_remediation(event, context, ram_manager, ddb_manager, summary)
+
+    result = TargetResult(target)
+    result.share_count, result.recreated_count, result.failed_count = summary.share_count, summary.recreated_count, summary.failed_count
+    result.completed = not summary.stopped_early and not stream.stopped_early
+    result.verification = verification.as_dict() if verification is not None else None
+    result.churn = remediation_history.as_dict() if remediation_history is not None else None
+    return result
+
+
+def run_sweep(event: dict, context) -> dict:
+    """
+    Remediate the expired RAM invitations of several regions and accounts, see remediate_target.
+    The sweep does not checkpoint, a target that runs out of time picks up its expired shares
+    again on the next run.
+    """
+    from lf_stale_ram_invite_monitor.targets import DEFAULT_MAX_PARALLEL_TARGETS, TargetSweep, parse_targets  # pylint: disable=import-outside-toplevel
+
+    targets = parse_targets(event["targets"] if "targets" in event else [])
+    max_parallel_targets: int = int(event["max_parallel_targets"]) if "max_parallel_targets" in event else DEFAULT_MAX_PARALLEL_TARGETS
+    enumeration_strategy: str = event["enumeration_strategy"] if "enumeration_strategy" in event else FULL_SCAN
+    deadline_margin_in_ms: int = int(event["deadline_margin_in_ms"]) if "deadline_margin_in_ms" in event else DEFAULT_DEADLINE_MARGIN_IN_MS
+    if enumeration_strategy not in (FULL_SCAN, LAKE_FORMATION_SHARES):
+        raise ValueError(f"The sweep mode does not support the {enumeration_strategy} enumeration strategy")
+    if not targets:
+        return {"message": "No targets to sweep", "recreated_count": 0, "failed_count": 0, "completed": True, "targets": []}
+
+    caller_identity = clients.client("sts").get_caller_identity() if any(target.role_arn is None for target in targets) else None
+    should_stop = deadline_reached(context, deadline_margin_in_ms)
+    sweep = TargetSweep(lambda target: remediate_target(event, context, target, caller_identity, should_stop), max_parallel_targets)
+    sweep.run(targets)
+    totals = sweep.totals()
+    completed = all(result.completed for result in sweep.results)
+    message = f"Recreated {totals['recreated_count']} RAM invitations in {totals['target_count']} targets. Failed = {totals['failed_count']}, Failed targets = {totals['failed_target_count']}"
+    if not completed:
+        message = message + ". Some targets did not complete, their remaining RAM shares will be processed by the next scheduled run"
+    logger.info(message)
+    return {"message": message, **totals, "completed": completed, "targets": [result.as_dict() for result in sweep.results]}
+
+
+# The modes of the handler, see the mode parameter in the README.
+MODES: dict[str, Callable[[dict, object], dict]] = {
+    "standalone": run_standalone,
+    "incremental": run_incremental,
+    "coordinator": run_coordinator,
+    "worker": run_worker,
+    "record_events": record_invitation_events,
+    "sweep": run_sweep,
+}
+
+
+@metrics.log_metrics
+@tracer.capture_lambda_handler
+def lambda_handler(event, context):
+    """
+    Main Lambda handler. Adds the instrumentation of the run to the response and the metrics,
+    profiles the run when the event asks for it, and logs the summary of the invitations it found.
+    """
+    instrumentation.reset()
+    log_sample_rate: float = float(event["log_sample_rate"]) if "log_sample_rate" in event else DEFAULT_LOG_SAMPLE_RATE
+    log_summary_interval_in_seconds: float = float(event["log_summary_interval_in_seconds"]) if "log_summary_interval_in_seconds" in event else DEFAULT_LOG_SUMMARY_INTERVAL_IN_SECS
+    log_top_count: int = int(event["log_top_count"]) if "log_top_count" in event else DEFAULT_LOG_TOP_COUNT
+    invitation_log.reset(log_sample_rate, log_summary_interval_in_seconds, log_top_count)
+    profile = str(event["profile"]).lower() == "true" if "profile" in event else False
+    profile_path: str = event["profile_path"] if "profile_path" in event else DEFAULT_PROFILE_PATH
+    with profiled(profile_path) if profile else contextlib.nullcontext():
+        response = handle(event, context)
+    invitation_log.log_summary()
+    instrumentation.add_metrics(metrics)
+    response["instrumentation"] = instrumentation.as_dict()
+    if profile:
+        response["profile_path"] = profile_path
+    return response
+
+
+def handle(event, context):
+    """
+    Run the mode the event asks for, standalone when it does not ask for one.
+    """
+    try:
+        logger.info("Getting expired RAM invitations...")
+        mode: str = event["mode"] if "mode" in event else "standalone"
+        return MODES[mode](event, context) if mode in MODES else run_standalone(event, context)
+    except Exception as e:
         logger.error(f"Unhandled error: {e}")
-        return {
-            "error": f"Unhandled error: {e}",
-        }
+        raise
 
 
 if __name__ == "__main__":
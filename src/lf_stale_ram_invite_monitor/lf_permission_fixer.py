@@ -0,0 +1,222 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module checks the RAM shares behind Lake Formation cross account permissions, and fixes the
+shares whose invitation failed, expired, or was never sent. Every page of Lake Formation
+permissions is read and the resource shares are deduplicated before they are looked up in RAM, a
+batch of resource share arns at a time, on a bounded pool of threads. Every action is recorded, so
+the sweep can be reported as JSON or CSV.
+"""
+
+import csv
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import botocore.exceptions
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor.ram_manager import RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL, RamManager
+
+logger = Logger()
+
+DEFAULT_MAX_WORKERS = 8
+REPORT_FORMATS = ("json", "csv")
+REPORT_FIELDS = ["resource_share_arn", "account_id", "association_status", "action", "outcome", "message"]
+
+# What the fixer does for a principal of a resource share.
+ASSOCIATE = "associate"
+RECREATE = "recreate"
+SKIP = "skip"
+
+# How it went.
+DONE = "done"
+DRY_RUN = "dry_run"
+FAILED = "failed"
+MISSING = "missing"
+IGNORED = "ignored"
+
+
+def get_account_id(principal: str) -> str:
+    """
+    Returns account id from an ARN or account id.
+    """
+    # if its a direct share, get the account id
+    if principal.startswith("arn:aws:iam::"):
+        return principal.split(":")[4]
+    # else its an account id.
+    if principal.isdigit() and len(principal) == 12:
+        return principal
+    raise ValueError(f"Invalid principal: {principal}")
+
+
+class FixAction:  # pylint: disable=too-few-public-methods
+    """
+    An action taken, or skipped, for a principal of a resource share.
+    """
+
+    def __init__(self, resource_share_arn: str, account_id: str, association_status: Optional[str], action: str, outcome: str, message: str = ""):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.resource_share_arn = resource_share_arn
+        self.account_id = account_id
+        self.association_status = association_status
+        self.action = action
+        self.outcome = outcome
+        self.message = message
+
+    def as_dict(self) -> dict:
+        """
+        The action as a row of the report.
+        """
+        return {field: getattr(self, field) for field in REPORT_FIELDS}
+
+
+class LakeFormationPermissionFixer:
+    """
+    Finds the Lake Formation permissions that were shared through RAM, and re-associates the
+    principals whose invitation failed, expired, or is missing.
+    """
+
+    def __init__(self, lf_client, ram_manager: RamManager, dry_run: bool, max_workers: int = DEFAULT_MAX_WORKERS, share_index=None):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.lf_client = lf_client
+        self.ram_manager = ram_manager
+        self.dry_run = dry_run
+        self.max_workers = max(1, max_workers)
+        # A share_index.ShareIndex replaces the pass over all Lake Formation permissions when it is given.
+        self.share_index = share_index
+        self.actions: list[FixAction] = []
+        self.permission_count = 0
+
+    def get_shared_principals(self) -> dict[str, set[str]]:
+        """
+        Read every page of Lake Formation permissions, and return the accounts that were granted
+        permissions through each resource share.
+        """
+        if self.share_index is not None:
+            shared_principals = self.share_index.get_shared_principals()
+            self.permission_count = sum(len(account_ids) for account_ids in shared_principals.values())
+            logger.info(f"Found {len(shared_principals)} resource shares in the share index")
+            return shared_principals
+
+        shared_principals: dict[str, set[str]] = {}
+        paginator = self.lf_client.get_paginator("list_permissions")
+        for page in paginator.paginate():
+            for permission in page["PrincipalResourcePermissions"]:
+                if "AdditionalDetails" not in permission or "ResourceShare" not in permission["AdditionalDetails"]:
+                    continue
+                self.permission_count = self.permission_count + 1
+                principal = permission["Principal"]["DataLakePrincipalIdentifier"]
+                for resource_share_arn in permission["AdditionalDetails"]["ResourceShare"]:
+                    try:
+                        shared_principals.setdefault(resource_share_arn, set()).add(get_account_id(principal))
+                    except ValueError as e:
+                        logger.warning(f"Ignoring the permission of {principal} on resource share {resource_share_arn}: {e}")
+                        self.actions.append(FixAction(resource_share_arn, principal, None, SKIP, IGNORED, str(e)))
+
+        logger.info(f"Found {len(shared_principals)} resource shares in {self.permission_count} Lake Formation permissions")
+        return shared_principals
+
+    def run(self) -> list[FixAction]:
+        """
+        Check and fix the resource shares of all Lake Formation permissions, and return the actions.
+        """
+        shared_principals = self.get_shared_principals()
+        resource_share_arns = sorted(shared_principals)
+        batches = [resource_share_arns[i : i + RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL] for i in range(0, len(resource_share_arns), RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL)]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="lf-permission-fixer") as executor:
+            for actions in executor.map(lambda batch: self._fix_batch(batch, shared_principals), batches):
+                self.actions.extend(actions)
+
+        logger.info(f"Lake Formation permission fixer summary: {summarize(self.actions)}")
+        return self.actions
+
+    def _fix_batch(self, resource_share_arns: list[str], shared_principals: dict[str, set[str]]) -> list[FixAction]:
+        """
+        Look up the associations of a batch of resource shares in RAM and fix them one share at a time.
+        """
+        try:
+            associations = self.ram_manager.get_principal_associations(resource_share_arns)
+        except botocore.exceptions.ClientError as e:
+            logger.error(f"Failed to get the associations of {len(resource_share_arns)} resource shares: {e}")
+            return [FixAction(resource_share_arn, account_id, None, SKIP, FAILED, f"Failed to get the associations: {e}") for resource_share_arn in resource_share_arns for account_id in sorted(shared_principals[resource_share_arn])]
+
+        actions: list[FixAction] = []
+        for resource_share_arn in resource_share_arns:
+            actions.extend(self._fix_share(resource_share_arn, shared_principals[resource_share_arn], associations.get(resource_share_arn, [])))
+        return actions
+
+    def _fix_share(self, resource_share_arn: str, account_ids: set[str], associations: list[dict]) -> list[FixAction]:
+        """
+        Decide what each account needs, then associate the accounts without an invitation and
+        recreate the failed and expired invitations.
+        """
+        associations_by_account = {association["associatedEntity"]: association for association in sorted(associations, key=lambda association: association["creationTime"])}
+        planned: dict[str, list[tuple[str, Optional[str]]]] = {ASSOCIATE: [], RECREATE: []}
+        actions: list[FixAction] = []
+        for account_id in sorted(account_ids):
+            association = associations_by_account.get(account_id)
+            status = association["status"] if association is not None else None
+            if association is None and associations:
+                logger.warning(f"Principal {account_id} does not match the associated entities of resource share {resource_share_arn}. Ignoring for now.")
+                actions.append(FixAction(resource_share_arn, account_id, status, SKIP, IGNORED, "The principal is not associated with the resource share"))
+            elif association is None or status == "DISASSOCIATED":
+                planned[ASSOCIATE].append((account_id, status))
+            elif status == "FAILED" or (status == "ASSOCIATING" and self.ram_manager.is_expired(association)):
+                planned[RECREATE].append((account_id, status))
+
+        for action, principals in planned.items():
+            if principals:
+                actions.extend(self._apply(resource_share_arn, action, principals))
+        return actions
+
+    def _apply(self, resource_share_arn: str, action: str, principals: list[tuple[str, Optional[str]]]) -> list[FixAction]:
+        """
+        Associate or recreate the invitations of the principals of a resource share.
+        """
+        account_ids = [account_id for account_id, _status in principals]
+        if self.dry_run:
+            logger.info(f"[Dry Run] Would {action} {account_ids} for resource share {resource_share_arn}")
+            return [FixAction(resource_share_arn, account_id, status, action, DRY_RUN) for account_id, status in principals]
+
+        outcome, message = DONE, ""
+        disassociated = False
+        try:
+            if action == RECREATE:
+                self.ram_manager.deassociate_account_from_ram_share(resource_share_arn, account_ids)
+                disassociated = True
+            self.ram_manager.associate_account_with_ram_share(resource_share_arn, account_ids)
+            logger.info(f"Successfully {'recreated' if action == RECREATE else 'associated'} {account_ids} for resource share {resource_share_arn}")
+        except self.ram_manager.ram_client.exceptions.UnknownResourceException:
+            logger.warning(f"Ram Share {resource_share_arn} doesn't exist. Ignoring for now.")
+            outcome, message = MISSING, "The resource share does not exist"
+        except botocore.exceptions.ClientError as e:
+            logger.error(f"Failed to {action} {account_ids} for resource share {resource_share_arn}: {e}")
+            outcome, message = FAILED, (f"Disassociated but not re-associated, needs manual action: {e}" if disassociated else str(e))
+        return [FixAction(resource_share_arn, account_id, status, action, outcome, message) for account_id, status in principals]
+
+
+def summarize(actions: list[FixAction]) -> dict[str, int]:
+    """
+    Number of principals per action and outcome, like {"recreate:done": 10}.
+    """
+    return dict(sorted(Counter(f"{action.action}:{action.outcome}" for action in actions).items()))
+
+
+def write_report(actions: list[FixAction], path: str, report_format: Optional[str] = None):
+    """
+    Write the actions as JSON, with a summary, or as CSV. The format defaults to the file extension.
+    """
+    report_format = report_format or ("csv" if path.lower().endswith(".csv") else "json")
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format {report_format}, expected one of {REPORT_FORMATS}")
+
+    with open(path, "w", encoding="utf-8", newline="") as report_file:
+        if report_format == "json":
+            json.dump({"summary": summarize(actions), "actions": [action.as_dict() for action in actions]}, report_file, indent=2)
+        else:
+            writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(action.as_dict() for action in actions)
+    logger.info(f"Wrote a {report_format} report of {len(actions)} actions to {path}")
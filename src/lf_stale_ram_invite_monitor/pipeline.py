@@ -0,0 +1,103 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module streams the resource shares that need their RAM invitations recreated. Resource shares
+that failed on a previous run are read from DDB first, followed by the expired invitations as RAM
+returns them page by page, so remediation can start before the enumeration has finished. The
+stream keeps track of where it is in the RAM pages, so a run that is stopped early can be resumed
+from a checkpoint. As a page can hold no expired invitation at all, the stream checks whether the
+run has to stop before every page it reads, instead of leaving it to the consumer.
+"""
+
+from collections import deque
+from typing import Callable, Iterator, Optional
+
+import botocore.exceptions
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+
+class ExpiredShareStream:  # pylint: disable=too-many-instance-attributes
+    """
+    Iterates over (resource share arn, principals, previously failed) for every resource share that
+    needs to be remediated. Principals that are retried from DDB are not yielded again when RAM
+    reports them as expired, so only the retry backlog and a single RAM page are kept in memory.
+    """
+
+    def __init__(self, ram_manager, ddb_manager, checkpoint: Optional[dict] = None, should_stop: Optional[Callable[[], bool]] = None):
+        self.ram_manager = ram_manager
+        self.ddb_manager = ddb_manager
+        self.should_stop = should_stop
+        self.cursor: Optional[dict] = checkpoint["cursor"] if checkpoint else None
+        self.last_page_read: bool = checkpoint["last_page_read"] if checkpoint else False
+        self.pending: deque[tuple[str, set[str]]] = deque((resource_share_arn, set(aws_account_ids)) for resource_share_arn, aws_account_ids in checkpoint["pending"]) if checkpoint else deque()
+        self.exhausted = False
+        self.stopped_early = False
+
+    def checkpoint(self) -> dict:
+        """
+        The position in the RAM pages and the shares that were read but not handed out yet.
+        """
+        return {"cursor": self.cursor, "last_page_read": self.last_page_read, "pending": [[resource_share_arn, sorted(aws_account_ids)] for resource_share_arn, aws_account_ids in self.pending]}
+
+    def __iter__(self) -> Iterator[tuple[str, set[str], bool]]:
+        retried_accounts: dict[str, set[str]] = {}
+        for resource_share_arn, aws_account_ids in self.ddb_manager.iter_previously_failed_accounts_for_resource_share():
+            retried_accounts[resource_share_arn] = aws_account_ids
+            yield resource_share_arn, aws_account_ids, True
+
+        logger.info(f"Retrying {len(retried_accounts)} resource shares from DDB")
+
+        # Shares left over from the page a previous run stopped in.
+        yield from self._drain_pending(retried_accounts)
+
+        if not self.last_page_read:
+            yield from self._iter_ram_pages(retried_accounts)
+
+        self.exhausted = not self.stopped_early
+
+    def _iter_ram_pages(self, retried_accounts: dict[str, set[str]]) -> Iterator[tuple[str, set[str], bool]]:
+        """
+        Page through RAM from the current cursor. A cursor that RAM no longer accepts restarts the enumeration.
+        """
+        resumed = self.cursor is not None
+        try:
+            for page, cursor in self._pages_until_stopped(self.ram_manager.iter_new_expired_ram_invitations(self.cursor)):
+                resumed = False
+                self.pending.extend(page.items())
+                self.cursor = cursor
+                self.last_page_read = cursor is None
+                yield from self._drain_pending(retried_accounts)
+        except botocore.exceptions.ClientError as e:
+            if not resumed or e.response.get("Error", {}).get("Code") != "InvalidNextTokenException":
+                raise
+            logger.warning(f"Checkpoint cursor is no longer valid, starting from the first RAM page: {e}")
+            self.cursor = None
+            yield from self._iter_ram_pages(retried_accounts)
+
+    def _pages_until_stopped(self, pages: Iterator) -> Iterator:
+        """
+        Hand out the RAM pages until `should_stop` returns True, checked before every page. The
+        stream then ends, and the cursor points at the first page that was not read.
+        """
+        while True:
+            if self.should_stop is not None and self.should_stop():
+                self.stopped_early = True
+                logger.info("Stopping early, no more RAM pages will be read in this run")
+                return
+            try:
+                yield next(pages)
+            except StopIteration:
+                return
+
+    def _drain_pending(self, retried_accounts: dict[str, set[str]]) -> Iterator[tuple[str, set[str], bool]]:
+        """
+        Hand out the shares of the current page one at a time, so whatever is left can be checkpointed.
+        """
+        while self.pending:
+            resource_share_arn, aws_account_ids = self.pending.popleft()
+            new_aws_account_ids = aws_account_ids - retried_accounts.get(resource_share_arn, set())
+            if new_aws_account_ids:
+                yield resource_share_arn, new_aws_account_ids, False
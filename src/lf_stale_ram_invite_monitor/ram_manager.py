@@ -6,58 +6,259 @@ This module contains RAM related classes and functions.
 """
 
 import time
+from typing import Iterator, Optional
 
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor.instrumentation import instrumentation
+from lf_stale_ram_invite_monitor.invitation_log import DRY_RUN_ASSOCIATE, DRY_RUN_DISASSOCIATE, invitation_log
 
 logger = Logger()
-tracer = Tracer()
 
+# Number of principals that are sent to RAM in a single associate/disassociate call.
+RAM_MAX_PRINCIPALS_PER_CALL = 10
+# Number of resource share arns that are sent to RAM in a single get_resource_share_associations call.
+RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL = 20
+
+LAKE_FORMATION_SHARE_PREFIX = "LakeFormation-"
+
+# `full_scan` pages through every associating principal association in the account. `lake_formation_shares`
+# first lists the Lake Formation resource shares, and only asks for the associations of those shares.
+FULL_SCAN = "full_scan"
+LAKE_FORMATION_SHARES = "lake_formation_shares"
+ENUMERATION_STRATEGIES = (FULL_SCAN, LAKE_FORMATION_SHARES)
+# `share_index` enumerates the Lake Formation shares of the persisted share index, see share_index.py.
+SHARE_INDEX = "share_index"
+DEFAULT_SHARE_CACHE_TTL_IN_SECS = 15 * 60
+
+# (Account id or None for the account of the function, region) -> (time the shares were listed, Lake Formation resource
+# share arn -> last update in epoch). Kept across warm invocations.
+_lake_formation_share_cache: dict[tuple[Optional[str], str], tuple[float, dict[str, float]]] = {}
+
+
+class EnumerationOptions:  # pylint: disable=too-few-public-methods
+    """
+    How a RamManager finds the associating invitations, see the enumeration strategies above.
+    """
+
+    def __init__(self, strategy: str = FULL_SCAN, share_cache_ttl_in_secs: int = DEFAULT_SHARE_CACHE_TTL_IN_SECS, share_arns: Optional[list[str]] = None, account_id: Optional[str] = None):
+        if strategy not in ENUMERATION_STRATEGIES:
+            raise ValueError(f"Unknown enumeration strategy {strategy}, expected one of {ENUMERATION_STRATEGIES}")
+        self.strategy = strategy
+        self.share_cache_ttl_in_secs = share_cache_ttl_in_secs
+        # Lake Formation resource share arns that are known already, for example from the share index.
+        self.share_arns = share_arns
+        # The account of the resource shares when it is not the account of the function, for the share cache.
+        self.account_id = account_id
 
-class RamManager:  # pylint: disable=too-few-public-methods
+
+class RamManager:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
     """
     This class interacts with AWS RAM.
     """
 
-    def __init__(self, ram_client, timeout_in_secs: int, dry_run: bool):
+    def __init__(self, ram_client, timeout_in_secs: int, dry_run: bool, max_principals_per_call: int = RAM_MAX_PRINCIPALS_PER_CALL, enumeration: Optional[EnumerationOptions] = None):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        enumeration = enumeration if enumeration is not None else EnumerationOptions()
         self.ram_client = ram_client
+        self.timeout_in_secs = timeout_in_secs
         self.timeout_timestamp = int(time.time()) - timeout_in_secs
+        # The earliest time in epoch an associating invitation that was read will reach the timeout.
+        self.next_expiry_at: Optional[int] = None
         self.dry_run = dry_run
+        self.max_principals_per_call = max(1, max_principals_per_call)
+        self.enumeration_strategy = enumeration.strategy
+        self.share_cache_ttl_in_secs = enumeration.share_cache_ttl_in_secs
+        self.share_arns = sorted(enumeration.share_arns) if enumeration.share_arns is not None else None
+        self.account_id = enumeration.account_id
+        self.pages_fetched = 0
+        instrumentation.instrument_client(ram_client)
         logger.info(f"Using {timeout_in_secs} seconds as the timeout for RAM invitations")
 
-    def get_new_expired_ram_invitations(self) -> dict[str, list[dict]]:
+    def _page_fetched(self):
         """
-        Get a list of share share arnsa that have associating resources that are still in
-        associating state.
+        Count a page that was read from RAM.
         """
-        expired_invitations: dict[str, list[str]] = {}
-        paginator = self.ram_client.get_paginator("get_resource_share_associations")
-        page_iterator = paginator.paginate(associationType="PRINCIPAL", associationStatus="ASSOCIATING")
+        self.pages_fetched = self.pages_fetched + 1
+        instrumentation.increment("pages_fetched")
+
+    def get_new_expired_ram_invitations(self) -> dict[str, set[str]]:
+        """
+        Get the principals of every resource share that are still in associating state after the
+        timeout, grouped by resource share arn.
+        """
+        expired_invitations: dict[str, set[str]] = {}
+        for page, _cursor in self.iter_new_expired_ram_invitations():
+            for resource_share_arn, aws_account_ids in page.items():
+                expired_invitations.setdefault(resource_share_arn, set()).update(aws_account_ids)
+        return expired_invitations
+
+    def iter_new_expired_ram_invitations(self, cursor: Optional[dict] = None) -> Iterator[tuple[dict[str, set[str]], Optional[dict]]]:
+        """
+        Yield the expired principals of every page of associating invitations as soon as the page
+        is returned by RAM, grouped by resource share arn, together with the cursor to continue
+        after that page. The cursor is None after the last page. A resource share can show up in
+        more than one page.
+        """
+        if cursor is not None and (cursor["strategy"] if "strategy" in cursor else FULL_SCAN) != self.enumeration_strategy:
+            logger.info(f"Ignoring a cursor of the {cursor.get('strategy', FULL_SCAN)} strategy, starting from the first RAM page")
+            cursor = None
 
         logger.info(f"Looking for invitations that are older than {self.timeout_timestamp} seconds in epoch")
 
+        if self.enumeration_strategy == LAKE_FORMATION_SHARES:
+            yield from self._iter_lake_formation_share_associations(cursor)
+            return
+
+        paginator = self.ram_client.get_paginator("get_resource_share_associations")
+        pagination_config = {"StartingToken": cursor["next_token"]} if cursor and cursor.get("next_token") else {}
+        page_iterator = paginator.paginate(associationType="PRINCIPAL", associationStatus="ASSOCIATING", PaginationConfig=pagination_config)
+
         for page in page_iterator:
-            for invitation in page["resourceShareAssociations"]:
-                invite_ts = invitation["creationTime"].timestamp()
-                if invitation["resourceShareName"].startswith("LakeFormation-") and int(self.timeout_timestamp) > int(invite_ts):
-                    logger.info(f"Found Invitation for expiration: {invitation['resourceShareName']} that was created at {invite_ts} epoch ({time.time() - invite_ts} )")
-                    expired_invitations[invitation["resourceShareArn"]] = invitation["associatedEntity"]
+            self._page_fetched()
+            yield self._get_expired_invitations(page), {"strategy": FULL_SCAN, "next_token": page["nextToken"]} if page.get("nextToken") else None
 
+    def _iter_lake_formation_share_associations(self, cursor: Optional[dict]) -> Iterator[tuple[dict[str, set[str]], Optional[dict]]]:
+        """
+        Page through the associating invitations of the Lake Formation resource shares only, a
+        batch of resource share arns at a time.
+        """
+        resource_share_arns = self.get_lake_formation_share_arns()
+        batches = [resource_share_arns[i : i + RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL] for i in range(0, len(resource_share_arns), RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL)]
+        paginator = self.ram_client.get_paginator("get_resource_share_associations")
+        first_batch = cursor["batch"] if cursor else 0
+
+        for batch_index in range(first_batch, len(batches)):
+            pagination_config = {"StartingToken": cursor["next_token"]} if cursor and batch_index == first_batch and cursor.get("next_token") else {}
+            page_iterator = paginator.paginate(associationType="PRINCIPAL", associationStatus="ASSOCIATING", resourceShareArns=batches[batch_index], PaginationConfig=pagination_config)
+            for page in page_iterator:
+                self._page_fetched()
+                if page.get("nextToken"):
+                    next_cursor: Optional[dict] = {"strategy": LAKE_FORMATION_SHARES, "batch": batch_index, "next_token": page["nextToken"]}
+                elif batch_index + 1 < len(batches):
+                    next_cursor = {"strategy": LAKE_FORMATION_SHARES, "batch": batch_index + 1, "next_token": None}
+                else:
+                    next_cursor = None
+                yield self._get_expired_invitations(page), next_cursor
+
+    def get_lake_formation_share_arns(self) -> list[str]:
+        """
+        Get the sorted arns of the active Lake Formation resource shares owned by this account.
+        """
+        if self.share_arns is not None:
+            return self.share_arns
+        # Sorted, so a cursor that points to a batch stays meaningful when the cache is rebuilt.
+        return sorted(self.get_lake_formation_shares())
+
+    def get_lake_formation_shares(self) -> dict[str, float]:
+        """
+        Get the active Lake Formation resource shares owned by this account, with the time of
+        their last update in epoch. The shares are cached for `share_cache_ttl_in_secs` across
+        warm invocations.
+        """
+        cache_key = (self.account_id, self.ram_client.meta.region_name)
+        if cache_key in _lake_formation_share_cache:
+            listed_at, resource_shares = _lake_formation_share_cache[cache_key]
+            if time.time() - listed_at < self.share_cache_ttl_in_secs:
+                return resource_shares
+
+        resource_shares = {}
+        paginator = self.ram_client.get_paginator("get_resource_shares")
+        for page in paginator.paginate(resourceOwner="SELF", resourceShareStatus="ACTIVE"):
+            self._page_fetched()
+            for resource_share in page["resourceShares"]:
+                if resource_share["name"].startswith(LAKE_FORMATION_SHARE_PREFIX):
+                    resource_shares[resource_share["resourceShareArn"]] = resource_share["lastUpdatedTime"].timestamp() if "lastUpdatedTime" in resource_share else 0.0
+
+        _lake_formation_share_cache[cache_key] = (time.time(), resource_shares)
+        logger.info(f"Found {len(resource_shares)} Lake Formation resource shares")
+        return resource_shares
+
+    def get_shared_resource_arns(self, resource_share_arns: list[str]) -> dict[str, list[str]]:
+        """
+        Get the arns of the resources, like Glue databases and tables, that are shared by the
+        given resource shares, asking for RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL resource shares at a time.
+        """
+        resources: dict[str, list[str]] = {resource_share_arn: [] for resource_share_arn in resource_share_arns}
+        paginator = self.ram_client.get_paginator("list_resources")
+        for i in range(0, len(resource_share_arns), RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL):
+            for page in paginator.paginate(resourceOwner="SELF", resourceShareArns=resource_share_arns[i : i + RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL]):
+                self._page_fetched()
+                for resource in page["resources"]:
+                    resources.setdefault(resource["resourceShareArn"], []).append(resource["arn"])
+        return resources
+
+    def _get_expired_invitations(self, page: dict) -> dict[str, set[str]]:
+        """
+        The principals of a page of associations that are still associating after the timeout, grouped by resource share arn.
+        """
+        expired_invitations: dict[str, set[str]] = {}
+        for invitation in page["resourceShareAssociations"]:
+            invite_ts = invitation["creationTime"].timestamp()
+            if not invitation["resourceShareName"].startswith(LAKE_FORMATION_SHARE_PREFIX):
+                continue
+            if self.is_expired(invitation):
+                invitation_log.expired_invitation(invitation, invite_ts)
+                expired_invitations.setdefault(invitation["resourceShareArn"], set()).add(invitation["associatedEntity"])
+            else:
+                # The pages only hold associating invitations.
+                expiry_at = int(invite_ts) + self.timeout_in_secs
+                self.next_expiry_at = expiry_at if self.next_expiry_at is None else min(self.next_expiry_at, expiry_at)
         return expired_invitations
 
-    def deassociate_account_from_ram_share(self, resource_share_arn: str, aws_account_id: str):
+    def is_expired(self, association: dict) -> bool:
+        """
+        Returns True if the association was created before the timeout.
+        """
+        return int(self.timeout_timestamp) > int(association["creationTime"].timestamp())
+
+    def get_principal_associations(self, resource_share_arns: list[str]) -> dict[str, list[dict]]:
+        """
+        Get the principal associations in any status of the given resource shares, grouped by
+        resource share arn, asking for RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL resource shares at a time.
+        """
+        associations: dict[str, list[dict]] = {resource_share_arn: [] for resource_share_arn in resource_share_arns}
+        paginator = self.ram_client.get_paginator("get_resource_share_associations")
+        for i in range(0, len(resource_share_arns), RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL):
+            for page in paginator.paginate(associationType="PRINCIPAL", resourceShareArns=resource_share_arns[i : i + RAM_MAX_RESOURCE_SHARE_ARNS_PER_CALL]):
+                self._page_fetched()
+                for association in page["resourceShareAssociations"]:
+                    associations.setdefault(association["resourceShareArn"], []).append(association)
+        return associations
+
+    def get_principal_invitations(self, principal: str) -> list[dict]:
+        """
+        Get the associating invitations of a principal to the Lake Formation resource shares of this account.
+        """
+        invitations = []
+        paginator = self.ram_client.get_paginator("get_resource_share_associations")
+        for page in paginator.paginate(associationType="PRINCIPAL", principal=principal, associationStatus="ASSOCIATING"):
+            self._page_fetched()
+            invitations.extend(association for association in page["resourceShareAssociations"] if association["resourceShareName"].startswith(LAKE_FORMATION_SHARE_PREFIX))
+        return invitations
+
+    def batch_principals(self, principals) -> list[list[str]]:
+        """
+        Split the principals in batches that fit in a single RAM call.
+        """
+        sorted_principals = sorted(principals)
+        return [sorted_principals[i : i + self.max_principals_per_call] for i in range(0, len(sorted_principals), self.max_principals_per_call)]
+
+    def deassociate_account_from_ram_share(self, resource_share_arn: str, aws_account_ids):
         """
-        Deassociate the given account from the given RAM share.
+        Deassociate the given accounts from the given RAM share.
         """
-        if self.dry_run:
-            self.ram_client.disassociate_resource_share(resourceShareArn=resource_share_arn, principals=[aws_account_id])
-        else:
-            logger.info(f"[Dry Run] Would have disassociated {aws_account_id} from {resource_share_arn}")
+        for principals in self.batch_principals(aws_account_ids):
+            if not self.dry_run:
+                self.ram_client.disassociate_resource_share(resourceShareArn=resource_share_arn, principals=principals)
+            else:
+                invitation_log.dry_run_action(DRY_RUN_DISASSOCIATE, resource_share_arn, principals)
 
-    def associate_account_with_ram_share(self, resource_share_arn: str, aws_account_id: str):
+    def associate_account_with_ram_share(self, resource_share_arn: str, aws_account_ids):
         """
-        Associate the given account with the given RAM share.
+        Associate the given accounts with the given RAM share.
         """
-        if self.dry_run:
-            self.ram_client.associate_resource_share(resourceShareArn=resource_share_arn, principals=[aws_account_id])
-        else:
-            logger.info(f"[Dry Run] Would have associated {aws_account_id} with {resource_share_arn}")
+        for principals in self.batch_principals(aws_account_ids):
+            if not self.dry_run:
+                self.ram_client.associate_resource_share(resourceShareArn=resource_share_arn, principals=principals)
+            else:
+                invitation_log.dry_run_action(DRY_RUN_ASSOCIATE, resource_share_arn, principals)
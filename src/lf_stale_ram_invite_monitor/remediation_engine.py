@@ -0,0 +1,301 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module contains a bounded worker pool that recreates expired RAM invitations concurrently.
+Within a resource share the principal is always disassociated before it is re-associated, but
+different resource shares are processed in parallel. The number of shares in flight grows and
+shrinks based on RAM throttling responses (additive increase, multiplicative decrease).
+"""
+
+import functools
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Optional
+
+import botocore.exceptions
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+# botocore keeps 10 connections per client by default, going beyond that only queues requests.
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_MAX_THROTTLE_RETRIES = 5
+THROTTLE_BACKOFF_BASE_IN_SECS = 0.2
+THROTTLE_BACKOFF_CAP_IN_SECS = 5.0
+# Throttles that arrive within this window of a decrease are treated as the same congestion event.
+DECREASE_COOLDOWN_IN_SECS = 1.0
+
+THROTTLING_ERROR_CODES = {"ThrottlingException", "Throttling", "TooManyRequestsException", "RequestLimitExceeded", "SlowDown"}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """
+    Returns True if the given exception is a throttling response from an AWS API.
+    """
+    return isinstance(error, botocore.exceptions.ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+
+
+class AimdConcurrencyLimiter:  # pylint: disable=too-many-instance-attributes
+    """
+    Limits the number of resource shares in flight. The limit grows by one for every window of
+    successful calls, and is halved when RAM throttles us.
+    """
+
+    def __init__(self, initial_limit: int, min_limit: int, max_limit: int):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.peak_limit = self.limit
+        self.throttle_count = 0
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Block until a slot is available under the current limit.
+        """
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight = self._in_flight + 1
+
+    def release(self):
+        """
+        Give a slot back.
+        """
+        with self._condition:
+            self._in_flight = self._in_flight - 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        """
+        Additive increase: one extra slot after `limit` successful calls.
+        """
+        with self._condition:
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self):
+        """
+        Multiplicative decrease: halve the limit, at most once per cooldown window.
+        """
+        with self._condition:
+            self.throttle_count = self.throttle_count + 1
+            now = time.monotonic()
+            if now - self._last_decrease >= DECREASE_COOLDOWN_IN_SECS:
+                self.limit = max(float(self.min_limit), self.limit / 2.0)
+                self._last_decrease = now
+                logger.info(f"RAM is throttling, reducing concurrency to {int(self.limit)}")
+
+
+class RemediationSummary:  # pylint: disable=too-many-instance-attributes
+    """
+    Counts and throughput of a single remediation run.
+    """
+
+    def __init__(self):
+        self.recreated_count = 0
+        self.failed_count = 0
+        self.missing_count = 0
+        self.share_count = 0
+        self.stopped_early = False
+        self.started_at = time.monotonic()
+        self.elapsed_in_secs = 0.0
+        self.throttled_count = 0
+        self.peak_concurrency = 0
+        self.final_concurrency = 0
+        # Resource share arn -> principals that were re-associated, for the verification phase.
+        self.recreated_shares: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str, count: int = 1):
+        """
+        Record the outcome for `count` invitations.
+        """
+        with self._lock:
+            if outcome == "recreated":
+                self.recreated_count = self.recreated_count + count
+            elif outcome == "failed":
+                self.failed_count = self.failed_count + count
+            else:
+                self.missing_count = self.missing_count + count
+
+    def record_recreated_share(self, resource_share_arn: str, aws_account_ids: set[str]):
+        """
+        Record the principals of a resource share that were re-associated.
+        """
+        with self._lock:
+            self.recreated_shares.setdefault(resource_share_arn, set()).update(aws_account_ids)
+
+    def record_share(self):
+        """
+        Record that a resource share was processed.
+        """
+        with self._lock:
+            self.share_count = self.share_count + 1
+
+    @property
+    def processed_count(self) -> int:
+        """
+        Number of invitations that were processed, regardless of the outcome.
+        """
+        return self.recreated_count + self.failed_count + self.missing_count
+
+    def finish(self, limiter: AimdConcurrencyLimiter):
+        """
+        Stop the clock and take a snapshot of the concurrency limiter.
+        """
+        self.elapsed_in_secs = time.monotonic() - self.started_at
+        self.throttled_count = limiter.throttle_count
+        self.peak_concurrency = int(limiter.peak_limit)
+        self.final_concurrency = int(limiter.limit)
+
+    def throughput(self) -> dict:
+        """
+        Throughput figures that can be used to tune the pool size.
+        """
+        shares_per_second = self.share_count / self.elapsed_in_secs if self.elapsed_in_secs > 0 else 0.0
+        invitations_per_second = self.processed_count / self.elapsed_in_secs if self.elapsed_in_secs > 0 else 0.0
+        return {
+            "processed_count": self.processed_count,
+            "share_count": self.share_count,
+            "elapsed_in_secs": round(self.elapsed_in_secs, 3),
+            "shares_per_second": round(shares_per_second, 2),
+            "invitations_per_second": round(invitations_per_second, 2),
+            "throttled_count": self.throttled_count,
+            "peak_concurrency": self.peak_concurrency,
+            "final_concurrency": self.final_concurrency,
+        }
+
+
+class RemediationEngine:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Recreates RAM invitations for expired resource shares on a bounded pool of worker threads.
+    """
+
+    def __init__(self, ram_manager, ddb_manager, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_throttle_retries: int = DEFAULT_MAX_THROTTLE_RETRIES):
+        self.ram_manager = ram_manager
+        self.ddb_manager = ddb_manager
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_throttle_retries = max_throttle_retries
+        # Start at half the pool and let AIMD find the rate RAM is willing to accept.
+        self.limiter = AimdConcurrencyLimiter(max(1, self.max_concurrency // 2), 1, self.max_concurrency)
+        self.summary = RemediationSummary()
+        self._fatal_error = None
+        self._in_flight_shares: dict[str, Future] = {}
+        self._in_flight_lock = threading.Lock()
+
+    def remediate(self, expired_ram_shares: Iterable[tuple[str, set[str], bool]], should_stop: Optional[Callable[[], bool]] = None) -> RemediationSummary:
+        """
+        Disassociate and re-associate every (resource share arn, principals, previously failed)
+        and return the run summary. The iterable is consumed lazily, no faster than the pool can
+        take new work, so it can be a stream of RAM pages. When `should_stop` returns True no new
+        shares are taken from the iterable, and the shares in flight are finished.
+        """
+        self.summary = RemediationSummary()
+        self._fatal_error = None
+        logger.info(f"Remediating RAM shares with up to {self.max_concurrency} workers")
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ram-remediation") as executor:
+            expired_ram_shares_iterator = iter(expired_ram_shares)
+            while True:
+                self.limiter.acquire()
+                # Check before taking the next share, so a share is never taken from the stream and then dropped.
+                if should_stop is not None and should_stop():
+                    self.limiter.release()
+                    self.summary.stopped_early = True
+                    logger.info("Stopping early, no new RAM shares will be remediated in this run")
+                    break
+                try:
+                    resource_share_arn, aws_account_ids, previously_failed = next(expired_ram_shares_iterator)
+                except StopIteration:
+                    self.limiter.release()
+                    break
+                with self._in_flight_lock:
+                    # The same share can be streamed more than once, RAM calls for it must not overlap.
+                    previous = self._in_flight_shares.get(resource_share_arn)
+                    future = executor.submit(self._remediate_share, resource_share_arn, aws_account_ids, previously_failed, previous)
+                    self._in_flight_shares[resource_share_arn] = future
+                future.add_done_callback(functools.partial(self._on_share_done, resource_share_arn))
+
+        # Write the retry queue changes of the shares that did not fill a whole batch.
+        self.ddb_manager.flush()
+        self.summary.finish(self.limiter)
+        logger.info(f"Remediation throughput: {self.summary.throughput()}")
+        if self._fatal_error is not None:
+            # Principals were disassociated but could not be saved for a retry, this needs manual action.
+            raise self._fatal_error
+        return self.summary
+
+    def _on_share_done(self, resource_share_arn: str, future: Future):
+        """
+        Free the slot of a finished resource share and keep the first unexpected error.
+        """
+        with self._in_flight_lock:
+            if self._in_flight_shares.get(resource_share_arn) is future:
+                del self._in_flight_shares[resource_share_arn]
+        self.limiter.release()
+        if future.exception() is not None and self._fatal_error is None:
+            self._fatal_error = future.exception()
+
+    def _call_with_throttle_retry(self, operation, resource_share_arn: str, aws_account_ids: list[str]):
+        """
+        Call a RAM operation, backing off and shrinking the pool while RAM throttles us.
+        """
+        attempt = 0
+        while True:
+            try:
+                operation(resource_share_arn, aws_account_ids)
+                self.limiter.on_success()
+                return
+            except botocore.exceptions.ClientError as e:
+                if not is_throttling_error(e) or attempt >= self.max_throttle_retries:
+                    raise
+                self.limiter.on_throttle()
+                # Full jitter, so that throttled workers do not retry in lock step.
+                time.sleep(random.uniform(0, min(THROTTLE_BACKOFF_CAP_IN_SECS, THROTTLE_BACKOFF_BASE_IN_SECS * 2**attempt)))  # nosec B311
+                attempt = attempt + 1
+
+    def _remediate_share(self, resource_share_arn: str, aws_account_ids: set[str], previously_failed: bool, previous: Optional[Future] = None):
+        """
+        Recreate the RAM invitations of a single resource share, one batch of principals at a time.
+        """
+        if previous is not None:
+            wait([previous])
+        self.summary.record_share()
+        recreated: set[str] = set()
+        failed_to_reassociate: set[str] = set()
+        try:
+            for principals in self.ram_manager.batch_principals(aws_account_ids):
+                self._call_with_throttle_retry(self.ram_manager.deassociate_account_from_ram_share, resource_share_arn, principals)
+                try:
+                    self._call_with_throttle_retry(self.ram_manager.associate_account_with_ram_share, resource_share_arn, principals)
+                    recreated.update(principals)
+                except Exception as e:  # pylint: disable=broad-except
+                    # Any error, like a read timeout, leaves the batch disassociated, so it is queued for a retry.
+                    logger.error(f"ERROR: Failed to reassociate RAM invite for {principals} for RAM Resource: {resource_share_arn}: {e}")
+                    failed_to_reassociate.update(principals)
+        except self.ram_manager.ram_client.exceptions.UnknownResourceException:
+            logger.info(f"Resource share {resource_share_arn} no longer exists. Removing from DDB.")
+            self.summary.record("missing", len(aws_account_ids))
+            if previously_failed:
+                self.ddb_manager.remove_resource_share_from_ddb(resource_share_arn)
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Failed to process RAM share for accounts {aws_account_ids} for {resource_share_arn}: {e}")
+            self.summary.record("failed", len(aws_account_ids) - len(recreated) - len(failed_to_reassociate))
+
+        self.summary.record("recreated", len(recreated))
+        if recreated:
+            self.summary.record_recreated_share(resource_share_arn, recreated)
+        if previously_failed and len(recreated) + len(failed_to_reassociate) == len(aws_account_ids):
+            self.ddb_manager.remove_resource_share_from_ddb(resource_share_arn)
+        if failed_to_reassociate:
+            # These principals have been disassociated already, so they have to be retried on the next run.
+            self.ddb_manager.add_resource_share_to_ddb(resource_share_arn, failed_to_reassociate)
+            self.summary.record("failed", len(failed_to_reassociate))
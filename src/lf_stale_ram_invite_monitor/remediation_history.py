@@ -0,0 +1,135 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module keeps the remediation history of the resource shares, so invitations that are never
+accepted are not recreated on every run. Every recreated resource share is saved in DDB with the
+time it was last recreated and the number of times in a row it was recreated. Resource shares that
+were recreated within the cooldown are skipped, and resource shares that reached the cycle limit
+are parked and reported instead. Both only apply to newly expired invitations, principals that
+are retried from DDB were disassociated already and always need to be re-associated.
+"""
+
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor.ddb_manager import HISTORY_TTL_IN_SECS
+
+logger = Logger()
+
+# 0 turns the cooldown and the cycle limit off.
+DEFAULT_CHURN_COOLDOWN_IN_SECS = 0
+DEFAULT_MAX_RECREATE_CYCLES = 0
+# Warm invocations only read the history that was written since their last load. The index is eventually
+# consistent, so they go back a little further.
+HISTORY_LOAD_OVERLAP_IN_SECS = 5 * 60
+# Number of parked resource shares that are listed in the handler response.
+MAX_REPORTED_PARKED_SHARES = 100
+
+RECREATE = "recreate"
+COOLDOWN = "cooldown"
+PARKED = "parked"
+
+# (Table name, resource share arn prefix) -> (time the history was loaded, resource share arn -> (last recreated at in epoch,
+# cycle count)). Kept across warm invocations.
+_history_cache: dict[tuple[str, Optional[str]], tuple[int, dict[str, tuple[int, int]]]] = {}
+
+
+class RemediationHistory:  # pylint: disable=too-many-instance-attributes
+    """
+    The remediation history of the resource shares of a DDB manager, and the resource shares it
+    suppressed in this run.
+    """
+
+    def __init__(self, ddb_manager, cooldown_in_secs: int = DEFAULT_CHURN_COOLDOWN_IN_SECS, max_cycles: int = DEFAULT_MAX_RECREATE_CYCLES):
+        self.ddb_manager = ddb_manager
+        self.cooldown_in_secs = cooldown_in_secs
+        self.max_cycles = max_cycles
+        self.entries: dict[str, tuple[int, int]] = {}
+        self.cooldown_count = 0
+        # Resource share arn -> principals that were not recreated because the resource share is parked.
+        self.parked_shares: dict[str, set[str]] = {}
+        # Number of history items that were read from DDB by the last load.
+        self.read_count = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Read the history from DDB. Warm invocations start from the cached history and only read
+        what was written since it was loaded.
+        """
+        now = int(time.time())
+        cache_key = (self.ddb_manager.ddb_table_name, self.ddb_manager.resource_share_arn_prefix)
+        loaded_at, entries = _history_cache.get(cache_key, (0, {}))
+        recreated_since = loaded_at - HISTORY_LOAD_OVERLAP_IN_SECS if loaded_at else 0
+        entries = {resource_share_arn: entry for resource_share_arn, entry in entries.items() if entry[0] + HISTORY_TTL_IN_SECS > now}
+        self.read_count = 0
+        for resource_share_arn, last_recreated_at, cycle_count in self.ddb_manager.iter_remediation_history(recreated_since):
+            self.read_count = self.read_count + 1
+            if resource_share_arn not in entries or entries[resource_share_arn][0] <= last_recreated_at:
+                entries[resource_share_arn] = (last_recreated_at, cycle_count)
+        self.entries = entries
+        _history_cache[cache_key] = (now, entries)
+        logger.info(f"Loaded the remediation history of {len(entries)} resource shares, {self.read_count} read from DDB")
+
+    def check(self, resource_share_arn: str, now: Optional[int] = None) -> str:
+        """
+        Whether a resource share with newly expired invitations is recreated, in its cooldown, or parked.
+        """
+        if resource_share_arn not in self.entries:
+            return RECREATE
+        last_recreated_at, cycle_count = self.entries[resource_share_arn]
+        if self.max_cycles > 0 and cycle_count >= self.max_cycles:
+            return PARKED
+        if self.cooldown_in_secs > 0 and (now if now is not None else time.time()) - last_recreated_at < self.cooldown_in_secs:
+            return COOLDOWN
+        return RECREATE
+
+    def filter(self, expired_ram_shares: Iterable[tuple[str, set[str], bool]]) -> Iterator[tuple[str, set[str], bool]]:
+        """
+        Yield the resource shares of `expired_ram_shares` that are not suppressed by the history.
+        """
+        for resource_share_arn, aws_account_ids, previously_failed in expired_ram_shares:
+            outcome = RECREATE if previously_failed else self.check(resource_share_arn)
+            if outcome == COOLDOWN:
+                self.cooldown_count = self.cooldown_count + 1
+                logger.debug(f"Skipping {resource_share_arn}, it was recreated less than {self.cooldown_in_secs} seconds ago")
+                continue
+            if outcome == PARKED:
+                self.parked_shares.setdefault(resource_share_arn, set()).update(aws_account_ids)
+                logger.warning(f"Not recreating the RAM invitations for {sorted(aws_account_ids)} of {resource_share_arn}, it was recreated {self.entries[resource_share_arn][1]} times in a row")
+                continue
+            yield resource_share_arn, aws_account_ids, previously_failed
+
+    def worker_event(self, shares: list) -> dict:
+        """
+        The history of the shares of a batch, as it is sent to a worker of a coordinator, so the
+        worker can record the next cycle without loading the history.
+        """
+        return {"remediation_history": {resource_share_arn: list(self.entries[resource_share_arn]) for resource_share_arn, _aws_account_ids, _previously_failed in shares if resource_share_arn in self.entries}}
+
+    def record(self, recreated_shares: dict[str, set[str]]):
+        """
+        Save the resource shares that were recreated in this run, counting one more cycle for the
+        ones that were recreated before.
+        """
+        if not recreated_shares:
+            return
+        now = int(time.time())
+        with self._lock:
+            changed = {resource_share_arn: (now, self.entries[resource_share_arn][1] + 1 if resource_share_arn in self.entries else 1) for resource_share_arn in recreated_shares}
+            self.entries.update(changed)
+        self.ddb_manager.save_remediation_history(changed)
+
+    def as_dict(self) -> dict:
+        """
+        The suppressed resource shares as they are reported in the handler response.
+        """
+        return {
+            "cooldown_count": self.cooldown_count,
+            "parked_count": len(self.parked_shares),
+            "parked_shares": [{"resource_share_arn": resource_share_arn, "principals": sorted(aws_account_ids), "cycle_count": self.entries[resource_share_arn][1]} for resource_share_arn, aws_account_ids in sorted(self.parked_shares.items())[:MAX_REPORTED_PARKED_SHARES]],
+        }
@@ -0,0 +1,67 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module chooses when the function should run next, from the earliest time an invitation
+it has seen reaches the timeout, and schedules that run with a one-time EventBridge Scheduler
+schedule. The fixed schedule of the template then only has to be a safety net.
+"""
+
+import datetime
+import json
+import time
+from typing import Iterable, Optional
+
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+DEFAULT_MIN_INTERVAL_IN_SECS = 5 * 60
+DEFAULT_MAX_INTERVAL_IN_SECS = 6 * 60 * 60
+# Set by the template when predictive scheduling is enabled.
+NEXT_RUN_SCHEDULE_NAME_ENV = "NEXT_RUN_SCHEDULE_NAME"
+NEXT_RUN_SCHEDULER_ROLE_ARN_ENV = "NEXT_RUN_SCHEDULER_ROLE_ARN"
+# Event keys that only apply to the invocation that carries them.
+TRANSIENT_EVENT_KEYS = ("resume_depth",)
+
+
+def choose_next_run_at(due_times: Iterable[Optional[int]], min_interval_in_secs: int = DEFAULT_MIN_INTERVAL_IN_SECS, max_interval_in_secs: int = DEFAULT_MAX_INTERVAL_IN_SECS, now: Optional[int] = None) -> int:
+    """
+    The earliest of the due times in epoch, kept between the minimum and maximum interval from
+    now. Without a due time the next run is the maximum interval away.
+    """
+    now = int(time.time()) if now is None else now
+    known_due_times = [due_at for due_at in due_times if due_at is not None]
+    next_run_at = min(known_due_times) if known_due_times else now + max_interval_in_secs
+    return max(now + min_interval_in_secs, min(now + max_interval_in_secs, next_run_at))
+
+
+class NextRunScheduler:  # pylint: disable=too-few-public-methods
+    """
+    Keeps a single one-time schedule per mode, which is moved to the chosen time on every run.
+    """
+
+    def __init__(self, scheduler_client, schedule_name: str, role_arn: str):
+        self.scheduler_client = scheduler_client
+        self.schedule_name = schedule_name
+        self.role_arn = role_arn
+
+    def schedule(self, next_run_at: int, function_arn: str, event: dict):
+        """
+        Invoke the function with the event at `next_run_at`, replacing the previously scheduled run of the same mode.
+        """
+        mode = event["mode"] if "mode" in event else "standalone"
+        at = datetime.datetime.fromtimestamp(next_run_at, tz=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        parameters = {
+            "Name": f"{self.schedule_name}-{mode}",
+            "ScheduleExpression": f"at({at})",
+            "ScheduleExpressionTimezone": "UTC",
+            "FlexibleTimeWindow": {"Mode": "OFF"},
+            "Target": {"Arn": function_arn, "RoleArn": self.role_arn, "Input": json.dumps({key: value for key, value in event.items() if key not in TRANSIENT_EVENT_KEYS})},
+            "State": "ENABLED",
+        }
+        try:
+            self.scheduler_client.update_schedule(**parameters)
+        except self.scheduler_client.exceptions.ResourceNotFoundException:
+            self.scheduler_client.create_schedule(**parameters)
+        logger.info(f"Scheduled the next {mode} run at {at} UTC")
@@ -0,0 +1,265 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module keeps an index of the resource shares behind Lake Formation permissions: for every
+Lake Formation resource share, the principals that were granted permissions through it and the
+Lake Formation resources it shares. The index is stored in the DynamoDB table of the monitor, or
+in a local JSON file, and is refreshed incrementally. Only the resource shares that RAM reports as
+new or updated are looked up again, through the resources they share, so the full enumeration of
+Lake Formation permissions is only needed when the index is built, when many shares changed, or
+once per full refresh interval. Runs of the monitor with a recent index only read the arns of the
+indexed resource shares, which are stored next to the entries.
+"""
+
+import json
+import os
+import time
+from typing import Optional
+
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor.lf_permission_fixer import get_account_id
+from lf_stale_ram_invite_monitor.ram_manager import RamManager
+
+logger = Logger()
+
+DEFAULT_REFRESH_INTERVAL_IN_SECS = 60 * 60
+DEFAULT_FULL_REFRESH_INTERVAL_IN_SECS = 24 * 60 * 60
+# Above this part of changed resource shares, a single pass over all permissions is cheaper than a lookup per resource.
+FULL_REFRESH_CHANGE_RATIO = 0.2
+
+
+def lake_formation_resource(resource_arn: str) -> Optional[dict]:
+    """
+    The Lake Formation resource of the arn of a shared Glue database or table, or None for other resources.
+    """
+    parts = resource_arn.split(":", 5)
+    if len(parts) != 6 or parts[2] != "glue":
+        return None
+    catalog_id, path = parts[4], parts[5].split("/")
+    if path[0] == "database" and len(path) == 2:
+        return {"Database": {"CatalogId": catalog_id, "Name": path[1]}}
+    if path[0] == "table" and len(path) == 3:
+        return {"Table": {"CatalogId": catalog_id, "DatabaseName": path[1], "Name": path[2]}} if path[2] != "*" else {"Table": {"CatalogId": catalog_id, "DatabaseName": path[1], "TableWildcard": {}}}
+    return None
+
+
+class DdbShareIndexStore:
+    """
+    Keeps the share index in the DynamoDB table of the monitor, an item per resource share.
+    """
+
+    def __init__(self, ddb_manager):
+        self.ddb_manager = ddb_manager
+
+    def load(self) -> tuple[dict[str, dict], dict]:
+        """
+        The entries and the metadata of the index.
+        """
+        return self.ddb_manager.get_share_index()
+
+    def load_metadata(self) -> dict:
+        """
+        The metadata of the index, without its entries.
+        """
+        return self.ddb_manager.get_share_index_metadata()
+
+    def load_resource_share_arns(self, metadata: dict) -> Optional[list[str]]:
+        """
+        The stored arns of the resource shares with Lake Formation permissions, None when there are none stored.
+        """
+        return self.ddb_manager.get_share_index_arns(metadata)
+
+    def save(self, entries: dict[str, dict], all_entries: dict[str, dict], removed_resource_share_arns: set[str], metadata: dict):
+        """
+        Write the changed entries, and the arns of all resource shares with Lake Formation permissions.
+        """
+        resource_share_arns = sorted(resource_share_arn for resource_share_arn, entry in all_entries.items() if entry["principals"])
+        self.ddb_manager.save_share_index(entries, removed_resource_share_arns, metadata, resource_share_arns)
+
+
+class FileShareIndexStore:
+    """
+    Keeps the share index in a local JSON file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> tuple[dict[str, dict], dict]:
+        """
+        The entries and the metadata of the index, empty if the file does not exist yet.
+        """
+        if not os.path.exists(self.path):
+            return {}, {}
+        with open(self.path, encoding="utf-8") as index_file:
+            document = json.load(index_file)
+        entries = {resource_share_arn: {**entry, "principals": set(entry["principals"])} for resource_share_arn, entry in document["entries"].items()}
+        return entries, document["metadata"]
+
+    def load_metadata(self) -> dict:
+        """
+        The metadata of the index, the file is read as a whole.
+        """
+        return self.load()[1]
+
+    def load_resource_share_arns(self, metadata: dict) -> Optional[list[str]]:  # pylint: disable=unused-argument
+        """
+        The file has no separate arns, the index is loaded as a whole.
+        """
+        return None
+
+    def save(self, entries: dict[str, dict], all_entries: dict[str, dict], removed_resource_share_arns: set[str], metadata: dict):  # pylint: disable=unused-argument
+        """
+        Rewrite the file with all entries. The file is replaced at once, so a failed write does not leave half an index.
+        """
+        document = {"metadata": metadata, "entries": {resource_share_arn: {**entry, "principals": sorted(entry["principals"])} for resource_share_arn, entry in sorted(all_entries.items())}}
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as index_file:
+            json.dump(document, index_file)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class ShareIndex:  # pylint: disable=too-many-instance-attributes
+    """
+    Maps Lake Formation resource share arns to the principals and resources of their Lake Formation permissions.
+    """
+
+    def __init__(self, store, ram_manager: RamManager, lf_client, full_refresh_interval_in_secs: int = DEFAULT_FULL_REFRESH_INTERVAL_IN_SECS):
+        self.store = store
+        self.ram_manager = ram_manager
+        self.lf_client = lf_client
+        self.full_refresh_interval_in_secs = full_refresh_interval_in_secs
+        # Resource share arn -> {"principals", "resources", "share_updated_at", "indexed_at"}.
+        self.entries: dict[str, dict] = {}
+        self.metadata: dict = {}
+        self.loaded = False
+        self.permission_pages = 0
+
+    def load(self):
+        """
+        Read the index from its store, once.
+        """
+        if not self.loaded:
+            self.entries, self.metadata = self.store.load()
+            self.loaded = True
+
+    def refresh_if_older_than(self, refresh_interval_in_secs: int) -> Optional[dict]:
+        """
+        Refresh the index when its last refresh is older than the interval. Returns the refresh
+        counts, or None when the index was recent enough.
+        """
+        self.load()
+        if self.entries and time.time() - self.metadata.get("refreshed_at", 0) < refresh_interval_in_secs:
+            return None
+        return self.refresh()
+
+    def refresh(self, full: bool = False) -> dict:
+        """
+        Bring the index up to date with the Lake Formation resource shares in RAM and save the
+        changes. Returns the refresh counts.
+        """
+        self.load()
+        now = int(time.time())
+        resource_shares = self.ram_manager.get_lake_formation_shares()
+        removed = {resource_share_arn for resource_share_arn in self.entries if resource_share_arn not in resource_shares}
+        changed = [resource_share_arn for resource_share_arn, updated_at in resource_shares.items() if resource_share_arn not in self.entries or updated_at > self.entries[resource_share_arn]["share_updated_at"]]
+
+        full = full or not self.entries or now - self.metadata.get("full_refreshed_at", 0) >= self.full_refresh_interval_in_secs or len(changed) > FULL_REFRESH_CHANGE_RATIO * len(resource_shares)
+        if full:
+            changed_entries = self._index_all_permissions(resource_shares, now)
+            self.metadata["full_refreshed_at"] = now
+        else:
+            changed_entries = self._index_resource_shares(changed, resource_shares, now)
+        self.metadata["refreshed_at"] = now
+
+        for resource_share_arn in removed:
+            del self.entries[resource_share_arn]
+        self.entries.update(changed_entries)
+        self.store.save(changed_entries, self.entries, removed, self.metadata)
+
+        counts = {"full_refresh": full, "share_count": len(self.entries), "changed_count": len(changed_entries), "removed_count": len(removed), "permission_pages": self.permission_pages}
+        logger.info(f"Refreshed the share index: {counts}")
+        return counts
+
+    def _index_all_permissions(self, resource_shares: dict[str, float], now: int) -> dict[str, dict]:
+        """
+        Build an entry for every resource share from a single pass over all Lake Formation permissions.
+        """
+        entries = {resource_share_arn: {"principals": set(), "resources": [], "share_updated_at": updated_at, "indexed_at": now} for resource_share_arn, updated_at in resource_shares.items()}
+        paginator = self.lf_client.get_paginator("list_permissions")
+        for page in paginator.paginate():
+            self.permission_pages = self.permission_pages + 1
+            self._add_permissions(entries, page["PrincipalResourcePermissions"])
+        return entries
+
+    def _index_resource_shares(self, resource_share_arns: list[str], resource_shares: dict[str, float], now: int) -> dict[str, dict]:
+        """
+        Build the entries of the given resource shares from the permissions of the resources they share.
+        """
+        entries = {resource_share_arn: {"principals": set(), "resources": [], "share_updated_at": resource_shares[resource_share_arn], "indexed_at": now} for resource_share_arn in resource_share_arns}
+        if not resource_share_arns:
+            return entries
+
+        resources: dict[str, dict] = {}
+        for resource_arns in self.ram_manager.get_shared_resource_arns(resource_share_arns).values():
+            for resource_arn in resource_arns:
+                resource = lake_formation_resource(resource_arn)
+                if resource is None:
+                    logger.warning(f"Can not look up the Lake Formation permissions of {resource_arn}, it is indexed in the next full refresh")
+                    continue
+                # Resources that are shared by more than one changed resource share are listed once.
+                resources[json.dumps(resource, sort_keys=True)] = resource
+
+        paginator = self.lf_client.get_paginator("list_permissions")
+        for resource in resources.values():
+            for page in paginator.paginate(Resource=resource):
+                self.permission_pages = self.permission_pages + 1
+                self._add_permissions(entries, page["PrincipalResourcePermissions"])
+        return entries
+
+    @staticmethod
+    def _add_permissions(entries: dict[str, dict], permissions: list[dict]):
+        """
+        Add the principals and resources of the permissions that were granted through one of the given resource shares.
+        """
+        for permission in permissions:
+            if "AdditionalDetails" not in permission or "ResourceShare" not in permission["AdditionalDetails"]:
+                continue
+            for resource_share_arn in permission["AdditionalDetails"]["ResourceShare"]:
+                if resource_share_arn not in entries:
+                    continue
+                try:
+                    entries[resource_share_arn]["principals"].add(get_account_id(permission["Principal"]["DataLakePrincipalIdentifier"]))
+                except ValueError as e:
+                    logger.warning(f"Ignoring the permission on resource share {resource_share_arn}: {e}")
+                if permission["Resource"] not in entries[resource_share_arn]["resources"]:
+                    entries[resource_share_arn]["resources"].append(permission["Resource"])
+
+    def get_shared_principals(self) -> dict[str, set[str]]:
+        """
+        The principals of every indexed resource share that has Lake Formation permissions.
+        """
+        self.load()
+        return {resource_share_arn: set(entry["principals"]) for resource_share_arn, entry in self.entries.items() if entry["principals"]}
+
+    def resource_share_arns(self) -> list[str]:
+        """
+        The sorted arns of the indexed resource shares that have Lake Formation permissions.
+        """
+        return sorted(self.get_shared_principals())
+
+    def recent_resource_share_arns(self, refresh_interval_in_secs: int) -> list[str]:
+        """
+        The sorted arns of the indexed resource shares that have Lake Formation permissions. When
+        the index was refreshed within the interval, only its arns are read from the store,
+        otherwise it is loaded and refreshed first.
+        """
+        if not self.loaded:
+            metadata = self.store.load_metadata()
+            if time.time() - metadata.get("refreshed_at", 0) < refresh_interval_in_secs:
+                resource_share_arns = self.store.load_resource_share_arns(metadata)
+                if resource_share_arns is not None:
+                    return resource_share_arns
+        self.refresh_if_older_than(refresh_interval_in_secs)
+        return self.resource_share_arns()
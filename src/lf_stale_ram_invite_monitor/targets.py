@@ -0,0 +1,151 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module sweeps several regions and accounts from a single invocation. A target is a region,
+and for another account the IAM role that is assumed there. Every target gets its own clients,
+RamManager and DdbManager, and the targets are remediated concurrently, each with its own cap on
+the number of resource shares in flight.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import boto3
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+DEFAULT_MAX_PARALLEL_TARGETS = 4
+ASSUME_ROLE_SESSION_NAME = "lf-stale-ram-invite-monitor"
+
+
+class Target:
+    """
+    A region of an account that is swept for expired RAM invitations.
+    """
+
+    def __init__(self, region_name: str, role_arn: Optional[str] = None, external_id: Optional[str] = None):
+        self.region_name = region_name
+        self.role_arn = role_arn
+        self.external_id = external_id
+
+    @classmethod
+    def from_dict(cls, target: dict) -> "Target":
+        """
+        A target of the event, like {"region": "eu-west-1", "role_arn": "arn:aws:iam::123456789012:role/monitor"}.
+        """
+        if "region" not in target:
+            raise ValueError(f"Target {target} does not have a region")
+        return cls(target["region"], target["role_arn"] if "role_arn" in target else None, target["external_id"] if "external_id" in target else None)
+
+    @property
+    def account_id(self) -> Optional[str]:
+        """
+        The account of the role, or None for the account of the function.
+        """
+        return self.role_arn.split(":")[4] if self.role_arn is not None else None
+
+    @property
+    def name(self) -> str:
+        """
+        The name of the target in logs and in the handler response.
+        """
+        return f"{self.account_id or 'self'}/{self.region_name}"
+
+
+def parse_targets(targets: list[dict]) -> list[Target]:
+    """
+    The targets of the event, without duplicates.
+    """
+    parsed: dict[tuple[str, Optional[str]], Target] = {}
+    for target in targets:
+        parsed_target = Target.from_dict(target)
+        parsed.setdefault((parsed_target.region_name, parsed_target.role_arn), parsed_target)
+    return list(parsed.values())
+
+
+def assume_role_session(sts_client, target: Target) -> boto3.session.Session:
+    """
+    A session with the credentials of the role of the target, in the region of the target.
+    """
+    parameters = {"RoleArn": target.role_arn, "RoleSessionName": ASSUME_ROLE_SESSION_NAME}
+    if target.external_id is not None:
+        parameters["ExternalId"] = target.external_id
+    credentials = sts_client.assume_role(**parameters)["Credentials"]
+    return boto3.session.Session(aws_access_key_id=credentials["AccessKeyId"], aws_secret_access_key=credentials["SecretAccessKey"], aws_session_token=credentials["SessionToken"], region_name=target.region_name)
+
+
+class TargetResult:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """
+    Counts of the sweep of a single target.
+    """
+
+    def __init__(self, target: Target):
+        self.target = target
+        self.share_count = 0
+        self.recreated_count = 0
+        self.failed_count = 0
+        self.completed = False
+        self.verification: Optional[dict] = None
+        self.churn: Optional[dict] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        """
+        The target result as it is reported in the handler response.
+        """
+        result = {"target": self.target.name, "region": self.target.region_name, "share_count": self.share_count, "recreated_count": self.recreated_count, "failed_count": self.failed_count, "completed": self.completed}
+        if self.verification is not None:
+            result["verification"] = self.verification
+        if self.churn is not None:
+            result["churn"] = self.churn
+        if self.error is not None:
+            result["error"] = self.error
+        return result
+
+
+class TargetSweep:
+    """
+    Remediates a list of targets with up to `max_parallel_targets` at the same time. A target that
+    fails, for example because its role can not be assumed, does not stop the others.
+    """
+
+    def __init__(self, remediate_target: Callable[[Target], TargetResult], max_parallel_targets: int = DEFAULT_MAX_PARALLEL_TARGETS):
+        self.remediate_target = remediate_target
+        self.max_parallel_targets = max(1, max_parallel_targets)
+        self.results: list[TargetResult] = []
+
+    def run(self, targets: list[Target]) -> list[TargetResult]:
+        """
+        Sweep every target and return their results, in the order of the targets.
+        """
+        logger.info(f"Sweeping {len(targets)} targets, up to {self.max_parallel_targets} at a time")
+        with ThreadPoolExecutor(max_workers=self.max_parallel_targets, thread_name_prefix="target-sweep") as executor:
+            self.results = list(executor.map(self._sweep_target, targets))
+        return self.results
+
+    def _sweep_target(self, target: Target) -> TargetResult:
+        """
+        Remediate a single target, turning an error into a failed result.
+        """
+        try:
+            result = self.remediate_target(target)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error(f"Failed to sweep target {target.name}: {e}")
+            result = TargetResult(target)
+            result.error = str(e)
+        logger.info(f"Target {target.name}: Recreated {result.recreated_count} RAM invitations. Failed = {result.failed_count}")
+        return result
+
+    def totals(self) -> dict:
+        """
+        The counts of all targets.
+        """
+        return {
+            "target_count": len(self.results),
+            "failed_target_count": sum(1 for result in self.results if result.error is not None),
+            "share_count": sum(result.share_count for result in self.results),
+            "recreated_count": sum(result.recreated_count for result in self.results),
+            "failed_count": sum(result.failed_count for result in self.results),
+        }
@@ -0,0 +1,132 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+This module checks that the invitations that were just recreated actually reached RAM. The
+associations of all remediated resource shares are polled together, 20 resource shares per
+call, with an exponential backoff between rounds and a single time budget for the whole phase.
+Invitations that failed, or that RAM does not know about, are queued for a retry.
+"""
+
+import time
+from typing import Callable, Optional
+
+import botocore.exceptions
+from aws_lambda_powertools import Logger
+
+logger = Logger()
+
+DEFAULT_VERIFICATION_BUDGET_IN_SECS = 20
+VERIFICATION_BACKOFF_BASE_IN_SECS = 1.0
+VERIFICATION_BACKOFF_CAP_IN_SECS = 8.0
+
+VERIFIED = "verified"
+PENDING = "pending"
+FAILED = "failed"
+
+
+class VerificationSummary:  # pylint: disable=too-few-public-methods
+    """
+    Counts of a single verification phase.
+    """
+
+    def __init__(self):
+        self.verified_count = 0
+        self.pending_count = 0
+        self.failed_count = 0
+        self.round_count = 0
+        self.elapsed_in_secs = 0.0
+
+    def as_dict(self) -> dict:
+        """
+        The summary as it is reported in the handler response.
+        """
+        return {
+            "verified_count": self.verified_count,
+            "pending_count": self.pending_count,
+            "failed_count": self.failed_count,
+            "round_count": self.round_count,
+            "elapsed_in_secs": round(self.elapsed_in_secs, 3),
+        }
+
+
+class RemediationVerifier:
+    """
+    Polls the status of recreated invitations until each of them is associating or associated,
+    failed, or the time budget runs out.
+    """
+
+    def __init__(self, ram_manager, ddb_manager, budget_in_secs: float = DEFAULT_VERIFICATION_BUDGET_IN_SECS, *, backoff_base_in_secs: float = VERIFICATION_BACKOFF_BASE_IN_SECS, backoff_cap_in_secs: float = VERIFICATION_BACKOFF_CAP_IN_SECS):  # pylint: disable=too-many-arguments
+        self.ram_manager = ram_manager
+        self.ddb_manager = ddb_manager
+        self.budget_in_secs = budget_in_secs
+        self.backoff_base_in_secs = backoff_base_in_secs
+        self.backoff_cap_in_secs = backoff_cap_in_secs
+
+    def classify(self, association: Optional[dict]) -> str:
+        """
+        The verification outcome of the association of a recreated invitation. Until the new
+        invitation shows up, RAM can still report the withdrawn one.
+        """
+        if association is None or association["status"] == "FAILED":
+            return FAILED
+        if association["status"] == "ASSOCIATED":
+            return VERIFIED
+        if association["status"] == "ASSOCIATING" and not self.ram_manager.is_expired(association):
+            return VERIFIED
+        return PENDING
+
+    def _resolve(self, associations: dict[str, list[dict]], unresolved: dict[str, set[str]], failed: dict[str, set[str]], summary: VerificationSummary):
+        """
+        Take the principals whose outcome is known from a round of associations out of `unresolved`.
+        """
+        for resource_share_arn in list(unresolved):
+            by_principal = {association["associatedEntity"]: association for association in associations.get(resource_share_arn, [])}
+            for aws_account_id in list(unresolved[resource_share_arn]):
+                outcome = self.classify(by_principal.get(aws_account_id))
+                if outcome == PENDING:
+                    continue
+                unresolved[resource_share_arn].discard(aws_account_id)
+                if outcome == VERIFIED:
+                    summary.verified_count = summary.verified_count + 1
+                else:
+                    failed.setdefault(resource_share_arn, set()).add(aws_account_id)
+            if not unresolved[resource_share_arn]:
+                del unresolved[resource_share_arn]
+
+    def verify(self, recreated_shares: dict[str, set[str]], should_stop: Optional[Callable[[], bool]] = None) -> VerificationSummary:
+        """
+        Poll the associations of the recreated principals of every resource share, queue the failed
+        ones for a retry and return the counts. The principals that are still pending when the
+        budget runs out are left to the next run.
+        """
+        summary = VerificationSummary()
+        unresolved = {resource_share_arn: set(aws_account_ids) for resource_share_arn, aws_account_ids in recreated_shares.items() if aws_account_ids}
+        failed: dict[str, set[str]] = {}
+        started_at = time.monotonic()
+        backoff_in_secs = self.backoff_base_in_secs
+
+        while unresolved:
+            summary.round_count = summary.round_count + 1
+            try:
+                self._resolve(self.ram_manager.get_principal_associations(sorted(unresolved)), unresolved, failed, summary)
+            except botocore.exceptions.ClientError as e:
+                # The invitations were sent already, a throttled poll only delays the verification.
+                logger.warning(f"Failed to poll the status of {len(unresolved)} recreated RAM shares: {e}")
+
+            out_of_budget = time.monotonic() - started_at + backoff_in_secs > self.budget_in_secs
+            if not unresolved or out_of_budget or (should_stop is not None and should_stop()):
+                break
+            time.sleep(backoff_in_secs)
+            backoff_in_secs = min(self.backoff_cap_in_secs, backoff_in_secs * 2)
+
+        for resource_share_arn, aws_account_ids in failed.items():
+            logger.error(f"RAM invitations for {sorted(aws_account_ids)} of {resource_share_arn} were not recreated, queuing them for a retry")
+            self.ddb_manager.add_resource_share_to_ddb(resource_share_arn, aws_account_ids)
+        self.ddb_manager.flush()
+
+        summary.failed_count = sum(len(aws_account_ids) for aws_account_ids in failed.values())
+        summary.pending_count = sum(len(aws_account_ids) for aws_account_ids in unresolved.values())
+        summary.elapsed_in_secs = time.monotonic() - started_at
+        logger.info(f"Verified {summary.verified_count} recreated RAM invitations in {summary.round_count} rounds. Pending = {summary.pending_count}, Failed = {summary.failed_count}")
+        return summary
@@ -0,0 +1,82 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Measures the init phase of a cold start: the time it takes to import the Lambda handler module in
+a fresh Python process, the number of modules it loads, and the slowest imports. Runs offline:
+
+    PYTHONPATH=src python -m tests.benchmarks.cold_start_benchmark --runs 10 --top 15
+
+The first run pays for reading the bytecode from disk, so the median of the runs is reported.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess  # nosec B404
+import sys
+from pathlib import Path
+
+SRC_PATH = str(Path(__file__).resolve().parents[2] / "src")
+HANDLER_MODULE = "lf_stale_ram_invite_monitor.lambda_handler"
+# Modules that only some modes need, and that the handler must not import on init.
+LAZY_MODULES = ("lf_stale_ram_invite_monitor.fan_out", "lf_stale_ram_invite_monitor.invitation_events", "lf_stale_ram_invite_monitor.share_index", "lf_stale_ram_invite_monitor.targets", "cProfile")
+
+# Runs in the fresh process, and prints the measurements as JSON.
+INIT_SCRIPT = f"""
+import json, sys, time
+started_at = time.perf_counter()
+import {HANDLER_MODULE} as handler
+init_in_ms = (time.perf_counter() - started_at) * 1000
+print(json.dumps({{"init_in_ms": init_in_ms, "module_count": len(sys.modules), "client_count": handler.clients.created_count, "lazy_modules_loaded": [name for name in {LAZY_MODULES!r} if name in sys.modules]}}))
+"""
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def run_init(import_time: bool = False) -> tuple[dict, list[tuple[int, str]]]:
+    """
+    Import the handler in a fresh process. Returns its measurements, and with `import_time` the
+    cumulative import time in microseconds of the handler and its direct imports.
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, (SRC_PATH, os.environ.get("PYTHONPATH")))), "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1")}
+    command = [sys.executable] + (["-X", "importtime"] if import_time else []) + ["-c", INIT_SCRIPT]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)  # nosec B603
+    # Nested imports are indented by two spaces per level, only the handler and its direct imports are kept.
+    imports = [(int(match.group(2)), match.group(4)) for match in map(IMPORT_TIME.match, completed.stderr.splitlines()) if match and len(match.group(3)) <= 3]
+    return json.loads(completed.stdout.strip().splitlines()[-1]), imports
+
+
+def run_cold_start_benchmark(runs: int = 5) -> dict:
+    """
+    Import the handler `runs` times, each in a fresh process, and return the median init time.
+    """
+    results = [run_init()[0] for _ in range(max(1, runs))]
+    return {
+        "runs": len(results),
+        "median_init_in_ms": round(statistics.median(result["init_in_ms"] for result in results), 1),
+        "max_init_in_ms": round(max(result["init_in_ms"] for result in results), 1),
+        "module_count": results[-1]["module_count"],
+        "client_count": results[-1]["client_count"],
+        "lazy_modules_loaded": results[-1]["lazy_modules_loaded"],
+    }
+
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh processes to import the handler in.")
+    parser.add_argument("--top", type=int, default=10, help="Number of the slowest imports of the handler to list.")
+    namespace = parser.parse_args(argv)
+
+    print(json.dumps(run_cold_start_benchmark(namespace.runs)))
+    _result, imports = run_init(import_time=True)
+    for cumulative_in_us, module in sorted(imports, reverse=True)[: namespace.top]:
+        print(f"{cumulative_in_us / 1000:10.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
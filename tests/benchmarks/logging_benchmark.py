@@ -0,0 +1,123 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Measures the per invitation logging overhead of the Lambda handler against the simulator. Every
+run is a dry run over expired invitations, with one record per expired invitation and two per
+dry run action, in three logging modes:
+
+- `silent`: nothing is logged, the baseline.
+- `per_item`: every detailed record is logged at INFO, like before the records were rolled up.
+- `summary`: the default, the records are rolled up into summaries and only sampled at INFO.
+
+The overhead is the median wall time of a mode minus the one of `silent`, per expired invitation.
+Runs offline:
+
+    PYTHONPATH=src python -m tests.benchmarks.logging_benchmark --sizes 1000 10000 --runs 5
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import time
+from typing import Optional
+from unittest.mock import patch
+
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor import ram_manager as ram_manager_module
+from tests.simulator import SimulatedSession, build_inventory
+from tests.simulator.handler import lambda_handler_module
+
+DDB_TABLE_NAME = "lf_ram_invite_monitor_logging_benchmark"
+# Mode -> (log level, extra handler event parameters).
+MODES = {"silent": ("CRITICAL", {}), "per_item": ("INFO", {"log_sample_rate": 1}), "summary": ("INFO", {})}
+
+
+class CountingStream(io.TextIOBase):
+    """
+    A log stream that only counts the lines and bytes written to it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.line_count = 0
+        self.byte_count = 0
+
+    def write(self, text: str) -> int:
+        self.line_count = self.line_count + text.count("\n")
+        self.byte_count = self.byte_count + len(text.encode())
+        return len(text)
+
+
+def run_logging_mode(share_count: int, mode: str) -> tuple[int, float, CountingStream]:
+    """
+    Run the handler once over a fresh inventory in the logging mode. Returns the number of
+    expired invitations, the wall time and the log stream.
+    """
+    level, event = MODES[mode]
+    inventory = build_inventory(share_count)
+    session = SimulatedSession(inventory)
+    session.create_retry_queue_table(DDB_TABLE_NAME)
+    timeout_in_secs = lambda_handler_module.ELEVEN_HOURS_IN_SECS
+    expired_count = sum(len(principals) for principals in inventory.expired_invitations(timeout_in_secs).values())
+    ram_manager_module._lake_formation_share_cache.clear()  # pylint: disable=protected-access
+
+    logger = Logger()
+    stream = CountingStream()
+    previous_stream = logger.registered_handler.setStream(stream)
+    logger.setLevel(level)
+    # A dry run, so every action is logged instead of sent to RAM.
+    handler_event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": timeout_in_secs, "dry_run": True, **event}
+    try:
+        # The metrics are printed to stdout, they are not part of the log volume of the invitations.
+        with patch.object(lambda_handler_module, "clients", session), contextlib.redirect_stdout(io.StringIO()):
+            started_at = time.perf_counter()
+            lambda_handler_module.lambda_handler(handler_event, None)
+            wall_time = time.perf_counter() - started_at
+    finally:
+        logger.registered_handler.setStream(previous_stream)
+        logger.setLevel("INFO")
+    return expired_count, wall_time, stream
+
+
+def run_logging_benchmark(share_count: int, runs: int = 3, modes: Optional[list[str]] = None) -> dict:
+    """
+    Run the handler `runs` times in every logging mode, and return the median wall time, the log
+    volume and the per invitation overhead of each mode.
+    """
+    results = {}
+    for mode in modes or list(MODES):
+        measurements = [run_logging_mode(share_count, mode) for _ in range(max(1, runs))]
+        expired_count, _wall_time, stream = measurements[-1]
+        results[mode] = {
+            "expired_count": expired_count,
+            "median_wall_in_ms": round(statistics.median(wall_time for _count, wall_time, _stream in measurements) * 1000, 1),
+            "log_lines": stream.line_count,
+            "log_bytes": stream.byte_count,
+        }
+    if "silent" in results:
+        for result in results.values():
+            overhead_in_ms = result["median_wall_in_ms"] - results["silent"]["median_wall_in_ms"]
+            result["overhead_per_invitation_in_us"] = round(overhead_in_ms * 1000 / result["expired_count"], 1) if result["expired_count"] else 0.0
+    return {"share_count": share_count, "runs": max(1, runs), "modes": results}
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Run the benchmark from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Numbers of resource shares to simulate.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs of every mode, the median wall time is reported.")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    namespace = parser.parse_args(argv)
+
+    for share_count in namespace.sizes:
+        print(json.dumps(run_logging_benchmark(share_count, namespace.runs, namespace.modes)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Runs the Lambda handler and the Lake Formation utility against the simulator at several inventory
+sizes, and reports the wall time, API call counts, peak memory and remediations per second. Runs
+offline:
+
+    PYTHONPATH=src python -m tests.benchmarks.scale_benchmark --sizes 10000 50000 100000 --latency-in-ms 5
+
+Peak memory is measured with tracemalloc, which slows Python down. Use --skip-memory to compare
+wall times.
+"""
+
+import argparse
+import json
+import runpy
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Optional
+from unittest.mock import patch
+
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor import ram_manager as ram_manager_module
+from tests.simulator import SimulatedSession, SimulatorConfig, build_inventory
+from tests.simulator.handler import lambda_handler_module
+
+DDB_TABLE_NAME = "lf_ram_invite_monitor_benchmark"
+UTILITY_PATH = Path(__file__).resolve().parents[2] / "utility" / "fix_lakeformation_ram_invites.py"
+TARGETS = ("handler", "utility")
+
+
+class BenchmarkResult:
+    """
+    The measurements of a single benchmark run.
+    """
+
+    def __init__(self, target: str, share_count: int, expired_count: int, remediated_count: int, wall_time_in_secs: float, peak_memory_in_bytes: Optional[int], api_calls: dict):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.target = target
+        self.share_count = share_count
+        self.expired_count = expired_count
+        self.remediated_count = remediated_count
+        self.wall_time_in_secs = wall_time_in_secs
+        self.peak_memory_in_bytes = peak_memory_in_bytes
+        self.api_calls = api_calls
+
+    @property
+    def remediations_per_second(self) -> float:
+        """
+        Recreated invitations per second of wall time.
+        """
+        return self.remediated_count / self.wall_time_in_secs if self.wall_time_in_secs > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        """
+        The result as it is written with --json.
+        """
+        return {
+            "target": self.target,
+            "share_count": self.share_count,
+            "expired_count": self.expired_count,
+            "remediated_count": self.remediated_count,
+            "wall_time_in_secs": round(self.wall_time_in_secs, 3),
+            "peak_memory_in_mb": round(self.peak_memory_in_bytes / 1024 / 1024, 2) if self.peak_memory_in_bytes is not None else None,
+            "remediations_per_second": round(self.remediations_per_second, 2),
+            "api_calls": self.api_calls,
+        }
+
+    def as_row(self) -> str:
+        """
+        The result as a row of the results table.
+        """
+        peak_memory = f"{self.peak_memory_in_bytes / 1024 / 1024:.1f}" if self.peak_memory_in_bytes is not None else "-"
+        return f"{self.target:>8} {self.share_count:>8} {self.expired_count:>8} {self.remediated_count:>10} {self.wall_time_in_secs:>10.2f} {peak_memory:>9} {self.remediations_per_second:>10.1f} {self.api_calls['total']:>9}"
+
+
+RESULTS_HEADER = f"{'target':>8} {'shares':>8} {'expired':>8} {'remediated':>10} {'wall (s)':>10} {'peak (MB)':>9} {'remed./s':>10} {'API calls':>9}"
+
+
+def measure(run: Callable[[], object], measure_memory: bool) -> tuple[object, float, Optional[int]]:
+    """
+    Run the callable and return its result, the wall time and the peak of the traced memory.
+    """
+    if measure_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    try:
+        result = run()
+    finally:
+        wall_time = time.perf_counter() - started_at
+        peak_memory = tracemalloc.get_traced_memory()[1] if measure_memory else None
+        if measure_memory:
+            tracemalloc.stop()
+    return result, wall_time, peak_memory
+
+
+def run_handler_benchmark(share_count: int, config: Optional[SimulatorConfig] = None, event: Optional[dict] = None, measure_memory: bool = True, service_configs: Optional[dict[str, SimulatorConfig]] = None, **inventory_options) -> BenchmarkResult:  # pylint: disable=too-many-arguments
+    """
+    Run the Lambda handler once over a simulated inventory of `share_count` resource shares.
+    """
+    inventory = build_inventory(share_count, **inventory_options)
+    session = SimulatedSession(inventory, config, service_configs)
+    session.create_retry_queue_table(DDB_TABLE_NAME)
+    timeout_in_secs = lambda_handler_module.ELEVEN_HOURS_IN_SECS
+    expired_count = sum(len(principals) for principals in inventory.expired_invitations(timeout_in_secs).values())
+    ram_manager_module._lake_formation_share_cache.clear()  # pylint: disable=protected-access
+
+    handler_event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": timeout_in_secs, "dry_run": False, **(event or {})}
+    with patch.object(lambda_handler_module, "clients", session):
+        response, wall_time, peak_memory = measure(lambda: lambda_handler_module.lambda_handler(handler_event, None), measure_memory)
+
+    return BenchmarkResult("handler", share_count, expired_count, response["recreated_count"], wall_time, peak_memory, session.stats.as_dict())
+
+
+def run_utility_benchmark(share_count: int, config: Optional[SimulatorConfig] = None, measure_memory: bool = True, service_configs: Optional[dict[str, SimulatorConfig]] = None, **inventory_options) -> BenchmarkResult:
+    """
+    Run the Lake Formation utility once over a simulated inventory of `share_count` resource shares.
+    """
+    inventory = build_inventory(share_count, **inventory_options)
+    session = SimulatedSession(inventory, config, service_configs)
+    expired_count = sum(len(principals) for principals in inventory.expired_invitations(lambda_handler_module.ELEVEN_HOURS_IN_SECS).values())
+
+    with patch("boto3.session.Session", return_value=session), patch.object(sys, "argv", [str(UTILITY_PATH), "--no-dry-run", "--log_level", "WARNING"]):
+        _, wall_time, peak_memory = measure(lambda: runpy.run_path(str(UTILITY_PATH), run_name="__main__"), measure_memory)
+
+    # The utility does not report counts, every re-association is a recreated invitation.
+    remediated_count = session.stats.calls["AssociateResourceShare"]
+    return BenchmarkResult("utility", share_count, expired_count, remediated_count, wall_time, peak_memory, session.stats.as_dict())
+
+
+def main(argv: Optional[list[str]] = None):
+    """
+    Run the benchmarks from the command line and print a results table.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the handler and the utility against the RAM/Lake Formation/DynamoDB simulator.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Numbers of resource shares to simulate.")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--latency-in-ms", type=float, default=0.0, help="Latency of every API call.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Part of the RAM calls that is throttled.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Part of the associate/disassociate calls that fails.")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--principals-per-share", type=int, default=1)
+    parser.add_argument("--lake-formation-ratio", type=float, default=1.0)
+    parser.add_argument("--expired-ratio", type=float, default=0.5)
+    parser.add_argument("--event", type=json.loads, default={}, help="Extra handler event parameters, as JSON.")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--skip-memory", action="store_true", help="Do not trace memory, which slows the run down.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON lines.")
+    namespace = parser.parse_args(argv)
+
+    Logger().setLevel(namespace.log_level)
+    config = SimulatorConfig(latency_in_secs=namespace.latency_in_ms / 1000, page_size=namespace.page_size)
+    # Throttles and failures are only injected in RAM, DynamoDB errors are left to the botocore retries.
+    service_configs = {
+        "ram": SimulatorConfig(
+            latency_in_secs=namespace.latency_in_ms / 1000,
+            throttle_rate=namespace.throttle_rate,
+            page_size=namespace.page_size,
+            failure_rates={"AssociateResourceShare": namespace.failure_rate, "DisassociateResourceShare": namespace.failure_rate},
+        )
+    }
+    inventory_options = {"principals_per_share": namespace.principals_per_share, "lake_formation_ratio": namespace.lake_formation_ratio, "expired_ratio": namespace.expired_ratio}
+
+    if not namespace.json:
+        print(RESULTS_HEADER)
+    for share_count in namespace.sizes:
+        for target in namespace.targets:
+            if target == "handler":
+                result = run_handler_benchmark(share_count, config, namespace.event, not namespace.skip_memory, service_configs, **inventory_options)
+            else:
+                result = run_utility_benchmark(share_count, config, not namespace.skip_memory, service_configs, **inventory_options)
+            print(json.dumps(result.as_dict()) if namespace.json else result.as_row(), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Runs the cold start benchmark, so a change that creates clients or imports the optional modules on
+init shows up in the test run. Run with `-s` to see the results.
+"""
+
+import unittest
+
+from tests.benchmarks.cold_start_benchmark import run_cold_start_benchmark
+
+# Generous, the test machines are slower and busier than a Lambda function.
+MAX_INIT_IN_MS = 3000
+
+
+class TestColdStartBenchmark(unittest.TestCase):
+    """
+    Benchmark the init of the handler module.
+    """
+
+    def test_handler_init_is_lazy(self):
+        """
+        Tests that importing the handler creates no clients and loads none of the lazy modules.
+        """
+        result = run_cold_start_benchmark(runs=3)
+        print(f"\n{result}")
+
+        self.assertEqual(result["client_count"], 0)
+        self.assertEqual(result["lazy_modules_loaded"], [])
+        self.assertLess(result["median_init_in_ms"], MAX_INIT_IN_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Compares the pages fetched and the wall time of the RAM enumeration strategies. Run with `-s` to
+see the results table.
+"""
+
+import time
+import unittest
+
+from lf_stale_ram_invite_monitor import ram_manager as ram_manager_module
+from lf_stale_ram_invite_monitor.ram_manager import FULL_SCAN, LAKE_FORMATION_SHARES, EnumerationOptions, RamManager
+from tests.simulator import FakeRamClient, SimulatorConfig, build_inventory
+
+LATENCY_IN_SECS = 0.001
+
+
+def fake_ram_client(share_count: int, lake_formation_ratio: float, principals_per_share: int) -> FakeRamClient:
+    """
+    A simulated RAM client where every invitation has expired.
+    """
+    inventory = build_inventory(share_count, principals_per_share=principals_per_share, lake_formation_ratio=lake_formation_ratio, expired_ratio=1.0)
+    return FakeRamClient(inventory, SimulatorConfig(latency_in_secs=LATENCY_IN_SECS, page_size=100))
+
+
+def run_enumeration(ram_client: FakeRamClient, enumeration_strategy: str, warm_cache: bool = False) -> tuple[dict, int, float]:
+    """
+    Enumerate the expired invitations and return them with the pages fetched and the wall time.
+    """
+    if not warm_cache:
+        ram_manager_module._lake_formation_share_cache.clear()  # pylint: disable=protected-access
+    ram_manager = RamManager(ram_client, 11 * 60 * 60, True, enumeration=EnumerationOptions(enumeration_strategy))
+    started_at = time.perf_counter()
+    expired_invitations = ram_manager.get_new_expired_ram_invitations()
+    return expired_invitations, ram_manager.pages_fetched, time.perf_counter() - started_at
+
+
+class TestEnumerationBenchmark(unittest.TestCase):
+    """
+    Benchmark the full scan against the Lake Formation share narrowing.
+    """
+
+    def setUp(self):
+        ram_manager_module._lake_formation_share_cache.clear()  # pylint: disable=protected-access
+
+    def test_enumeration_strategies(self):
+        """
+        Tests that the strategies find the same expired invitations, and that the narrowing reads
+        fewer pages when few resource shares are Lake Formation ones.
+        """
+        print(f"\n{'shares':>7} {'LF ratio':>9} {'strategy':>28} {'pages':>6} {'wall time (s)':>14}")
+        for share_count, lake_formation_ratio in [(2000, 0.05), (2000, 0.5)]:
+            ram_client = fake_ram_client(share_count, lake_formation_ratio, principals_per_share=10)
+            results = {
+                FULL_SCAN: run_enumeration(ram_client, FULL_SCAN),
+                LAKE_FORMATION_SHARES: run_enumeration(ram_client, LAKE_FORMATION_SHARES),
+                f"{LAKE_FORMATION_SHARES} (warm)": run_enumeration(ram_client, LAKE_FORMATION_SHARES, warm_cache=True),
+            }
+            for enumeration_strategy, (_, pages_fetched, wall_time) in results.items():
+                print(f"{share_count:>7} {lake_formation_ratio:>9} {enumeration_strategy:>28} {pages_fetched:>6} {wall_time:>14.3f}")
+
+            self.assertEqual(results[FULL_SCAN][0], results[LAKE_FORMATION_SHARES][0])
+            self.assertEqual(results[FULL_SCAN][0], results[f"{LAKE_FORMATION_SHARES} (warm)"][0])
+            # Narrowing pays off when most associations belong to other resource shares.
+            if lake_formation_ratio <= 0.05:
+                self.assertLess(results[LAKE_FORMATION_SHARES][1], results[FULL_SCAN][1])
+
+    def test_cursor_resumes_in_the_middle_of_a_batch(self):
+        """
+        Tests that a cursor taken between the pages of a batch of shares resumes with the next page.
+        """
+        ram_client = fake_ram_client(200, 0.5, principals_per_share=10)
+        ram_manager = RamManager(ram_client, 11 * 60 * 60, True, enumeration=EnumerationOptions(LAKE_FORMATION_SHARES))
+        pages = list(ram_manager.iter_new_expired_ram_invitations())
+        _, cursor = pages[2]
+
+        resumed_pages = list(RamManager(ram_client, 11 * 60 * 60, True, enumeration=EnumerationOptions(LAKE_FORMATION_SHARES)).iter_new_expired_ram_invitations(cursor))
+
+        self.assertEqual([page for page, _ in resumed_pages], [page for page, _ in pages[3:]])
+        self.assertIsNone(resumed_pages[-1][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
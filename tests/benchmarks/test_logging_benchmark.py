@@ -0,0 +1,39 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Runs the logging benchmark at a small size, so a change that logs a line per invitation at INFO
+again shows up in the test run. Run with `-s` to see the results.
+"""
+
+import unittest
+
+from tests.benchmarks.logging_benchmark import run_logging_benchmark
+
+# The interval summary never triggers in a run this short, the run logs a fixed number of lines.
+MAX_SUMMARY_LOG_LINES = 20
+
+
+class TestLoggingBenchmark(unittest.TestCase):
+    """
+    Benchmark the per invitation logging overhead of the handler.
+    """
+
+    def test_summary_logging_does_not_grow_with_the_invitations(self):
+        """
+        Tests that the summary mode logs a fixed number of lines, where the per item mode logs a line per record.
+        The wall times are only printed, a single small run is too noisy to compare them.
+        """
+        result = run_logging_benchmark(600, runs=1)
+        print(f"\n{result}")
+
+        modes = result["modes"]
+        # An expired invitation and its two dry run actions per resource share.
+        self.assertGreaterEqual(modes["per_item"]["log_lines"], 3 * modes["per_item"]["expired_count"])
+        self.assertLess(modes["summary"]["log_lines"], MAX_SUMMARY_LOG_LINES)
+        self.assertLess(modes["summary"]["log_bytes"], modes["per_item"]["log_bytes"] / 10)
+        self.assertLess(modes["summary"]["log_lines"], modes["per_item"]["log_lines"] / 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
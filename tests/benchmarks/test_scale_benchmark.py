@@ -0,0 +1,94 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Runs the scale benchmark at small sizes, so a change that breaks it or makes the number of API
+calls grow out of proportion shows up in the test run. Run with `-s` to see the results table.
+"""
+
+import unittest
+
+from aws_lambda_powertools import Logger
+
+from tests.benchmarks.scale_benchmark import RESULTS_HEADER, run_handler_benchmark, run_utility_benchmark
+from tests.simulator import SimulatorConfig
+
+
+class TestScaleBenchmark(unittest.TestCase):
+    """
+    Benchmark the handler and the utility against the simulator.
+    """
+
+    def setUp(self):
+        Logger().setLevel("WARNING")
+        print(f"\n{RESULTS_HEADER}")
+
+    def tearDown(self):
+        Logger().setLevel("INFO")
+
+    def test_handler_remediates_every_expired_invitation(self):
+        """
+        Tests that the handler remediates every expired invitation with the expected number of calls.
+        """
+        for share_count in (100, 1000):
+            result = run_handler_benchmark(share_count, SimulatorConfig(page_size=100))
+            print(result.as_row())
+
+            self.assertEqual(result.remediated_count, result.expired_count)
+            # One disassociate and one associate call per resource share, one page per 100 associations,
+            # and one verification call per 20 recreated resource shares.
+            self.assertEqual(result.api_calls["calls"]["AssociateResourceShare"], result.expired_count)
+            self.assertEqual(result.api_calls["calls"]["GetResourceShareAssociations"], share_count // 100 + -(-result.expired_count // 20))
+            self.assertGreater(result.remediations_per_second, 0)
+            self.assertIsNotNone(result.peak_memory_in_bytes)
+
+    def test_handler_recovers_from_throttling(self):
+        """
+        Tests that the handler remediates every expired invitation when RAM throttles.
+        """
+        result = run_handler_benchmark(200, measure_memory=False, service_configs={"ram": SimulatorConfig(throttle_rate=0.1, page_size=50, seed=7)})
+        print(result.as_row())
+
+        self.assertEqual(result.remediated_count, result.expired_count)
+        self.assertGreater(sum(result.api_calls["throttled"].values()), 0)
+
+    def test_handler_saves_injected_failures_for_a_retry(self):
+        """
+        Tests that the failed associations are saved in the table for a retry.
+        """
+        result = run_handler_benchmark(200, measure_memory=False, service_configs={"ram": SimulatorConfig(failure_rates={"AssociateResourceShare": 0.2}, seed=3)})
+        print(result.as_row())
+
+        failed_count = result.api_calls["failed"]["AssociateResourceShare"]
+        self.assertGreater(failed_count, 0)
+        self.assertEqual(result.remediated_count + failed_count, result.expired_count)
+        self.assertGreater(result.api_calls["calls"]["BatchWriteItem"], 0)
+
+    def test_handler_reads_the_share_index(self):
+        """
+        Tests that the handler builds the share index once and never scans the table.
+        """
+        result = run_handler_benchmark(300, SimulatorConfig(page_size=100), {"enumeration_strategy": "share_index"}, measure_memory=False, lake_formation_ratio=0.5)
+        print(result.as_row())
+
+        self.assertEqual(result.remediated_count, result.expired_count)
+        # The empty index is built from a single pass over the ~150 permissions, and saved to the table.
+        self.assertEqual(result.api_calls["calls"]["ListPermissions"], 2)
+        # The index is queried, the table is never scanned.
+        self.assertEqual(result.api_calls["calls"].get("Scan", 0), 0)
+        self.assertGreater(result.api_calls["calls"]["BatchWriteItem"], 0)
+
+    def test_utility(self):
+        """
+        Tests that the utility remediates every expired invitation, looking up 20 shares per call.
+        """
+        result = run_utility_benchmark(300, SimulatorConfig(page_size=100), measure_memory=False)
+        print(result.as_row())
+
+        self.assertEqual(result.remediated_count, result.expired_count)
+        # The associations of up to 20 resource shares are looked up in a single call.
+        self.assertEqual(result.api_calls["calls"]["GetResourceShareAssociations"], -(-300 // 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,18 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+An in-process simulator of the RAM, Lake Formation, DynamoDB and STS APIs the project calls, with
+configurable latency, throttling, page sizes and failure injection. It runs offline and is used by
+the benchmarks in tests/benchmarks.
+"""
+
+from .base import ApiCallStats, SimulatorConfig
+from .dynamodb import FakeDynamoDbClient
+from .inventory import SimulatedInventory, build_inventory
+from .lakeformation import FakeLakeFormationClient
+from .ram import FakeRamClient
+from .session import SimulatedSession
+from .sts import FakeStsClient
+
+__all__ = ["ApiCallStats", "FakeDynamoDbClient", "FakeLakeFormationClient", "FakeRamClient", "FakeStsClient", "SimulatedInventory", "SimulatedSession", "SimulatorConfig", "build_inventory"]
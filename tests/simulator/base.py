@@ -0,0 +1,199 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Building blocks shared by the simulated AWS clients: the knobs for latency, throttling, page sizes
+and failure injection, the API call counters, and a paginator that behaves like the boto3 one.
+"""
+
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from types import SimpleNamespace
+from typing import Callable, Iterator, Optional
+
+import botocore.exceptions
+import botocore.hooks
+
+# Number of paginated results a client keeps for continuation tokens.
+MAX_SNAPSHOTS = 64
+
+
+class SimulatorConfig:  # pylint: disable=too-few-public-methods
+    """
+    How a simulated service behaves. Rates are probabilities per API call. Throttles and injected
+    failures are raised to the caller directly, as if the botocore retries had been used up.
+    """
+
+    def __init__(self, latency_in_secs: float = 0.0, throttle_rate: float = 0.0, page_size: int = 100, failure_rates: Optional[dict[str, float]] = None, unprocessed_rate: float = 0.0, seed: int = 0):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.latency_in_secs = latency_in_secs
+        self.throttle_rate = throttle_rate
+        self.page_size = max(1, page_size)
+        # Operation name, like "AssociateResourceShare", -> rate of internal errors.
+        self.failure_rates = failure_rates or {}
+        # Rate of items that DynamoDB hands back as unprocessed in batch calls.
+        self.unprocessed_rate = unprocessed_rate
+        self.seed = seed
+
+
+class ApiCallStats:
+    """
+    Thread safe API call counters, shared by all clients of a simulated session.
+    """
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self.failed: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, outcome: Optional[str] = None):
+        """
+        Count a call, and whether it was throttled or failed.
+        """
+        with self._lock:
+            self.calls[operation] += 1
+            if outcome == "throttled":
+                self.throttled[operation] += 1
+            elif outcome == "failed":
+                self.failed[operation] += 1
+
+    @property
+    def total(self) -> int:
+        """
+        Number of API calls over all services.
+        """
+        return sum(self.calls.values())
+
+    def as_dict(self) -> dict:
+        """
+        The counters as plain dicts, for reports.
+        """
+        with self._lock:
+            return {"total": sum(self.calls.values()), "calls": dict(sorted(self.calls.items())), "throttled": dict(sorted(self.throttled.items())), "failed": dict(sorted(self.failed.items()))}
+
+
+class FakePaginator:  # pylint: disable=too-few-public-methods
+    """
+    Pages through an operation of a fake client by following its continuation token.
+    """
+
+    def __init__(self, operation: Callable[..., dict], input_token: str, output_token: str):
+        self.operation = operation
+        self.input_token = input_token
+        self.output_token = output_token
+
+    def paginate(self, PaginationConfig: Optional[dict] = None, **kwargs) -> Iterator[dict]:  # pylint: disable=invalid-name
+        """
+        Yield the pages of the operation, starting from PaginationConfig["StartingToken"] if given.
+        """
+        next_token = (PaginationConfig or {}).get("StartingToken")
+        while True:
+            page = self.operation(**kwargs, **({self.input_token: next_token} if next_token else {}))
+            yield page
+            next_token = page.get(self.output_token)
+            if not next_token:
+                return
+
+
+class FakeAwsClient:
+    """
+    Base class of the simulated clients. Every API call goes through `_call`, which counts it,
+    waits for the configured latency, and injects throttles and failures.
+    """
+
+    service_name = ""
+    error_codes: tuple[str, ...] = ()
+    throttling_error_code = "ThrottlingException"
+    internal_error_code = "InternalFailure"
+    invalid_token_error_code = "InvalidNextTokenException"
+    # Client method -> (input token, output token) of its paginator.
+    paginators: dict[str, tuple[str, str]] = {}
+
+    def __init__(self, region_name: str, config: Optional[SimulatorConfig] = None, stats: Optional[ApiCallStats] = None):
+        self.config = config or SimulatorConfig()
+        self.stats = stats or ApiCallStats()
+        # The events are emitted around every call like botocore does, so event hooks see the simulated calls.
+        self.meta = SimpleNamespace(region_name=region_name, service_model=SimpleNamespace(service_name=self.service_name), events=botocore.hooks.HierarchicalEmitter())
+        codes = set(self.error_codes) | {self.throttling_error_code, self.internal_error_code, self.invalid_token_error_code}
+        self.exceptions = SimpleNamespace(ClientError=botocore.exceptions.ClientError, **{code: type(code, (botocore.exceptions.ClientError,), {}) for code in codes})
+        # Every operation draws from its own generator, so the calls that are throttled do not depend on how the calls
+        # of other operations, made from other threads, are interleaved with them.
+        self._randoms: dict[str, random.Random] = {}
+        self._random_lock = threading.Lock()
+        # Continuation token -> the result the pages are cut from. Tokens stay valid, like in AWS, until they are evicted.
+        self._snapshots: OrderedDict[str, list] = OrderedDict()
+
+    def get_paginator(self, method_name: str) -> FakePaginator:
+        """
+        A paginator for one of the operations in `paginators`.
+        """
+        input_token, output_token = self.paginators[method_name]
+        return FakePaginator(getattr(self, method_name), input_token, output_token)
+
+    def chance(self, rate: float, operation: str = "") -> bool:
+        """
+        True with the given probability, reproducible through the configured seed for each operation.
+        """
+        if rate <= 0:
+            return False
+        with self._random_lock:
+            if operation not in self._randoms:
+                self._randoms[operation] = random.Random(f"{self.config.seed}:{operation}")  # nosec B311
+            return self._randoms[operation].random() < rate
+
+    def error(self, code: str, message: str, operation: str) -> botocore.exceptions.ClientError:
+        """
+        A client error of the modeled exception class for the code, like botocore raises it.
+        """
+        error_class = getattr(self.exceptions, code, botocore.exceptions.ClientError)
+        return error_class({"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": 400}}, operation)
+
+    def _call(self, operation: str):
+        """
+        Count the call, wait for the latency and raise the injected throttles and failures.
+        """
+        model = SimpleNamespace(name=operation)
+        context: dict = {}
+        self.meta.events.emit(f"before-call.{self.service_name}.{operation}", model=model, params={}, request_signer=None, context=context)
+        if self.config.latency_in_secs > 0:
+            time.sleep(self.config.latency_in_secs)
+        error = None
+        if self.chance(self.config.throttle_rate, operation):
+            self.stats.record(operation, "throttled")
+            error = self.error(self.throttling_error_code, "Rate exceeded", operation)
+        elif self.chance(self.config.failure_rates.get(operation, 0.0), operation):
+            self.stats.record(operation, "failed")
+            error = self.error(self.internal_error_code, "Injected failure", operation)
+        else:
+            self.stats.record(operation)
+        self.meta.events.emit(f"after-call.{self.service_name}.{operation}", http_response=None, parsed=error.response if error is not None else {"ResponseMetadata": {"RetryAttempts": 0}}, model=model, context=context)
+        if error is not None:
+            raise error
+
+    def _page(self, operation: str, result_key: str, output_token: str, next_token: Optional[str], max_results: Optional[int], load: Callable[[], list]) -> dict:  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """
+        Cut a page out of the result of `load`. The result is taken on the first page and kept
+        for the continuation tokens, so later pages do not see changes made while paging.
+        """
+        if next_token is None:
+            snapshot_id = uuid.uuid4().hex
+            self._snapshots[snapshot_id] = load()
+            if len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+            offset = 0
+        else:
+            match = re.fullmatch(r"([0-9a-f]{32}):(\d+)", next_token)
+            if match is None or match.group(1) not in self._snapshots:
+                raise self.error(self.invalid_token_error_code, "The specified value for NextToken is not valid", operation)
+            snapshot_id, offset = match.group(1), int(match.group(2))
+
+        items = self._snapshots[snapshot_id]
+        page_size = min(max_results, self.config.page_size) if max_results else self.config.page_size
+        response: dict = {result_key: [dict(item) for item in items[offset : offset + page_size]]}
+        if offset + page_size < len(items):
+            response[output_token] = f"{snapshot_id}:{offset + page_size}"
+        return response
@@ -0,0 +1,344 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+A fake DynamoDB client with tables, sparse global secondary indexes and the subset of the
+expression syntax the project uses: comparisons joined by AND / OR, attribute_exists,
+attribute_not_exists and begins_with. Indexes are kept sorted, so a query page costs the size of
+the page and not the size of the table.
+"""
+
+import bisect
+import re
+import threading
+from decimal import Decimal
+from typing import Optional
+
+from .base import ApiCallStats, FakeAwsClient, SimulatorConfig
+
+MAX_ITEMS_PER_BATCH_WRITE = 25
+MAX_KEYS_PER_BATCH_GET = 100
+COMPARISON = re.compile(r"^\s*(\S+)\s*(<=|>=|<>|=|<|>)\s*(\S+)\s*$")
+FUNCTION = re.compile(r"^\s*(attribute_exists|attribute_not_exists|begins_with)\(\s*([^,\s)]+)\s*(?:,\s*([^)\s]+)\s*)?\)\s*$")
+
+
+def attribute_value(value: dict):
+    """
+    The Python value of a DynamoDB attribute value, comparable within its type.
+    """
+    if "N" in value:
+        return Decimal(value["N"])
+    if "S" in value:
+        return value["S"]
+    if "SS" in value:
+        return frozenset(value["SS"])
+    if "BOOL" in value:
+        return value["BOOL"]
+    raise ValueError(f"The simulator does not support attribute value {value}")
+
+
+class Expression:  # pylint: disable=too-few-public-methods
+    """
+    A condition expression with its attribute names and values resolved.
+    """
+
+    def __init__(self, expression: Optional[str], names: Optional[dict], values: Optional[dict]):
+        self.names = names or {}
+        self.values = values or {}
+        # OR of ANDs of clauses, parentheses are not supported.
+        self.disjunction = [re.split(r"\s+AND\s+", conjunction) for conjunction in re.split(r"\s+OR\s+", expression)] if expression else []
+
+    def _name(self, token: str) -> str:
+        return self.names[token] if token.startswith("#") else token
+
+    def _operand(self, token: str, item: dict):
+        if token.startswith(":"):
+            return attribute_value(self.values[token])
+        name = self._name(token)
+        return attribute_value(item[name]) if name in item else None
+
+    def equality_value(self, attribute: str):
+        """
+        The value the attribute is compared to with `=`, used to find the partition of a key condition.
+        """
+        for conjunction in self.disjunction:
+            for clause in conjunction:
+                match = COMPARISON.match(clause)
+                if match and match.group(2) == "=" and self._name(match.group(1)) == attribute:
+                    return self._operand(match.group(3), {})
+        raise ValueError(f"The key condition needs an equality condition on {attribute}")
+
+    def matches(self, item: dict) -> bool:
+        """
+        True if the expression is empty or holds for the item.
+        """
+        return not self.disjunction or any(all(self._clause(clause, item) for clause in conjunction) for conjunction in self.disjunction)
+
+    def _clause(self, clause: str, item: dict) -> bool:  # pylint: disable=too-many-return-statements
+        function = FUNCTION.match(clause)
+        if function:
+            name, present = self._name(function.group(2)), self._name(function.group(2)) in item
+            if function.group(1) == "attribute_exists":
+                return present
+            if function.group(1) == "attribute_not_exists":
+                return not present
+            return present and str(attribute_value(item[name])).startswith(self._operand(function.group(3), item))
+        comparison = COMPARISON.match(clause)
+        if comparison is None:
+            raise ValueError(f"The simulator does not support the condition {clause}")
+        left, operator, right = self._operand(comparison.group(1), item), comparison.group(2), self._operand(comparison.group(3), item)
+        if left is None or right is None:
+            return False
+        if operator == "=":
+            return left == right
+        if operator == "<>":
+            return left != right
+        if operator == "<":
+            return left < right
+        if operator == "<=":
+            return left <= right
+        if operator == ">":
+            return left > right
+        return left >= right
+
+
+class FakeTable:
+    """
+    The items of a table, keyed by their primary key, and a sorted list per index.
+    """
+
+    def __init__(self, key_schema: list[dict], global_secondary_indexes: Optional[list[dict]] = None):
+        self.hash_key, self.range_key = self._keys(key_schema)
+        self.items: dict[tuple, dict] = {}
+        # Index name -> (hash key, range key); and index name -> sorted (hash value, range value, primary key).
+        self.index_keys: dict[Optional[str], tuple[str, Optional[str]]] = {None: (self.hash_key, self.range_key)}
+        self.index_entries: dict[Optional[str], list[tuple]] = {None: []}
+        for index in global_secondary_indexes or []:
+            self.index_keys[index["IndexName"]] = self._keys(index["KeySchema"])
+            self.index_entries[index["IndexName"]] = []
+
+    @staticmethod
+    def _keys(key_schema: list[dict]) -> tuple[str, Optional[str]]:
+        hash_key = next(key["AttributeName"] for key in key_schema if key["KeyType"] == "HASH")
+        range_key = next((key["AttributeName"] for key in key_schema if key["KeyType"] == "RANGE"), None)
+        return hash_key, range_key
+
+    def primary_key(self, key: dict) -> tuple:
+        """
+        The primary key of an item or key as a tuple of values.
+        """
+        return (attribute_value(key[self.hash_key]), attribute_value(key[self.range_key]) if self.range_key else "")
+
+    def _index_entry(self, index_name: Optional[str], item: dict) -> Optional[tuple]:
+        hash_key, range_key = self.index_keys[index_name]
+        if hash_key not in item or (range_key is not None and range_key not in item):
+            # Items without the index keys are not in the (sparse) index.
+            return None
+        return (attribute_value(item[hash_key]), attribute_value(item[range_key]) if range_key else "", self.primary_key(item))
+
+    def put(self, item: dict):
+        """
+        Insert or replace an item and keep the indexes sorted.
+        """
+        self.delete(item)
+        primary_key = self.primary_key(item)
+        self.items[primary_key] = item
+        for index_name, entries in self.index_entries.items():
+            entry = self._index_entry(index_name, item)
+            if entry is not None:
+                bisect.insort(entries, entry)
+
+    def delete(self, key: dict):
+        """
+        Remove an item and its index entries.
+        """
+        previous = self.items.pop(self.primary_key(key), None)
+        if previous is None:
+            return
+        for index_name, entries in self.index_entries.items():
+            entry = self._index_entry(index_name, previous)
+            if entry is not None:
+                position = bisect.bisect_left(entries, entry)
+                if position < len(entries) and entries[position] == entry:
+                    del entries[position]
+
+
+class FakeDynamoDbClient(FakeAwsClient):
+    """
+    The DynamoDB operations used by the monitor.
+    """
+
+    service_name = "dynamodb"
+    error_codes = ("ResourceNotFoundException", "ValidationException", "ConditionalCheckFailedException", "ProvisionedThroughputExceededException")
+    internal_error_code = "InternalServerError"
+    invalid_token_error_code = "ValidationException"
+    paginators = {"query": ("ExclusiveStartKey", "LastEvaluatedKey"), "scan": ("ExclusiveStartKey", "LastEvaluatedKey")}
+
+    def __init__(self, region_name: str, config: Optional[SimulatorConfig] = None, stats: Optional[ApiCallStats] = None):
+        super().__init__(region_name, config, stats)
+        self.tables: dict[str, FakeTable] = {}
+        self._lock = threading.RLock()
+
+    def create_table(self, TableName: str, KeySchema: list[dict], GlobalSecondaryIndexes: Optional[list[dict]] = None, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Create an empty table. Attribute definitions, throughput and billing mode are ignored.
+        """
+        self.stats.record("CreateTable")
+        self.tables[TableName] = FakeTable(KeySchema, GlobalSecondaryIndexes)
+        return {"TableDescription": {"TableName": TableName, "TableStatus": "ACTIVE"}}
+
+    def _table(self, table_name: str, operation: str) -> FakeTable:
+        if table_name not in self.tables:
+            raise self.error("ResourceNotFoundException", f"Requested resource not found: Table: {table_name} not found", operation)
+        return self.tables[table_name]
+
+    def get_item(self, TableName: str, Key: dict, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Get a single item. Reads are always consistent.
+        """
+        self._call("GetItem")
+        table = self._table(TableName, "GetItem")
+        with self._lock:
+            item = table.items.get(table.primary_key(Key))
+        return {"Item": dict(item)} if item is not None else {}
+
+    def put_item(self, TableName: str, Item: dict, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Insert or replace an item.
+        """
+        self._call("PutItem")
+        table = self._table(TableName, "PutItem")
+        with self._lock:
+            table.put(dict(Item))
+        return {}
+
+    def delete_item(self, TableName: str, Key: dict, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Delete an item, if it exists.
+        """
+        self._call("DeleteItem")
+        table = self._table(TableName, "DeleteItem")
+        with self._lock:
+            table.delete(Key)
+        return {}
+
+    def batch_write_item(self, RequestItems: dict, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Put and delete up to 25 items. An `unprocessed_rate` part of the requests is handed back unprocessed.
+        """
+        operation = "BatchWriteItem"
+        self._call(operation)
+        if sum(len(requests) for requests in RequestItems.values()) > MAX_ITEMS_PER_BATCH_WRITE:
+            raise self.error("ValidationException", f"Too many items requested for the BatchWriteItem call, the limit is {MAX_ITEMS_PER_BATCH_WRITE}", operation)
+        unprocessed: dict[str, list] = {}
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                table = self._table(table_name, operation)
+                for request in requests:
+                    if self.chance(self.config.unprocessed_rate, "BatchWriteItem"):
+                        unprocessed.setdefault(table_name, []).append(request)
+                    elif "PutRequest" in request:
+                        table.put(dict(request["PutRequest"]["Item"]))
+                    else:
+                        table.delete(request["DeleteRequest"]["Key"])
+        return {"UnprocessedItems": unprocessed}
+
+    def batch_get_item(self, RequestItems: dict, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Get up to 100 items. An `unprocessed_rate` part of the keys is handed back unprocessed.
+        """
+        operation = "BatchGetItem"
+        self._call(operation)
+        if sum(len(request["Keys"]) for request in RequestItems.values()) > MAX_KEYS_PER_BATCH_GET:
+            raise self.error("ValidationException", f"Too many items requested for the BatchGetItem call, the limit is {MAX_KEYS_PER_BATCH_GET}", operation)
+        responses: dict[str, list] = {}
+        unprocessed: dict[str, dict] = {}
+        with self._lock:
+            for table_name, request in RequestItems.items():
+                table = self._table(table_name, operation)
+                responses[table_name] = []
+                for key in request["Keys"]:
+                    if self.chance(self.config.unprocessed_rate, "BatchGetItem"):
+                        unprocessed.setdefault(table_name, {**request, "Keys": []})["Keys"].append(key)
+                    elif table.primary_key(key) in table.items:
+                        responses[table_name].append(dict(table.items[table.primary_key(key)]))
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
+
+    def query(  # pylint: disable=invalid-name,too-many-arguments,too-many-positional-arguments,too-many-locals
+        self,
+        TableName: str,
+        KeyConditionExpression: str,
+        IndexName: Optional[str] = None,
+        FilterExpression: Optional[str] = None,
+        ExpressionAttributeNames: Optional[dict] = None,
+        ExpressionAttributeValues: Optional[dict] = None,
+        ExclusiveStartKey: Optional[dict] = None,
+        Limit: Optional[int] = None,
+        **_kwargs,
+    ) -> dict:
+        """
+        Query a partition of the table or of an index in the order of its range key. Like
+        DynamoDB, a page holds up to `page_size` evaluated items before the filter is applied.
+        """
+        operation = "Query"
+        self._call(operation)
+        table = self._table(TableName, operation)
+        if IndexName not in table.index_keys:
+            raise self.error("ValidationException", f"The table does not have the specified index: {IndexName}", operation)
+        key_condition = Expression(KeyConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+        filter_expression = Expression(FilterExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+        hash_key, _range_key = table.index_keys[IndexName]
+        hash_value = key_condition.equality_value(hash_key)
+        page_size = min(Limit, self.config.page_size) if Limit else self.config.page_size
+
+        with self._lock:
+            entries = table.index_entries[IndexName]
+            if ExclusiveStartKey is not None:
+                start_item = table.items.get(table.primary_key(ExclusiveStartKey), ExclusiveStartKey)
+                position = bisect.bisect_right(entries, table._index_entry(IndexName, start_item))  # pylint: disable=protected-access
+            else:
+                position = bisect.bisect_left(entries, (hash_value,))
+            evaluated: list[dict] = []
+            # The items that match a key condition are next to each other in the index.
+            matched = ExclusiveStartKey is not None
+            while position < len(entries) and entries[position][0] == hash_value and len(evaluated) < page_size:
+                item = table.items[entries[position][2]]
+                position = position + 1
+                if key_condition.matches(item):
+                    evaluated.append(item)
+                    matched = True
+                elif matched:
+                    break
+            more = len(evaluated) == page_size and position < len(entries) and entries[position][0] == hash_value
+
+        items = [dict(item) for item in evaluated if filter_expression.matches(item)]
+        response: dict = {"Items": items, "Count": len(items), "ScannedCount": len(evaluated)}
+        if more:
+            last_item = evaluated[-1]
+            key_attributes = {table.hash_key, table.range_key, *table.index_keys[IndexName]} - {None}
+            response["LastEvaluatedKey"] = {attribute: last_item[attribute] for attribute in key_attributes if attribute in last_item}
+        return response
+
+    def scan(  # pylint: disable=invalid-name,too-many-arguments,too-many-positional-arguments,too-many-locals
+        self, TableName: str, FilterExpression: Optional[str] = None, ExpressionAttributeNames: Optional[dict] = None, ExpressionAttributeValues: Optional[dict] = None, ExclusiveStartKey: Optional[dict] = None, Limit: Optional[int] = None, **_kwargs
+    ) -> dict:
+        """
+        Read the whole table in the order of the primary key, `page_size` items at a time before the filter is applied.
+        """
+        operation = "Scan"
+        self._call(operation)
+        table = self._table(TableName, operation)
+        filter_expression = Expression(FilterExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+        page_size = min(Limit, self.config.page_size) if Limit else self.config.page_size
+
+        with self._lock:
+            entries = table.index_entries[None]
+            position = bisect.bisect_right(entries, table._index_entry(None, ExclusiveStartKey)) if ExclusiveStartKey is not None else 0  # pylint: disable=protected-access
+            evaluated = [table.items[entry[2]] for entry in entries[position : position + page_size]]
+            more = position + page_size < len(entries)
+
+        items = [dict(item) for item in evaluated if filter_expression.matches(item)]
+        response: dict = {"Items": items, "Count": len(items), "ScannedCount": len(evaluated)}
+        if more:
+            response["LastEvaluatedKey"] = {attribute: evaluated[-1][attribute] for attribute in (table.hash_key, table.range_key) if attribute is not None}
+        return response
@@ -0,0 +1,55 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Runs the Lambda handler against the simulator. Importing this module sets the region and dummy
+credentials the handler needs before it is imported, as its clients are replaced by simulated ones
+but must not pick up real credentials.
+"""
+
+import os
+import unittest
+from typing import Optional
+from unittest.mock import patch
+
+from .base import SimulatorConfig
+from .inventory import SimulatedInventory
+from .session import SimulatedSession
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "simulator")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "simulator")  # nosec B105:hardcoded_password_string
+
+from lf_stale_ram_invite_monitor import lambda_handler as lambda_handler_module  # noqa: E402 pylint: disable=wrong-import-position,wrong-import-order
+
+DDB_TABLE_NAME = "lf_stale_ram_invite_monitor"
+ELEVEN_HOURS_IN_SECS = 11 * 60 * 60
+
+
+class SimulatedHandlerTestCase(unittest.TestCase):
+    """
+    Base class of the tests that run the handler against a simulated inventory.
+    """
+
+    def simulate(self, inventory: SimulatedInventory, config: Optional[SimulatorConfig] = None) -> SimulatedSession:
+        """
+        Create a session over the inventory with the table of the monitor, and hand its clients to the handler.
+        """
+        session = SimulatedSession(inventory, config)
+        session.create_retry_queue_table(DDB_TABLE_NAME)
+        self.patch_handler("clients", session)
+        return session
+
+    def patch_handler(self, name: str, value):
+        """
+        Replace an attribute of the handler module until the end of the test.
+        """
+        handler_patch = patch.object(lambda_handler_module, name, value)
+        handler_patch.start()
+        self.addCleanup(handler_patch.stop)
+
+    def invoke(self, context=None, **parameters) -> dict:
+        """
+        Run the handler on the table of the monitor, with the default timeout and changes to RAM, unless the parameters say otherwise.
+        """
+        return lambda_handler_module.lambda_handler({"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": ELEVEN_HOURS_IN_SECS, "dry_run": False, **parameters}, context)
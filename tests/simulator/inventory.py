@@ -0,0 +1,159 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+The state of a simulated account: resource shares, their principal associations and the Lake
+Formation permissions that were granted through them. The fake RAM and Lake Formation clients
+read and change this state.
+"""
+
+import datetime
+import random
+import threading
+from typing import Iterable, Iterator, Optional
+
+LAKE_FORMATION_SHARE_PREFIX = "LakeFormation-"
+DEFAULT_REGION = "us-east-1"
+DEFAULT_ACCOUNT_ID = "123456789012"
+
+
+def utc_now() -> datetime.datetime:
+    """
+    The current time as RAM returns it.
+    """
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class SimulatedInventory:  # pylint: disable=too-many-instance-attributes
+    """
+    Resource shares owned by the simulated account and their principal associations.
+    """
+
+    def __init__(self, region_name: str = DEFAULT_REGION, account_id: str = DEFAULT_ACCOUNT_ID):
+        self.region_name = region_name
+        self.account_id = account_id
+        # Resource share arn -> resource share, as returned by get_resource_shares.
+        self.resource_shares: dict[str, dict] = {}
+        # Resource share arn -> principal -> association, as returned by get_resource_share_associations.
+        self.associations: dict[str, dict[str, dict]] = {}
+        # Resource share arn -> arns of the Glue resources it shares.
+        self.shared_resources: dict[str, list[str]] = {}
+        # Lake Formation permissions, as returned by list_permissions.
+        self.permissions: list[dict] = []
+        # Principals whose new invitations end up FAILED instead of ASSOCIATING.
+        self.failing_principals: set[str] = set()
+        self.lock = threading.RLock()
+
+    def add_resource_share(self, name: str, principals: Iterable[str], created_at: datetime.datetime, status: str = "ACTIVE", association_status: str = "ASSOCIATING") -> str:  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """
+        Add a resource share with an association per principal, and the Lake Formation
+        permissions of a Lake Formation share. Returns the resource share arn.
+        """
+        with self.lock:
+            resource_share_arn = f"arn:aws:ram:{self.region_name}:{self.account_id}:resource-share/{len(self.resource_shares):08d}-{name}"
+            self.resource_shares[resource_share_arn] = {"resourceShareArn": resource_share_arn, "name": name, "owningAccountId": self.account_id, "status": status, "creationTime": created_at, "lastUpdatedTime": created_at}
+            self.associations[resource_share_arn] = {principal: self._association(resource_share_arn, principal, association_status, created_at) for principal in principals}
+            database_name = f"database_{len(self.resource_shares)}"
+            self.shared_resources[resource_share_arn] = [f"arn:aws:glue:{self.region_name}:{self.account_id}:database/{database_name}"]
+            if name.startswith(LAKE_FORMATION_SHARE_PREFIX):
+                for principal in principals:
+                    self.permissions.append(
+                        {
+                            "Principal": {"DataLakePrincipalIdentifier": principal},
+                            "Resource": {"Database": {"CatalogId": self.account_id, "Name": database_name}},
+                            "Permissions": ["DESCRIBE"],
+                            "PermissionsWithGrantOption": [],
+                            "AdditionalDetails": {"ResourceShare": [resource_share_arn]},
+                        }
+                    )
+            return resource_share_arn
+
+    def grant(self, resource_share_arn: str, principal: str):
+        """
+        Grant the principal permissions on the resource of a resource share, like Lake Formation
+        does when it reuses a share: the principal is invited and the share is updated.
+        """
+        now = utc_now()
+        with self.lock:
+            database_name = self.shared_resources[resource_share_arn][0].rsplit("/", 1)[1]
+            self.associations[resource_share_arn][principal] = self._association(resource_share_arn, principal, "ASSOCIATING", now)
+            self.resource_shares[resource_share_arn] = {**self.resource_shares[resource_share_arn], "lastUpdatedTime": now}
+            self.permissions.append(
+                {
+                    "Principal": {"DataLakePrincipalIdentifier": principal},
+                    "Resource": {"Database": {"CatalogId": self.account_id, "Name": database_name}},
+                    "Permissions": ["DESCRIBE"],
+                    "PermissionsWithGrantOption": [],
+                    "AdditionalDetails": {"ResourceShare": [resource_share_arn]},
+                }
+            )
+
+    def _association(self, resource_share_arn: str, principal: str, status: str, created_at: datetime.datetime) -> dict:
+        """
+        A principal association of a resource share.
+        """
+        return {
+            "resourceShareArn": resource_share_arn,
+            "resourceShareName": self.resource_shares[resource_share_arn]["name"],
+            "associatedEntity": principal,
+            "associationType": "PRINCIPAL",
+            "status": status,
+            "creationTime": created_at,
+            "lastUpdatedTime": created_at,
+            "external": True,
+        }
+
+    def iter_associations(self, resource_share_arns: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """
+        The associations of the given resource shares, or of all resource shares.
+        """
+        with self.lock:
+            for resource_share_arn in resource_share_arns if resource_share_arns is not None else list(self.associations):
+                yield from list(self.associations.get(resource_share_arn, {}).values())
+
+    def set_association_status(self, resource_share_arn: str, principals: Iterable[str], status: str) -> list[dict]:
+        """
+        Change the status of the associations of the principals. An association that moves to
+        ASSOCIATING is a new invitation, so its creation time is reset.
+        """
+        now = utc_now()
+        with self.lock:
+            associations = []
+            for principal in principals:
+                previous = self.associations[resource_share_arn].get(principal)
+                # Associations are replaced rather than changed, so pages that were already cut keep their state.
+                association = self._association(resource_share_arn, principal, status, now if previous is None or status == "ASSOCIATING" else previous["creationTime"])
+                association["lastUpdatedTime"] = now
+                self.associations[resource_share_arn][principal] = association
+                associations.append(dict(association))
+            return associations
+
+    def expired_invitations(self, timeout_in_secs: int) -> dict[str, set[str]]:
+        """
+        The principals of Lake Formation shares that have been associating for longer than the timeout.
+        """
+        timeout = utc_now() - datetime.timedelta(seconds=timeout_in_secs)
+        expired: dict[str, set[str]] = {}
+        for association in self.iter_associations():
+            if association["resourceShareName"].startswith(LAKE_FORMATION_SHARE_PREFIX) and association["status"] == "ASSOCIATING" and association["creationTime"] < timeout:
+                expired.setdefault(association["resourceShareArn"], set()).add(association["associatedEntity"])
+        return expired
+
+
+def build_inventory(share_count: int, principals_per_share: int = 1, lake_formation_ratio: float = 1.0, expired_ratio: float = 0.5, deleted_ratio: float = 0.0, seed: int = 0, region_name: str = DEFAULT_REGION) -> SimulatedInventory:  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    """
+    An account with `share_count` resource shares. A `lake_formation_ratio` part of them are Lake
+    Formation shares, an `expired_ratio` part of the invitations were sent 12 hours ago and the
+    rest an hour ago, and a `deleted_ratio` part of the shares was deleted while their
+    associations are still listed.
+    """
+    rng = random.Random(seed)  # nosec B311
+    inventory = SimulatedInventory(region_name)
+    now = utc_now()
+    for i in range(share_count):
+        lake_formation = rng.random() < lake_formation_ratio
+        name = f"{LAKE_FORMATION_SHARE_PREFIX}V4-{i:08d}" if lake_formation else f"Other-{i:08d}"
+        created_at = now - datetime.timedelta(hours=12 if rng.random() < expired_ratio else 1)
+        principals = [f"{100000000000 + (i * principals_per_share + j) % 900000000000:012d}" for j in range(principals_per_share)]
+        inventory.add_resource_share(name, principals, created_at, status="DELETED" if rng.random() < deleted_ratio else "ACTIVE")
+    return inventory
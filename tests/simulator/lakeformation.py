@@ -0,0 +1,41 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+A fake Lake Formation client that serves the cross account permissions of a simulated inventory.
+"""
+
+from typing import Optional
+
+from .base import ApiCallStats, FakeAwsClient, SimulatorConfig
+from .inventory import SimulatedInventory
+
+
+class FakeLakeFormationClient(FakeAwsClient):
+    """
+    The Lake Formation operations used by the utility.
+    """
+
+    service_name = "lakeformation"
+    error_codes = ("InvalidInputException", "EntityNotFoundException", "OperationTimeoutException")
+    internal_error_code = "InternalServiceException"
+    invalid_token_error_code = "InvalidInputException"
+    paginators = {"list_permissions": ("NextToken", "NextToken")}
+
+    def __init__(self, inventory: SimulatedInventory, config: Optional[SimulatorConfig] = None, stats: Optional[ApiCallStats] = None):
+        super().__init__(inventory.region_name, config, stats)
+        self.inventory = inventory
+
+    def list_permissions(self, Principal: Optional[dict] = None, Resource: Optional[dict] = None, NextToken: Optional[str] = None, MaxResults: Optional[int] = None, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        The permissions granted in the catalog of the simulated account, optionally for a single principal or resource.
+        """
+        operation = "ListPermissions"
+        self._call(operation)
+
+        def load() -> list:
+            with self.inventory.lock:
+                permissions = list(self.inventory.permissions)
+            return [permission for permission in permissions if (Principal is None or permission["Principal"]["DataLakePrincipalIdentifier"] == Principal["DataLakePrincipalIdentifier"]) and (Resource is None or permission["Resource"] == Resource)]
+
+        return self._page(operation, "PrincipalResourcePermissions", "NextToken", NextToken, MaxResults, load)
@@ -0,0 +1,116 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+A fake RAM client that serves the resource shares of a simulated inventory.
+"""
+
+from typing import Optional
+
+from .base import ApiCallStats, FakeAwsClient, SimulatorConfig
+from .inventory import SimulatedInventory
+
+# RAM accepts up to this many resource share arns and principals in a single call.
+MAX_RESOURCE_SHARE_ARNS_PER_CALL = 100
+MAX_PRINCIPALS_PER_CALL = 100
+
+
+class FakeRamClient(FakeAwsClient):
+    """
+    The RAM operations used by the monitor and the utility.
+    """
+
+    service_name = "ram"
+    error_codes = ("UnknownResourceException", "InvalidParameterException", "MalformedArnException")
+    internal_error_code = "ServerInternalException"
+    paginators = {"get_resource_share_associations": ("nextToken", "nextToken"), "get_resource_shares": ("nextToken", "nextToken"), "list_resources": ("nextToken", "nextToken")}
+
+    def __init__(self, inventory: SimulatedInventory, config: Optional[SimulatorConfig] = None, stats: Optional[ApiCallStats] = None):
+        super().__init__(inventory.region_name, config, stats)
+        self.inventory = inventory
+
+    def get_resource_share_associations(  # pylint: disable=invalid-name,too-many-arguments,too-many-positional-arguments
+        self, associationType: str, resourceShareArns: Optional[list[str]] = None, principal: Optional[str] = None, associationStatus: Optional[str] = None, nextToken: Optional[str] = None, maxResults: Optional[int] = None
+    ) -> dict:
+        """
+        The principal associations, filtered like RAM does.
+        """
+        operation = "GetResourceShareAssociations"
+        self._call(operation)
+        if associationType != "PRINCIPAL":
+            raise self.error("InvalidParameterException", "The simulator only has PRINCIPAL associations", operation)
+        if resourceShareArns is not None and len(resourceShareArns) > MAX_RESOURCE_SHARE_ARNS_PER_CALL:
+            raise self.error("InvalidParameterException", f"At most {MAX_RESOURCE_SHARE_ARNS_PER_CALL} resource share arns are allowed", operation)
+
+        def load() -> list:
+            return [association for association in self.inventory.iter_associations(resourceShareArns) if (associationStatus is None or association["status"] == associationStatus) and (principal is None or association["associatedEntity"] == principal)]
+
+        return self._page(operation, "resourceShareAssociations", "nextToken", nextToken, maxResults, load)
+
+    def get_resource_shares(  # pylint: disable=invalid-name,too-many-arguments,too-many-positional-arguments
+        self, resourceOwner: str, resourceShareStatus: Optional[str] = None, resourceShareArns: Optional[list[str]] = None, name: Optional[str] = None, nextToken: Optional[str] = None, maxResults: Optional[int] = None
+    ) -> dict:
+        """
+        The resource shares owned by the simulated account. Shares from other accounts are not simulated.
+        """
+        operation = "GetResourceShares"
+        self._call(operation)
+
+        def load() -> list:
+            if resourceOwner != "SELF":
+                return []
+            with self.inventory.lock:
+                resource_shares = [self.inventory.resource_shares[arn] for arn in resourceShareArns if arn in self.inventory.resource_shares] if resourceShareArns else list(self.inventory.resource_shares.values())
+            return [resource_share for resource_share in resource_shares if (resourceShareStatus is None or resource_share["status"] == resourceShareStatus) and (name is None or resource_share["name"] == name)]
+
+        return self._page(operation, "resourceShares", "nextToken", nextToken, maxResults, load)
+
+    def list_resources(self, resourceOwner: str, resourceShareArns: Optional[list[str]] = None, nextToken: Optional[str] = None, maxResults: Optional[int] = None, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        The Glue resources shared by the resource shares of the simulated account.
+        """
+        operation = "ListResources"
+        self._call(operation)
+
+        def load() -> list:
+            if resourceOwner != "SELF":
+                return []
+            with self.inventory.lock:
+                return [
+                    {"arn": resource_arn, "type": "glue:Database", "resourceShareArn": resource_share_arn, "status": "AVAILABLE"}
+                    for resource_share_arn in (resourceShareArns if resourceShareArns is not None else list(self.inventory.shared_resources))
+                    for resource_arn in self.inventory.shared_resources.get(resource_share_arn, [])
+                ]
+
+        return self._page(operation, "resources", "nextToken", nextToken, maxResults, load)
+
+    def associate_resource_share(self, resourceShareArn: str, principals: Optional[list[str]] = None, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Send a new invitation to the principals.
+        """
+        operation = "AssociateResourceShare"
+        self._call(operation)
+        self._check_call(operation, resourceShareArn, principals)
+        failing = [principal for principal in principals or [] if principal in self.inventory.failing_principals]
+        self.inventory.set_association_status(resourceShareArn, failing, "FAILED")
+        return {"resourceShareAssociations": self.inventory.set_association_status(resourceShareArn, [principal for principal in principals or [] if principal not in failing], "ASSOCIATING")}
+
+    def disassociate_resource_share(self, resourceShareArn: str, principals: Optional[list[str]] = None, **_kwargs) -> dict:  # pylint: disable=invalid-name
+        """
+        Withdraw the invitations of the principals.
+        """
+        operation = "DisassociateResourceShare"
+        self._call(operation)
+        self._check_call(operation, resourceShareArn, principals)
+        return {"resourceShareAssociations": self.inventory.set_association_status(resourceShareArn, principals or [], "DISASSOCIATED")}
+
+    def _check_call(self, operation: str, resource_share_arn: str, principals: Optional[list[str]]):
+        """
+        Raise the errors RAM raises for a missing resource share or too many principals.
+        """
+        with self.inventory.lock:
+            resource_share = self.inventory.resource_shares.get(resource_share_arn)
+        if resource_share is None or resource_share["status"] == "DELETED":
+            raise self.error("UnknownResourceException", f"Resource share {resource_share_arn} could not be found", operation)
+        if principals is not None and len(principals) > MAX_PRINCIPALS_PER_CALL:
+            raise self.error("InvalidParameterException", f"At most {MAX_PRINCIPALS_PER_CALL} principals are allowed", operation)
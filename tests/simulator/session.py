@@ -0,0 +1,52 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+A stand-in for a boto3 session that hands out the simulated clients, so code that creates its
+own clients can run against the simulator.
+"""
+
+from typing import Optional
+
+from .base import ApiCallStats, SimulatorConfig
+from .dynamodb import FakeDynamoDbClient
+from .inventory import SimulatedInventory
+from .lakeformation import FakeLakeFormationClient
+from .ram import FakeRamClient
+from .sts import FakeStsClient
+
+RETRY_QUEUE_TABLE_KEY_SCHEMA = [{"AttributeName": "resourceShareArn", "KeyType": "HASH"}]
+RETRY_QUEUE_TABLE_INDEXES = [{"IndexName": "retry-queue-index", "KeySchema": [{"AttributeName": "retry_queue", "KeyType": "HASH"}, {"AttributeName": "next_attempt_at", "KeyType": "RANGE"}], "Projection": {"ProjectionType": "ALL"}}]
+
+
+class SimulatedSession:
+    """
+    One client per service, all sharing the inventory and the API call counters. Services can
+    get their own config, otherwise `config` is used.
+    """
+
+    def __init__(self, inventory: SimulatedInventory, config: Optional[SimulatorConfig] = None, service_configs: Optional[dict[str, SimulatorConfig]] = None):
+        self.inventory = inventory
+        self.region_name = inventory.region_name
+        self.stats = ApiCallStats()
+        service_configs = service_configs or {}
+        self.clients = {
+            "ram": FakeRamClient(inventory, service_configs.get("ram", config), self.stats),
+            "lakeformation": FakeLakeFormationClient(inventory, service_configs.get("lakeformation", config), self.stats),
+            "dynamodb": FakeDynamoDbClient(inventory.region_name, service_configs.get("dynamodb", config), self.stats),
+            "sts": FakeStsClient(inventory, service_configs.get("sts", config), self.stats),
+        }
+
+    def client(self, service_name: str, *_args, **_kwargs):
+        """
+        The simulated client of a service, like boto3.session.Session.client.
+        """
+        if service_name not in self.clients:
+            raise ValueError(f"The simulator does not have a {service_name} client")
+        return self.clients[service_name]
+
+    def create_retry_queue_table(self, table_name: str):
+        """
+        Create the monitor's table as the template defines it.
+        """
+        self.clients["dynamodb"].create_table(TableName=table_name, KeySchema=RETRY_QUEUE_TABLE_KEY_SCHEMA, GlobalSecondaryIndexes=RETRY_QUEUE_TABLE_INDEXES)
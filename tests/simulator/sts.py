@@ -0,0 +1,30 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+A fake STS client that answers for the account of a simulated inventory.
+"""
+
+from typing import Optional
+
+from .base import ApiCallStats, FakeAwsClient, SimulatorConfig
+from .inventory import SimulatedInventory
+
+
+class FakeStsClient(FakeAwsClient):
+    """
+    The STS operations used by the utility.
+    """
+
+    service_name = "sts"
+
+    def __init__(self, inventory: SimulatedInventory, config: Optional[SimulatorConfig] = None, stats: Optional[ApiCallStats] = None):
+        super().__init__(inventory.region_name, config, stats)
+        self.inventory = inventory
+
+    def get_caller_identity(self, **_kwargs) -> dict:
+        """
+        The identity of the function in the simulated account.
+        """
+        self._call("GetCallerIdentity")
+        return {"Account": self.inventory.account_id, "Arn": f"arn:aws:sts::{self.inventory.account_id}:assumed-role/lf-stale-ram-invite-monitor/simulator", "UserId": "simulator"}
@@ -0,0 +1,65 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the clients.py file.
+"""
+
+import unittest
+
+from lf_stale_ram_invite_monitor.clients import DEFAULT_MAX_POOL_CONNECTIONS, ClientFactory, client_config
+
+
+class TestClientFactory(unittest.TestCase):
+    """
+    Test the client config and the lazy client creation.
+    """
+
+    def test_client_config(self):
+        """
+        Tests the retries, timeouts, pool size and keep-alive of the client config.
+        """
+        options = client_config(32, "dynamodb")._user_provided_options  # pylint: disable=protected-access
+
+        self.assertEqual(options["retries"], {"mode": "adaptive", "max_attempts": 5})
+        self.assertEqual({key: options[key] for key in ("connect_timeout", "read_timeout", "max_pool_connections", "tcp_keepalive")}, {"connect_timeout": 2, "read_timeout": 20, "max_pool_connections": 32, "tcp_keepalive": True})
+
+    def test_ram_throttles_reach_the_remediation_engine(self):
+        """
+        Tests that the RAM client keeps the default attempts in standard mode, which leaves the rate limiting to the AIMD limiter.
+        """
+        ram_client = ClientFactory(region_name="eu-west-1").client("ram")
+
+        self.assertEqual(ram_client.meta.config.retries, {"mode": "standard", "total_max_attempts": 3})
+
+    def test_creates_clients_on_first_use(self):
+        """
+        Tests that clients are created on first use and then reused.
+        """
+        factory = ClientFactory(region_name="eu-west-1")
+        self.assertIsNone(factory.session)
+        self.assertEqual(factory.created_count, 0)
+
+        ram_client = factory.client("ram")
+
+        self.assertIs(factory.client("ram"), ram_client)
+        self.assertEqual(ram_client.meta.region_name, "eu-west-1")
+        self.assertEqual(ram_client.meta.config.max_pool_connections, DEFAULT_MAX_POOL_CONNECTIONS)
+        self.assertEqual(factory.created_count, 1)
+
+    def test_larger_pools_get_their_own_client(self):
+        """
+        Tests that a client with a larger connection pool is created next to the smaller one.
+        """
+        factory = ClientFactory(region_name="eu-west-1")
+
+        small_pool_client = factory.client("dynamodb", max_pool_connections=4)
+        large_pool_client = factory.client("dynamodb", max_pool_connections=40)
+
+        self.assertIs(small_pool_client, factory.client("dynamodb"))
+        self.assertEqual(large_pool_client.meta.config.max_pool_connections, 40)
+        self.assertEqual(factory.created_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
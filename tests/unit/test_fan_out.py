@@ -0,0 +1,117 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the fan_out.py file.
+"""
+
+import threading
+import time
+import unittest
+
+from lf_stale_ram_invite_monitor.fan_out import ShardCoordinator, shard_for
+
+
+class FakeDispatcher:  # pylint: disable=too-few-public-methods
+    """
+    Records the batches it receives, recreates every principal and fails every batch of `fail_shard`.
+    """
+
+    def __init__(self, fail_shard: int = -1):
+        self.batches: list[dict] = []
+        self.fail_shard = fail_shard
+        self._lock = threading.Lock()
+
+    def dispatch(self, worker_event: dict) -> dict:
+        """
+        Record the batch and recreate all of its principals.
+        """
+        with self._lock:
+            self.batches.append(worker_event)
+        if worker_event["shard"] == self.fail_shard:
+            raise RuntimeError("Worker timed out")
+        return {"recreated_count": sum(len(aws_account_ids) for _, aws_account_ids, _ in worker_event["shares"]), "failed_count": 0, "unprocessed_shares": []}
+
+
+class SlowDispatcher(FakeDispatcher):  # pylint: disable=too-few-public-methods
+    """
+    Takes a while per batch and records how many batches of a shard run at the same time.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.running: dict[int, int] = {}
+        self.max_running: dict[int, int] = {}
+
+    def dispatch(self, worker_event: dict) -> dict:
+        """
+        Record the batches running for the shard while the batch is dispatched.
+        """
+        shard = worker_event["shard"]
+        with self._lock:
+            self.running[shard] = self.running.get(shard, 0) + 1
+            self.max_running[shard] = max(self.max_running.get(shard, 0), self.running[shard])
+        time.sleep(0.01)
+        response = super().dispatch(worker_event)
+        with self._lock:
+            self.running[shard] = self.running[shard] - 1
+        return response
+
+
+class TestShardCoordinator(unittest.TestCase):
+    """
+    Test partitioning and aggregation of the coordinator.
+    """
+
+    def setUp(self):
+        self.shares = [(f"arn:share/{i}", {"111111111111", "222222222222"}, False) for i in range(100)]
+
+    def test_shares_are_partitioned_by_arn(self):
+        """
+        Tests that every batch only holds shares of its own shard.
+        """
+        dispatcher = FakeDispatcher()
+        coordinator = ShardCoordinator(dispatcher, shard_count=4, max_parallel_workers=2, max_shares_per_invocation=10)
+
+        coordinator.run(self.shares, {"ddb_table_name": "table"})
+
+        self.assertEqual(coordinator.recreated_count, 200)
+        self.assertEqual(coordinator.share_count, 100)
+        for batch in dispatcher.batches:
+            self.assertEqual(batch["mode"], "worker")
+            self.assertLessEqual(len(batch["shares"]), 10)
+            for resource_share_arn, _, _ in batch["shares"]:
+                self.assertEqual(shard_for(resource_share_arn, 4), batch["shard"])
+
+    def test_failed_dispatch_is_reported_as_unprocessed(self):
+        """
+        Tests that the shares of a failed dispatch are reported as unprocessed.
+        """
+        coordinator = ShardCoordinator(FakeDispatcher(fail_shard=0), shard_count=4, max_parallel_workers=4)
+
+        coordinator.run(self.shares, {})
+
+        failed_shares = [share for share in self.shares if shard_for(share[0], 4) == 0]
+        self.assertEqual(coordinator.failed_count, 2 * len(failed_shares))
+        self.assertEqual(coordinator.recreated_count, 200 - 2 * len(failed_shares))
+        self.assertEqual(sorted(arn for arn, _ in coordinator.unprocessed_shares), sorted(arn for arn, _, _ in failed_shares))
+
+    def test_batches_of_a_shard_run_one_after_the_other(self):
+        """
+        Tests that batches of a shard never overlap and keep their order, with fewer pool threads than shards.
+        """
+        dispatcher = SlowDispatcher()
+        coordinator = ShardCoordinator(dispatcher, shard_count=3, max_parallel_workers=2, max_shares_per_invocation=5)
+
+        coordinator.run(self.shares, {})
+
+        self.assertEqual(coordinator.share_count, 100)
+        self.assertEqual(coordinator.recreated_count, 200)
+        self.assertEqual(set(dispatcher.max_running.values()), {1})
+        for shard in range(3):
+            dispatched = [resource_share_arn for batch in dispatcher.batches if batch["shard"] == shard for resource_share_arn, _, _ in batch["shares"]]
+            self.assertEqual(dispatched, [share[0] for share in self.shares if shard_for(share[0], 3) == shard])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the instrumentation.py file.
+"""
+
+import contextlib
+import datetime
+import io
+import json
+import os
+import pstats
+import tempfile
+import unittest
+
+import boto3
+from moto import mock_aws
+
+from lf_stale_ram_invite_monitor.instrumentation import LATENCY_SAMPLE_SIZE, Instrumentation
+from tests.simulator import SimulatedInventory
+from tests.simulator.handler import SimulatedHandlerTestCase
+
+
+class TestInstrumentation(unittest.TestCase):
+    """
+    Test the phase timings and API call stats.
+    """
+
+    def test_latency_histogram(self):
+        """
+        Tests the call counts and the latency histogram of an operation.
+        """
+        instrumentation = Instrumentation()
+        for latency_in_ms in (5, 8, 120, 7000):
+            instrumentation.record_call("ram.AssociateResourceShare", latency_in_ms)
+        instrumentation.record_call("ram.AssociateResourceShare", 30, "ThrottlingException", 2)
+
+        stats = instrumentation.as_dict()["api_calls"]["ram.AssociateResourceShare"]
+
+        self.assertEqual({key: stats[key] for key in ("calls", "errors", "throttled", "retries")}, {"calls": 5, "errors": 1, "throttled": 1, "retries": 2})
+        self.assertEqual(stats["latency_histogram_in_ms"], {"<=10": 2, "<=50": 1, "<=250": 1, ">5000": 1})
+        self.assertEqual(stats["max_latency_in_ms"], 7000)
+
+    def test_latency_samples(self):
+        """
+        Tests that the latency samples of an operation are capped, and hold every call until the cap.
+        """
+        instrumentation = Instrumentation()
+        for latency_in_ms in range(LATENCY_SAMPLE_SIZE):
+            instrumentation.record_call("ram.AssociateResourceShare", latency_in_ms)
+        self.assertEqual(instrumentation.operations["ram.AssociateResourceShare"].latency_samples_in_ms, list(range(LATENCY_SAMPLE_SIZE)))
+
+        for latency_in_ms in range(LATENCY_SAMPLE_SIZE, 10 * LATENCY_SAMPLE_SIZE):
+            instrumentation.record_call("ram.AssociateResourceShare", latency_in_ms)
+        samples = instrumentation.operations["ram.AssociateResourceShare"].latency_samples_in_ms
+        self.assertEqual(len(samples), LATENCY_SAMPLE_SIZE)
+        self.assertTrue(any(latency_in_ms >= LATENCY_SAMPLE_SIZE for latency_in_ms in samples))
+
+    def test_phases_and_timed_iterables(self):
+        """
+        Tests that phases and timed iterables are both reported as phase durations.
+        """
+        instrumentation = Instrumentation()
+        with instrumentation.phase("persistence"):
+            pass
+
+        self.assertEqual(list(instrumentation.timed_iter("enumeration", range(3))), [0, 1, 2])
+        self.assertEqual(set(instrumentation.as_dict()["phases_in_secs"]), {"enumeration", "persistence"})
+
+    @mock_aws
+    def test_botocore_hooks(self):
+        """
+        Tests that the botocore hooks count calls and errors once per client.
+        """
+        instrumentation = Instrumentation()
+        ddb_client = boto3.client("dynamodb", region_name="us-east-1")
+        instrumentation.instrument_client(ddb_client)
+        # Registering the client again must not count its calls twice.
+        instrumentation.instrument_client(ddb_client)
+
+        ddb_client.list_tables()
+        with self.assertRaises(ddb_client.exceptions.ResourceNotFoundException):
+            ddb_client.describe_table(TableName="missing")
+
+        api_calls = instrumentation.as_dict()["api_calls"]
+        self.assertEqual(api_calls["dynamodb.ListTables"]["calls"], 1)
+        self.assertEqual(api_calls["dynamodb.DescribeTable"]["errors"], 1)
+
+
+class TestHandlerInstrumentation(SimulatedHandlerTestCase):
+    """
+    Test the instrumentation the handler reports and emits, against the simulator.
+    """
+
+    def setUp(self):
+        self.inventory = SimulatedInventory()
+        twelve_hours_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+        for index in range(3):
+            self.inventory.add_resource_share(f"LakeFormation-V4-expired-{index}", ["210987654321"], twelve_hours_ago)
+        self.session = self.simulate(self.inventory)
+
+    def invoke_with_metrics(self, **parameters) -> tuple[dict, list[dict]]:
+        """
+        Run the handler and return its response with the EMF metrics it printed.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            response = self.invoke(**parameters)
+        emitted_metrics = [json.loads(line) for line in output.getvalue().splitlines() if line.startswith("{") and '"_aws"' in line]
+        return response, emitted_metrics
+
+    def test_reports_and_emits_the_instrumentation(self):
+        """
+        Tests that the handler reports the instrumentation and emits it as EMF metrics.
+        """
+        response, emitted_metrics = self.invoke_with_metrics()
+
+        report = response["instrumentation"]
+        self.assertTrue({"enumeration", "ddb_load", "remediation", "verification"} <= set(report["phases_in_secs"]))
+        self.assertEqual(report["counters"]["shares_processed"], 3)
+        self.assertEqual(report["counters"]["pages_fetched"], self.session.stats.calls["GetResourceShareAssociations"])
+        self.assertEqual(report["api_calls"]["ram.AssociateResourceShare"]["calls"], 3)
+
+        self.assertIn("RemediationDuration", emitted_metrics[-1])
+        operation_metrics = {blob["Operation"]: blob for blob in emitted_metrics if "Operation" in blob}
+        self.assertEqual(operation_metrics["ram.DisassociateResourceShare"]["ApiCalls"], [3.0])
+        self.assertEqual(len(operation_metrics["ram.DisassociateResourceShare"]["ApiLatency"]), 3)
+
+    def test_profiles_the_run(self):
+        """
+        Tests that the profile flag writes a cProfile file of the run.
+        """
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        profile_path = os.path.join(directory.name, "run.prof")
+
+        response, _emitted_metrics = self.invoke_with_metrics(profile="true", profile_path=profile_path)
+
+        self.assertEqual(response["profile_path"], profile_path)
+        self.assertGreater(pstats.Stats(profile_path).total_calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the invitation_events.py file, with the sample events in events/.
+"""
+
+import copy
+import datetime
+import json
+import time
+import unittest
+from pathlib import Path
+
+from lf_stale_ram_invite_monitor.invitation_events import parse_invitation_event, parse_invitation_events, parse_time
+from tests.simulator import SimulatedInventory
+from tests.simulator.handler import DDB_TABLE_NAME, ELEVEN_HOURS_IN_SECS, SimulatedHandlerTestCase
+
+EVENTS_PATH = Path(__file__).resolve().parents[2] / "events"
+SAMPLE_SHARE_ARN = "arn:aws:ram:us-east-1:123456789012:resource-share/00000000-LakeFormation-V4-sample"
+
+
+def load_event(name: str) -> dict:
+    """
+    Load a sample event of the events directory.
+    """
+    with open(EVENTS_PATH / name, encoding="utf-8") as event_file:
+        return json.load(event_file)
+
+
+class TestParseInvitationEvents(unittest.TestCase):
+    """
+    Test the parsing of the recorded sample events.
+    """
+
+    def test_ram_associate_resource_share(self):
+        """
+        Tests that a RAM AssociateResourceShare event is queued by resource share.
+        """
+        event = load_event("ram_associate_resource_share.json")["events"][0]
+        self.assertEqual(parse_invitation_event(event), {SAMPLE_SHARE_ARN: {"210987654321": parse_time("2024-05-01T10:00:00Z")}})
+
+    def test_lake_formation_grants_are_queued_by_principal(self):
+        """
+        Tests that Lake Formation grants are queued by principal, except the principals of the granting account.
+        """
+        events = load_event("lakeformation_batch_grant_permissions.json")["events"]
+        sent_at = parse_time("2024-05-01T10:05:00Z")
+        # Principals of the granting account itself do not get an invitation.
+        self.assertEqual(parse_invitation_events(events), {"principal#345678901234": {"345678901234": sent_at}, "principal#456789012345": {"456789012345": sent_at}})
+
+    def test_failed_calls_and_other_shares_are_ignored(self):
+        """
+        Tests that failed calls, shares of other services and other events are ignored.
+        """
+        event = load_event("ram_associate_resource_share.json")["events"][0]
+        failed = copy.deepcopy(event)
+        failed["detail"]["errorCode"] = "UnknownResourceException"
+        other = copy.deepcopy(event)
+        other["detail"]["responseElements"]["resourceShareAssociations"][0]["resourceShareName"] = "not-lake-formation"
+
+        self.assertEqual(parse_invitation_events([failed, other, {"detail-type": "Scheduled Event", "detail": {}}]), {})
+
+
+class TestIncrementalMode(SimulatedHandlerTestCase):
+    """
+    Record the sample events and remediate the due invitations with the handler, against the simulator.
+    """
+
+    def setUp(self):
+        self.inventory = SimulatedInventory()
+        twelve_hours_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+        self.resource_share_arn = self.inventory.add_resource_share("LakeFormation-V4-sample", ["210987654321"], twelve_hours_ago)
+        self.assertEqual(self.resource_share_arn, SAMPLE_SHARE_ARN)
+        self.session = self.simulate(self.inventory)
+
+    def invoke_sample(self, name: str) -> dict:
+        """
+        Run the handler with a sample event.
+        """
+        event = load_event(name)
+        # The recorded calls were made 12 hours ago, queued invitations that are older than the DDB TTL are ignored.
+        for recorded_event in event.get("events", []):
+            recorded_event["detail"]["eventTime"] = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return self.invoke(**{**event, "ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": ELEVEN_HOURS_IN_SECS})
+
+    def pending_item(self) -> dict:
+        """
+        The pending invitation item of the sample resource share.
+        """
+        return self.session.client("dynamodb").get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": "pending#" + SAMPLE_SHARE_ARN}})
+
+    def test_remediates_due_invitations_only(self):
+        """
+        Tests that the incremental mode only looks up and remediates the due invitations.
+        """
+        self.assertEqual(self.invoke_sample("ram_associate_resource_share.json")["queued_count"], 1)
+        self.assertIn("Item", self.pending_item())
+
+        response = self.invoke_sample("incremental.json")
+
+        self.assertEqual(response["recreated_count"], 1)
+        self.assertEqual(response["due_count"], 1)
+        self.assertNotIn("Item", self.pending_item())
+        # Only the due resource share was looked up and verified, nothing was paged through.
+        self.assertEqual(self.session.stats.calls["GetResourceShareAssociations"], 2)
+        self.assertEqual(self.inventory.associations[SAMPLE_SHARE_ARN]["210987654321"]["status"], "ASSOCIATING")
+        self.assertEqual(self.inventory.expired_invitations(ELEVEN_HOURS_IN_SECS), {})
+
+    def test_invitations_that_were_sent_again_are_queued_again(self):
+        """
+        Tests that an invitation that was sent again is queued again until it reaches the timeout.
+        """
+        self.invoke_sample("ram_associate_resource_share.json")
+        # The invitation was sent again after the recorded event.
+        self.inventory.set_association_status(SAMPLE_SHARE_ARN, ["210987654321"], "ASSOCIATING")
+
+        response = self.invoke_sample("incremental.json")
+
+        self.assertEqual(response["recreated_count"], 0)
+        due_at = int(self.pending_item()["Item"]["next_attempt_at"]["N"])
+        self.assertAlmostEqual(due_at, time.time() + ELEVEN_HOURS_IN_SECS, delta=60)
+
+    def test_lake_formation_grants_are_looked_up_by_principal(self):
+        """
+        Tests that the invitations of Lake Formation grants are looked up by principal.
+        """
+        self.inventory.add_resource_share("LakeFormation-V4-grant", ["345678901234"], datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12))
+        self.invoke_sample("lakeformation_batch_grant_permissions.json")
+
+        response = self.invoke_sample("incremental.json")
+
+        self.assertEqual(response["recreated_count"], 1)
+        self.assertEqual(set(self.inventory.expired_invitations(ELEVEN_HOURS_IN_SECS)), {SAMPLE_SHARE_ARN})
+
+
+if __name__ == "__main__":
+    unittest.main()
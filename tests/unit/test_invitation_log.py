@@ -0,0 +1,79 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the invitation_log.py file.
+"""
+
+import unittest
+from unittest.mock import patch
+
+from lf_stale_ram_invite_monitor import invitation_log as invitation_log_module
+from lf_stale_ram_invite_monitor.invitation_log import DRY_RUN_ASSOCIATE, DRY_RUN_DISASSOCIATE, EXPIRED, InvitationLog
+
+NOW = 1_700_000_000
+RESOURCE_SHARE_ARN = "arn:aws:ram:us-east-1:123456789012:resource-share/share"
+
+
+def association(index: int, principal: str) -> dict:
+    """
+    An associating invitation as RAM returns it.
+    """
+    return {"resourceShareName": f"LakeFormation-V4-{index}", "resourceShareArn": f"{RESOURCE_SHARE_ARN}-{index}", "associatedEntity": principal}
+
+
+class TestInvitationLog(unittest.TestCase):
+    """
+    Test the rolled up summaries and the sampling of the detailed records.
+    """
+
+    def test_summary_counts_and_oldest_invitations(self):
+        """
+        Tests that the summary counts the statuses and accounts, and keeps the oldest invitations.
+        """
+        invitation_log = InvitationLog()
+        invitation_log.reset(top_count=2)
+        for index, principal in enumerate(["111111111111", "222222222222", "111111111111", "333333333333"]):
+            invitation_log.expired_invitation(association(index, principal), NOW - (index + 1) * 3600)
+        invitation_log.dry_run_action(DRY_RUN_DISASSOCIATE, RESOURCE_SHARE_ARN, ["111111111111", "222222222222"])
+        invitation_log.dry_run_action(DRY_RUN_ASSOCIATE, RESOURCE_SHARE_ARN, ["111111111111"])
+
+        summary = invitation_log.as_dict(NOW)
+
+        self.assertEqual(summary["status_counts"], {DRY_RUN_ASSOCIATE: 1, DRY_RUN_DISASSOCIATE: 2, EXPIRED: 4})
+        self.assertEqual(summary["account_count"], 3)
+        self.assertEqual(summary["top_accounts"], [{"account_id": "111111111111", "count": 2}, {"account_id": "222222222222", "count": 1}])
+        self.assertEqual([(invitation["resource_share_name"], invitation["age_in_secs"]) for invitation in summary["oldest_invitations"]], [("LakeFormation-V4-3", 4 * 3600), ("LakeFormation-V4-2", 3 * 3600)])
+
+    def test_detailed_records_are_sampled(self):
+        """
+        Tests that the detailed records are logged at debug level, unless they are sampled.
+        """
+        with patch.object(invitation_log_module, "logger") as logger:
+            invitation_log = InvitationLog()
+            for _ in range(5):
+                invitation_log.expired_invitation(association(0, "111111111111"), NOW)
+            self.assertEqual((logger.info.call_count, logger.debug.call_count, invitation_log.sampled_count), (0, 5, 0))
+
+            logger.reset_mock()
+            invitation_log.reset(sample_rate=1)
+            for _ in range(5):
+                invitation_log.expired_invitation(association(0, "111111111111"), NOW)
+            self.assertEqual((logger.info.call_count, logger.debug.call_count, invitation_log.sampled_count), (5, 0, 5))
+
+    def test_summaries_are_logged_every_interval(self):
+        """
+        Tests that a summary is logged once the summary interval has passed.
+        """
+        with patch.object(invitation_log_module, "logger") as logger:
+            invitation_log = InvitationLog()
+            invitation_log.reset(summary_interval_in_secs=0)
+            invitation_log.expired_invitation(association(0, "111111111111"), NOW)
+            invitation_log.expired_invitation(association(1, "111111111111"), NOW)
+
+        self.assertEqual(invitation_log.summary_count, 2)
+        self.assertTrue(all(call.args[0].startswith("Invitation summary:") for call in logger.info.call_args_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
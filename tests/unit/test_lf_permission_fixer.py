@@ -0,0 +1,121 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the lf_permission_fixer.py file.
+"""
+
+import csv
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+from lf_stale_ram_invite_monitor.lf_permission_fixer import ASSOCIATE, DONE, DRY_RUN, IGNORED, MISSING, RECREATE, SKIP, LakeFormationPermissionFixer, get_account_id, write_report
+from lf_stale_ram_invite_monitor.ram_manager import RamManager
+from tests.simulator import FakeLakeFormationClient, FakeRamClient, SimulatedInventory, SimulatorConfig
+
+TWELVE_HOURS_AGO = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+ONE_HOUR_AGO = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+ELEVEN_HOURS_IN_SECS = 11 * 60 * 60
+
+
+class TestLakeFormationPermissionFixer(unittest.TestCase):  # pylint: disable=too-many-instance-attributes
+    """
+    Test the Lake Formation permission fixer against the simulator.
+    """
+
+    def setUp(self):
+        """
+        Five expired resource shares, and one each that failed, is recent, was accepted or was deleted.
+        """
+        self.inventory = SimulatedInventory()
+        self.expired = [self.inventory.add_resource_share(f"LakeFormation-V4-expired-{i}", [f"10000000000{i}"], TWELVE_HOURS_AGO) for i in range(5)]
+        self.failed = self.inventory.add_resource_share("LakeFormation-V4-failed", ["111111111111"], ONE_HOUR_AGO, association_status="FAILED")
+        self.recent = self.inventory.add_resource_share("LakeFormation-V4-recent", ["222222222222"], ONE_HOUR_AGO)
+        self.accepted = self.inventory.add_resource_share("LakeFormation-V4-accepted", ["333333333333"], TWELVE_HOURS_AGO, association_status="ASSOCIATED")
+        self.deleted = self.inventory.add_resource_share("LakeFormation-V4-deleted", ["444444444444"], TWELVE_HOURS_AGO, status="DELETED")
+        # A permission that was granted to a principal that is not associated with the share.
+        self.inventory.permissions.append({**self.inventory.permissions[0], "Principal": {"DataLakePrincipalIdentifier": "arn:aws:iam::555555555555:role/analyst"}})
+        # The same resource share in two permissions is looked up once.
+        self.inventory.permissions.append(dict(self.inventory.permissions[1]))
+
+        # Small pages, so the last page is a partial one.
+        config = SimulatorConfig(page_size=4)
+        self.lf_client = FakeLakeFormationClient(self.inventory, config)
+        self.ram_client = FakeRamClient(self.inventory, config, self.lf_client.stats)
+
+    def fixer(self, dry_run: bool) -> LakeFormationPermissionFixer:
+        """
+        A fixer over the simulated Lake Formation and RAM clients.
+        """
+        return LakeFormationPermissionFixer(self.lf_client, RamManager(self.ram_client, ELEVEN_HOURS_IN_SECS, False), dry_run, max_workers=4)
+
+    def test_fixes_every_page(self):
+        """
+        Tests that the expired and failed invitations of every page are recreated, and the others are left alone.
+        """
+        actions = {(action.resource_share_arn, action.account_id): action for action in self.fixer(dry_run=False).run()}
+
+        for i, resource_share_arn in enumerate(self.expired):
+            self.assertEqual((actions[(resource_share_arn, f"10000000000{i}")].action, actions[(resource_share_arn, f"10000000000{i}")].outcome), (RECREATE, DONE))
+        self.assertEqual(actions[(self.failed, "111111111111")].action, RECREATE)
+        self.assertEqual(actions[(self.deleted, "444444444444")].outcome, MISSING)
+        self.assertEqual(actions[(self.expired[0], "555555555555")].action, SKIP)
+        self.assertEqual(actions[(self.expired[0], "555555555555")].outcome, IGNORED)
+        self.assertNotIn((self.recent, "222222222222"), actions)
+        self.assertNotIn((self.accepted, "333333333333"), actions)
+        self.assertEqual(self.inventory.associations[self.failed]["111111111111"]["status"], "ASSOCIATING")
+        # The 9 resource shares fit in a single batch of arns, which has 3 pages of 4 associations.
+        self.assertEqual(self.lf_client.stats.calls["GetResourceShareAssociations"], 3)
+
+    def test_dry_run_does_not_call_ram(self):
+        """
+        Tests that a dry run only reports what it would do.
+        """
+        actions = self.fixer(dry_run=True).run()
+
+        self.assertEqual({action.outcome for action in actions if action.action != SKIP}, {DRY_RUN})
+        self.assertEqual(self.ram_client.stats.calls["AssociateResourceShare"], 0)
+
+    def test_missing_association_is_associated(self):
+        """
+        Tests that a principal without an association is associated with the resource share.
+        """
+        self.inventory.associations[self.recent].clear()
+
+        actions = [action for action in self.fixer(dry_run=False).run() if action.resource_share_arn == self.recent]
+
+        self.assertEqual([(action.action, action.outcome) for action in actions], [(ASSOCIATE, DONE)])
+
+    def test_reports(self):
+        """
+        Tests that the actions are written to JSON and CSV reports.
+        """
+        actions = self.fixer(dry_run=True).run()
+        with tempfile.TemporaryDirectory() as directory:
+            write_report(actions, os.path.join(directory, "report.json"))
+            write_report(actions, os.path.join(directory, "report.csv"))
+            with open(os.path.join(directory, "report.json"), encoding="utf-8") as report_file:
+                report = json.load(report_file)
+            with open(os.path.join(directory, "report.csv"), encoding="utf-8") as report_file:
+                rows = list(csv.DictReader(report_file))
+
+        self.assertEqual(len(report["actions"]), len(actions))
+        # The expired, failed and deleted resource shares.
+        self.assertEqual(report["summary"]["recreate:dry_run"], 7)
+        self.assertEqual(len(rows), len(actions))
+
+    def test_get_account_id(self):
+        """
+        Tests that the account is taken from principal arns and account ids.
+        """
+        self.assertEqual(get_account_id("arn:aws:iam::123456789012:role/analyst"), "123456789012")
+        self.assertEqual(get_account_id("123456789012"), "123456789012")
+        with self.assertRaises(ValueError):
+            get_account_id("arn:aws:organizations::123456789012:organization/o-abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
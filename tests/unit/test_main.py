@@ -5,15 +5,15 @@ SPDX-License-Identifier: MIT-0
 Tests for the main.py file. 
 """
 
+import datetime
 import os
 import time
 import unittest
-import datetime
+from unittest.mock import MagicMock, patch
 
 import boto3
 import botocore
 from moto import mock_aws
-from unittest.mock import patch
 
 ACCOUNT_ID = "111111111111"
 REGION = "us-east-1"
@@ -22,6 +22,7 @@ USER_NAME = "test-user"
 ROLE_NAME = "test-role"
 
 DDB_TABLE_NAME = "test-ddb-table"
+RESOURCE_SHARE_ARN = "arn:aws:ram:us-east-1:123456789012:resource-share/4af299d5-debf-482e-9e4f-d02aef7364ef"
 FIVE_MINS_AGO = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5)
 
 # Original botocore _make_api_call function
@@ -30,6 +31,9 @@ orig = botocore.client.BaseClient._make_api_call  # pylint: disable=protected-ac
 
 # Mocked botocore _make_api_call function
 def mock_make_api_call(self, operation_name, kwarg):
+    """
+    Answer the RAM calls that moto does not support, pass the others on to moto.
+    """
     if operation_name == "GetResourceShareAssociations":
         return {
             "resourceShareAssociations": [
@@ -99,7 +103,48 @@ class TestProcessFileHandler(unittest.TestCase):
         self.ram_client = boto3.client("ram")
         self.ddb_client = boto3.client("dynamodb")
 
-        self.ddb_client.create_table(TableName=DDB_TABLE_NAME, AttributeDefinitions=[{"AttributeName": "resourceShareArn", "AttributeType": "S"}], KeySchema=[{"AttributeName": "resourceShareArn", "KeyType": "HASH"}], ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5})
+        # The handler keeps its clients for warm invocations, which can have been created outside of the moto mock by other tests.
+        from lf_stale_ram_invite_monitor import lambda_handler as lambda_handler_module  # pylint: disable=import-outside-toplevel
+        from lf_stale_ram_invite_monitor.clients import ClientFactory  # pylint: disable=import-outside-toplevel
+
+        client_patch = patch.object(lambda_handler_module, "clients", ClientFactory())
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+
+        self.ddb_client.create_table(
+            TableName=DDB_TABLE_NAME,
+            AttributeDefinitions=[{"AttributeName": "resourceShareArn", "AttributeType": "S"}, {"AttributeName": "retry_queue", "AttributeType": "S"}, {"AttributeName": "next_attempt_at", "AttributeType": "N"}],
+            KeySchema=[{"AttributeName": "resourceShareArn", "KeyType": "HASH"}],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "retry-queue-index",
+                    "KeySchema": [{"AttributeName": "retry_queue", "KeyType": "HASH"}, {"AttributeName": "next_attempt_at", "KeyType": "RANGE"}],
+                    "Projection": {"ProjectionType": "ALL"},
+                    "ProvisionedThroughput": {"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+                }
+            ],
+            ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+        )
+
+    def put_due_retry_item(self, resource_share_arn: str, aws_account_ids: set[str], attempts: int = 1):
+        """
+        Put an item in the retry queue that is due for a retry.
+        """
+        from lf_stale_ram_invite_monitor.ddb_manager import RETRY_QUEUE_NAME, queue_partition  # pylint: disable=import-outside-toplevel
+
+        now = int(time.time())
+        self.ddb_client.put_item(
+            TableName=DDB_TABLE_NAME,
+            Item={
+                "resourceShareArn": {"S": resource_share_arn},
+                "principals": {"SS": sorted(aws_account_ids)},
+                "retry_queue": {"S": queue_partition(RETRY_QUEUE_NAME, resource_share_arn)},
+                "attempts": {"N": str(attempts)},
+                "first_failed_at": {"N": str(now - 600)},
+                "next_attempt_at": {"N": str(now - 1)},
+                "expires_at": {"N": str(now + 3600)},
+            },
+        )
 
     def tearDown(self):
         """
@@ -112,7 +157,7 @@ class TestProcessFileHandler(unittest.TestCase):
         Tests the lambda handler with an unsupported event.
         """
         # pylint: disable=unused-variable
-        event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": 1}  # 6 mins
+        event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": 1, "dry_run": "false"}  # 6 mins
 
         from lf_stale_ram_invite_monitor.lambda_handler import lambda_handler  # pylint: disable=import-outside-toplevel
 
@@ -122,6 +167,151 @@ class TestProcessFileHandler(unittest.TestCase):
             self.assertEqual(result["recreated_count"], 1)
             self.assertEqual(result["failed_count"], 0)
 
+    def test_previously_failed_share_is_not_remediated_twice(self):
+        """
+        Tests that a share that is retried from DDB is not remediated again when RAM reports it as expired.
+        """
+        from lf_stale_ram_invite_monitor.lambda_handler import lambda_handler  # pylint: disable=import-outside-toplevel
+
+        self.put_due_retry_item(RESOURCE_SHARE_ARN, {ACCOUNT_ID})
+        event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": 1, "dry_run": "false"}
+
+        with patch("botocore.client.BaseClient._make_api_call", new=mock_make_api_call):
+            result = lambda_handler(event, None)
+            self.assertEqual(result["recreated_count"], 1)
+            self.assertEqual(result["failed_count"], 0)
+        self.assertNotIn("Item", self.ddb_client.get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": RESOURCE_SHARE_ARN}}))
+
+    def test_run_resumes_from_checkpoint_after_deadline(self):
+        """
+        Tests that a run that is about to time out saves a checkpoint, and that the next run picks it up.
+        """
+        from lf_stale_ram_invite_monitor.lambda_handler import lambda_handler  # pylint: disable=import-outside-toplevel
+
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 1000
+        event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": 1, "dry_run": "false"}
+
+        with patch("botocore.client.BaseClient._make_api_call", new=mock_make_api_call):
+            result = lambda_handler(event, context)
+            self.assertFalse(result["completed"])
+            self.assertEqual(result["recreated_count"], 0)
+            self.assertIn("checkpoint", self.ddb_client.get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": "#checkpoint"}})["Item"])
+
+            result = lambda_handler(event, None)
+            self.assertTrue(result["completed"])
+            self.assertEqual(result["recreated_count"], 1)
+            self.assertNotIn("Item", self.ddb_client.get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": "#checkpoint"}}))
+
+    def test_coordinator_with_local_workers(self):
+        """
+        Tests the coordinator mode with workers that run in-process.
+        """
+        from lf_stale_ram_invite_monitor.lambda_handler import lambda_handler  # pylint: disable=import-outside-toplevel
+
+        event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": 1, "dry_run": "false", "mode": "coordinator", "dispatcher": "local", "shard_count": 3}
+
+        with patch("botocore.client.BaseClient._make_api_call", new=mock_make_api_call):
+            result = lambda_handler(event, None)
+            self.assertEqual(result["recreated_count"], 1)
+            self.assertEqual(result["failed_count"], 0)
+            self.assertEqual(len(result["shards"]), 3)
+            self.assertEqual(sum(shard["invocation_count"] for shard in result["shards"]), 1)
+
+    def test_coordinator_without_concurrency_for_workers(self):
+        """
+        Tests that the coordinator runs the workers in-process when the reserved concurrency of 1 leaves none for worker invocations.
+        """
+        from lf_stale_ram_invite_monitor.lambda_handler import lambda_handler  # pylint: disable=import-outside-toplevel
+
+        context = MagicMock()
+        context.invoked_function_arn = f"arn:aws:lambda:{REGION}:{ACCOUNT_ID}:function:monitor"
+        context.get_remaining_time_in_millis.return_value = 15 * 60 * 1000
+        event = {"ddb_table_name": DDB_TABLE_NAME, "ram_timeout_in_seconds": 1, "dry_run": "false", "mode": "coordinator"}
+        operation_names = []
+
+        def record_api_call(client, operation_name, kwarg):
+            operation_names.append(operation_name)
+            return mock_make_api_call(client, operation_name, kwarg)
+
+        with patch.dict(os.environ, {"RESERVED_CONCURRENT_EXECUTIONS": "1"}), patch("botocore.client.BaseClient._make_api_call", new=record_api_call):
+            result = lambda_handler(event, context)
+            self.assertEqual(result["recreated_count"], 1)
+            self.assertEqual(result["failed_count"], 0)
+            self.assertNotIn("Invoke", operation_names)
+
+    def test_legacy_items_are_moved_into_the_retry_queue(self):
+        """
+        Tests that the items written before the retry queue are retried once they are copied into it, and that runs never scan for them.
+        """
+        from lf_stale_ram_invite_monitor.ddb_manager import RETRY_QUEUE_NAME, DdbManager, queue_partition  # pylint: disable=import-outside-toplevel
+
+        self.ddb_client.put_item(TableName=DDB_TABLE_NAME, Item={"resourceShareArn": {"S": "arn:share/1"}, "aws_account": {"S": "011111111111"}})
+        self.ddb_client.put_item(TableName=DDB_TABLE_NAME, Item={"resourceShareArn": {"S": "arn:share/2"}, "aws_account": {"S": '["111111111111", "222222222222"]'}})
+        self.put_due_retry_item("arn:share/3", {"333333333333"})
+
+        previously_failed = DdbManager(self.ddb_client, DDB_TABLE_NAME).get_previously_failed_accounts_for_resource_share()
+        self.assertEqual(previously_failed, {"arn:share/3": {"333333333333"}})
+
+        self.assertEqual(DdbManager(self.ddb_client, DDB_TABLE_NAME).copy_legacy_items(DDB_TABLE_NAME), 2)
+        previously_failed = DdbManager(self.ddb_client, DDB_TABLE_NAME).get_previously_failed_accounts_for_resource_share()
+        self.assertEqual(previously_failed, {"arn:share/1": {"011111111111"}, "arn:share/2": {"111111111111", "222222222222"}, "arn:share/3": {"333333333333"}})
+        items = {item["resourceShareArn"]["S"]: item for item in self.ddb_client.scan(TableName=DDB_TABLE_NAME)["Items"]}
+        self.assertEqual(items["arn:share/2"]["retry_queue"]["S"], queue_partition(RETRY_QUEUE_NAME, "arn:share/2"))
+
+    def test_retry_queue_is_spread_over_partitions(self):
+        """
+        Tests that the retry queue is stored in several partitions of the index, and read from all of them, oldest first.
+        """
+        from lf_stale_ram_invite_monitor.ddb_manager import RETRY_QUEUE_NAME, DdbManager, queue_partitions  # pylint: disable=import-outside-toplevel
+
+        now = int(time.time())
+        for index in range(20):
+            self.put_due_retry_item(f"arn:share/{index}", {"111111111111"})
+            self.ddb_client.update_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": f"arn:share/{index}"}}, UpdateExpression="SET next_attempt_at = :due", ExpressionAttributeValues={":due": {"N": str(now - 100 + index)}})
+
+        previously_failed = list(DdbManager(self.ddb_client, DDB_TABLE_NAME).iter_previously_failed_accounts_for_resource_share())
+
+        self.assertEqual([resource_share_arn for resource_share_arn, _ in previously_failed], [f"arn:share/{index}" for index in range(20)])
+        partitions = {item["retry_queue"]["S"] for item in self.ddb_client.scan(TableName=DDB_TABLE_NAME)["Items"]}
+        self.assertGreater(len(partitions), 1)
+        self.assertLessEqual(partitions, set(queue_partitions(RETRY_QUEUE_NAME)))
+
+    def test_ddb_retry_queue(self):
+        """
+        Tests that only due resource shares are read, and that failures are merged and backed off.
+        """
+        from lf_stale_ram_invite_monitor.ddb_manager import DdbManager  # pylint: disable=import-outside-toplevel
+
+        self.put_due_retry_item("arn:share/1", {"111111111111", "222222222222"}, attempts=2)
+        ddb_manager = DdbManager(self.ddb_client, DDB_TABLE_NAME)
+        ddb_manager.add_resource_share_to_ddb("arn:share/2", {"111111111111"})
+        ddb_manager.add_resource_share_to_ddb("arn:share/2", {"222222222222"})
+        ddb_manager.flush()
+
+        previously_failed = ddb_manager.get_previously_failed_accounts_for_resource_share()
+        self.assertEqual(previously_failed, {"arn:share/1": {"111111111111", "222222222222"}})
+
+        # The retried share fails again for one principal.
+        ddb_manager.remove_resource_share_from_ddb("arn:share/1")
+        ddb_manager.add_resource_share_to_ddb("arn:share/1", {"222222222222"})
+        ddb_manager.flush()
+
+        items = {item["resourceShareArn"]["S"]: item for item in self.ddb_client.scan(TableName=DDB_TABLE_NAME)["Items"]}
+        self.assertEqual(items["arn:share/1"]["principals"]["SS"], ["222222222222"])
+        self.assertEqual(items["arn:share/1"]["attempts"]["N"], "3")
+        self.assertEqual(items["arn:share/2"]["principals"]["SS"], ["111111111111", "222222222222"])
+        self.assertEqual(items["arn:share/2"]["attempts"]["N"], "1")
+        self.assertGreater(int(items["arn:share/1"]["next_attempt_at"]["N"]), int(items["arn:share/2"]["next_attempt_at"]["N"]))
+
+        # A failure in a later run is merged with the principals that are not due yet.
+        ddb_manager = DdbManager(self.ddb_client, DDB_TABLE_NAME)
+        ddb_manager.add_resource_share_to_ddb("arn:share/2", {"333333333333"})
+        ddb_manager.flush()
+        item = self.ddb_client.get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": "arn:share/2"}})["Item"]
+        self.assertEqual(item["principals"]["SS"], ["111111111111", "222222222222", "333333333333"])
+        self.assertEqual(item["attempts"]["N"], "2")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,164 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the pipeline.py file.
+"""
+
+import datetime
+import itertools
+import unittest
+from typing import Optional
+from unittest.mock import MagicMock
+
+from lf_stale_ram_invite_monitor.pipeline import ExpiredShareStream
+from tests.simulator import SimulatedInventory, SimulatorConfig
+from tests.simulator.handler import DDB_TABLE_NAME, SimulatedHandlerTestCase
+
+FIFTEEN_MINUTES_IN_MS = 15 * 60 * 1000
+
+PAGES = [
+    {"arn:share/1": {"111111111111"}, "arn:share/2": {"111111111111"}},
+    {"arn:share/3": {"111111111111"}, "arn:share/1": {"222222222222"}},
+    {"arn:share/4": {"111111111111"}},
+]
+
+
+class FakeRamManager:  # pylint: disable=too-few-public-methods
+    """
+    Returns PAGES, or the given pages, using the page index as the pagination token.
+    """
+
+    def __init__(self, pages: Optional[list[dict]] = None):
+        self.pages = pages if pages is not None else PAGES
+        self.pages_fetched = 0
+
+    def iter_new_expired_ram_invitations(self, cursor=None):
+        """
+        Yield the pages from the one the cursor points at, each with the cursor of the next page.
+        """
+        start = int(cursor["next_token"]) if cursor else 0
+        for index in range(start, len(self.pages)):
+            self.pages_fetched = self.pages_fetched + 1
+            yield dict(self.pages[index]), {"next_token": str(index + 1)} if index + 1 < len(self.pages) else None
+
+
+def fake_ddb_manager(previously_failed: dict[str, set[str]]):
+    """
+    A DDB manager whose retry queue holds the previously failed principals.
+    """
+    ddb_manager = MagicMock()
+    ddb_manager.iter_previously_failed_accounts_for_resource_share.side_effect = lambda: iter(previously_failed.items())
+    return ddb_manager
+
+
+class TestExpiredShareStream(unittest.TestCase):
+    """
+    Test streaming and checkpointing of expired RAM shares.
+    """
+
+    def test_retried_principals_are_not_yielded_twice(self):
+        """
+        Tests that principals from the retry queue are not yielded again when RAM lists them.
+        """
+        stream = ExpiredShareStream(FakeRamManager(), fake_ddb_manager({"arn:share/1": {"111111111111"}}))
+
+        items = list(stream)
+
+        self.assertEqual(items[0], ("arn:share/1", {"111111111111"}, True))
+        self.assertEqual(items[1:], [("arn:share/2", {"111111111111"}, False), ("arn:share/3", {"111111111111"}, False), ("arn:share/1", {"222222222222"}, False), ("arn:share/4", {"111111111111"}, False)])
+        self.assertTrue(stream.exhausted)
+
+    def test_resume_from_checkpoint_without_repeated_work(self):
+        """
+        Tests that a stream resumed from a checkpoint picks up the pending shares and only reads the
+        pages that were left.
+        """
+        stream = ExpiredShareStream(FakeRamManager(), fake_ddb_manager({}))
+        first_run = list(itertools.islice(stream, 3))
+        checkpoint = stream.checkpoint()
+
+        self.assertEqual(checkpoint, {"cursor": {"next_token": "2"}, "last_page_read": False, "pending": [["arn:share/1", ["222222222222"]]]})
+
+        ram_manager = FakeRamManager()
+        second_run = list(ExpiredShareStream(ram_manager, fake_ddb_manager({}), checkpoint))
+
+        self.assertEqual([arn for arn, _, _ in first_run + second_run], ["arn:share/1", "arn:share/2", "arn:share/3", "arn:share/1", "arn:share/4"])
+        self.assertEqual(ram_manager.pages_fetched, 1)
+
+    def test_stops_between_pages_without_expired_invitations(self):
+        """
+        Tests that the stream stops between pages that hold no expired invitation, and that the
+        checkpoint then points at the first page that was not read.
+        """
+        pages = [{}] * 999 + [{"arn:share/1": {"111111111111"}}]
+        checks = itertools.count()
+        ram_manager = FakeRamManager(pages)
+        stream = ExpiredShareStream(ram_manager, fake_ddb_manager({}), should_stop=lambda: next(checks) >= 5)
+
+        self.assertEqual(list(stream), [])
+        self.assertEqual(ram_manager.pages_fetched, 5)
+        self.assertTrue(stream.stopped_early)
+        self.assertFalse(stream.exhausted)
+        self.assertEqual(stream.checkpoint(), {"cursor": {"next_token": "5"}, "last_page_read": False, "pending": []})
+
+        ram_manager = FakeRamManager(pages)
+        self.assertEqual(list(ExpiredShareStream(ram_manager, fake_ddb_manager({}), stream.checkpoint())), [("arn:share/1", {"111111111111"}, False)])
+        self.assertEqual(ram_manager.pages_fetched, 995)
+
+
+class TestHandlerStopsBetweenPages(SimulatedHandlerTestCase):
+    """
+    Test that the handler stops and saves its checkpoint while it pages through invitations that did not expire.
+    """
+
+    def setUp(self):
+        self.inventory = SimulatedInventory()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # Ten pages of invitations that did not expire, followed by a page with an expired one.
+        for index in range(50):
+            self.inventory.add_resource_share(f"LakeFormation-V4-recent-{index}", ["210987654321"], now - datetime.timedelta(hours=1))
+        self.inventory.add_resource_share("LakeFormation-V4-expired", ["210987654321"], now - datetime.timedelta(hours=12))
+        self.session = self.simulate(self.inventory, SimulatorConfig(page_size=5))
+
+    def test_saves_the_checkpoint_between_pages(self):
+        """
+        Tests that a run whose context gets past the deadline margin while no page has an expired
+        invitation stops after the page it is reading, and that the next run resumes after it.
+        """
+        context = MagicMock()
+        # Enough time for the first check of the engine and the first page, then past the margin.
+        context.get_remaining_time_in_millis.side_effect = itertools.chain([FIFTEEN_MINUTES_IN_MS] * 2, itertools.repeat(1000))
+
+        response = self.invoke(context)
+
+        self.assertFalse(response["completed"])
+        self.assertEqual(self.session.stats.calls["GetResourceShareAssociations"], 1)
+        checkpoint = self.session.client("dynamodb").get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": "#checkpoint"}})
+        self.assertIn("Item", checkpoint)
+
+        # Without the verification, which looks up the associations of the recreated share as well.
+        response = self.invoke(verification_budget_in_seconds=0)
+
+        self.assertTrue(response["completed"])
+        self.assertEqual(response["recreated_count"], 1)
+        self.assertEqual(self.session.stats.calls["GetResourceShareAssociations"], 11)
+
+    def test_coordinator_saves_the_checkpoint_between_pages(self):
+        """
+        Tests that the coordinator stops between pages without expired invitations as well.
+        """
+        context = MagicMock()
+        # The deadline of the workers, the first check of the coordinator and the first page, then past the margin.
+        context.get_remaining_time_in_millis.side_effect = itertools.chain([FIFTEEN_MINUTES_IN_MS] * 3, itertools.repeat(1000))
+
+        response = self.invoke(context, mode="coordinator", dispatcher="local")
+
+        self.assertFalse(response["completed"])
+        self.assertEqual(self.session.stats.calls["GetResourceShareAssociations"], 1)
+        checkpoint = self.session.client("dynamodb").get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": "#checkpoint"}})
+        self.assertIn("Item", checkpoint)
+
+
+if __name__ == "__main__":
+    unittest.main()
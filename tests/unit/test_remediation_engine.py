@@ -0,0 +1,158 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the remediation_engine.py file.
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import botocore.exceptions
+
+from lf_stale_ram_invite_monitor.ram_manager import RamManager
+from lf_stale_ram_invite_monitor.remediation_engine import AimdConcurrencyLimiter, RemediationEngine
+
+
+def throttling_error(operation_name: str) -> botocore.exceptions.ClientError:
+    """
+    A throttling response of a RAM operation.
+    """
+    return botocore.exceptions.ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, operation_name)
+
+
+class FakeRamManager(RamManager):
+    """
+    Records the order of RAM calls per resource share. It rejects principal 222222222222, times out
+    associating principal 999999999999 and can throttle the first call of every share.
+    """
+
+    def __init__(self, throttle_first_call: bool = False, max_principals_per_call: int = 10, call_delay: float = 0.0):
+        super().__init__(MagicMock(), 0, True, max_principals_per_call)
+        self.ram_client.exceptions.UnknownResourceException = type("UnknownResourceException", (botocore.exceptions.ClientError,), {})
+        self.calls: dict[str, list[str]] = {}
+        self.throttle_first_call = throttle_first_call
+        self.call_delay = call_delay
+        self.in_flight: set[str] = set()
+        self.overlaps: list[str] = []
+        self._lock = threading.Lock()
+
+    def _record(self, operation: str, resource_share_arn: str, principals: list[str]):
+        with self._lock:
+            if operation == "disassociate":
+                if resource_share_arn in self.in_flight:
+                    self.overlaps.append(resource_share_arn)
+                self.in_flight.add(resource_share_arn)
+        time.sleep(self.call_delay)
+        with self._lock:
+            calls = self.calls.setdefault(resource_share_arn, [])
+            calls.append(operation)
+            if operation == "associate":
+                self.in_flight.discard(resource_share_arn)
+            if "222222222222" in principals and operation == "associate":
+                raise botocore.exceptions.ClientError({"Error": {"Code": "InvalidParameterException", "Message": "Invalid principal"}}, operation)
+            if "999999999999" in principals and operation == "associate":
+                raise botocore.exceptions.ReadTimeoutError(endpoint_url="https://ram.us-east-1.amazonaws.com/associateresourceshare")
+            if self.throttle_first_call and len(calls) == 1:
+                raise throttling_error(operation)
+
+    def deassociate_account_from_ram_share(self, resource_share_arn: str, aws_account_ids):
+        self._record("disassociate", resource_share_arn, aws_account_ids)
+
+    def associate_account_with_ram_share(self, resource_share_arn: str, aws_account_ids):
+        self._record("associate", resource_share_arn, aws_account_ids)
+
+
+class TestRemediationEngine(unittest.TestCase):
+    """
+    Test the concurrent remediation engine.
+    """
+
+    def test_recreates_every_share_in_order(self):
+        """
+        Tests that every principal is disassociated before it is associated again.
+        """
+        ram_manager = FakeRamManager()
+        ddb_manager = MagicMock()
+        expired = ((f"arn:aws:ram:us-east-1:123456789012:resource-share/{i}", {"111111111111"}, False) for i in range(50))
+
+        summary = RemediationEngine(ram_manager, ddb_manager, max_concurrency=8).remediate(expired)
+
+        self.assertEqual(summary.recreated_count, 50)
+        self.assertEqual(summary.failed_count, 0)
+        for calls in ram_manager.calls.values():
+            self.assertEqual(calls, ["disassociate", "associate"])
+        ddb_manager.remove_resource_share_from_ddb.assert_not_called()
+
+    def test_throttling_reduces_concurrency_and_retries(self):
+        """
+        Tests that throttled calls are retried and reduce the concurrency.
+        """
+        ram_manager = FakeRamManager(throttle_first_call=True)
+        engine = RemediationEngine(ram_manager, MagicMock(), max_concurrency=8)
+        engine.limiter.limit = 8.0
+
+        summary = engine.remediate([("arn:share/1", {"111111111111"}, False), ("arn:share/2", {"111111111111"}, False)])
+
+        self.assertEqual(summary.recreated_count, 2)
+        self.assertEqual(summary.throttled_count, 2)
+        self.assertLess(summary.final_concurrency, 8)
+        self.assertEqual(ram_manager.calls["arn:share/1"], ["disassociate", "disassociate", "associate"])
+
+    def test_principals_are_batched_and_failures_are_saved(self):
+        """
+        Tests that principals are sent in batches, and that the ones that failed are saved for a retry.
+        """
+        ram_manager = FakeRamManager(max_principals_per_call=2)
+        ddb_manager = MagicMock()
+        principals = {"111111111111", "222222222222", "333333333333", "444444444444", "555555555555"}
+
+        summary = RemediationEngine(ram_manager, ddb_manager).remediate([("arn:share/1", principals, True)])
+
+        # 5 principals in batches of 2 means 3 disassociate and 3 associate calls instead of 5 of each.
+        self.assertEqual(ram_manager.calls["arn:share/1"], ["disassociate", "associate"] * 3)
+        self.assertEqual(summary.recreated_count, 3)
+        self.assertEqual(summary.failed_count, 2)
+        ddb_manager.remove_resource_share_from_ddb.assert_called_once_with("arn:share/1")
+        ddb_manager.add_resource_share_to_ddb.assert_called_once_with("arn:share/1", {"111111111111", "222222222222"})
+
+    def test_disassociated_principals_are_saved_on_any_error(self):
+        """
+        Tests that principals that were disassociated are saved for a retry when associating them fails with an error that is not a ClientError.
+        """
+        ram_manager = FakeRamManager(max_principals_per_call=1)
+        ddb_manager = MagicMock()
+
+        summary = RemediationEngine(ram_manager, ddb_manager).remediate([("arn:share/1", {"111111111111", "999999999999"}, False)])
+
+        self.assertEqual((summary.recreated_count, summary.failed_count), (1, 1))
+        ddb_manager.add_resource_share_to_ddb.assert_called_once_with("arn:share/1", {"999999999999"})
+
+    def test_streamed_share_is_not_remediated_concurrently(self):
+        """
+        Tests that a resource share that is streamed more than once is never remediated by two workers at the same time.
+        """
+        ram_manager = FakeRamManager(call_delay=0.01)
+        pages = [("arn:share/1", {f"11111111111{i}"}, False) for i in range(5)]
+
+        summary = RemediationEngine(ram_manager, MagicMock(), max_concurrency=8).remediate(pages)
+
+        self.assertEqual(summary.recreated_count, 5)
+        self.assertEqual(ram_manager.overlaps, [])
+
+    def test_limiter_bounds(self):
+        """
+        Tests that the concurrency limit stays within its bounds.
+        """
+        limiter = AimdConcurrencyLimiter(4, 1, 5)
+        for _ in range(100):
+            limiter.on_success()
+        self.assertEqual(int(limiter.limit), 5)
+        limiter.on_throttle()
+        self.assertEqual(int(limiter.limit), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the remediation_history.py file.
+"""
+
+import datetime
+import time
+import unittest
+from unittest.mock import patch
+
+from lf_stale_ram_invite_monitor import remediation_history as remediation_history_module
+from lf_stale_ram_invite_monitor.ddb_manager import DdbManager
+from lf_stale_ram_invite_monitor.remediation_history import COOLDOWN, PARKED, RECREATE, RemediationHistory
+from tests.simulator import SimulatedInventory, SimulatedSession
+from tests.simulator.handler import DDB_TABLE_NAME, SimulatedHandlerTestCase
+
+ONE_HOUR_IN_SECS = 60 * 60
+RESOURCE_SHARE_ARN = "arn:aws:ram:us-east-1:123456789012:resource-share/chronic"
+
+
+class TestRemediationHistory(unittest.TestCase):
+    """
+    Test the cooldown, the cycle limit and the history cache against the simulator.
+    """
+
+    def setUp(self):
+        remediation_history_module._history_cache.clear()  # pylint: disable=protected-access
+        self.session = SimulatedSession(SimulatedInventory())
+        self.session.create_retry_queue_table(DDB_TABLE_NAME)
+        self.ddb_manager = DdbManager(self.session.client("dynamodb"), DDB_TABLE_NAME)
+
+    def test_cooldown_and_cycle_limit(self):
+        """
+        Tests that shares in their cooldown are skipped, and shares past the cycle limit are parked.
+        """
+        now = int(time.time())
+        history = RemediationHistory(self.ddb_manager, ONE_HOUR_IN_SECS, 3)
+        history.entries = {RESOURCE_SHARE_ARN: (now - 600, 1), "arn:share/old": (now - 2 * ONE_HOUR_IN_SECS, 2), "arn:share/parked": (now - 2 * ONE_HOUR_IN_SECS, 3)}
+
+        self.assertEqual([history.check(resource_share_arn, now) for resource_share_arn in (RESOURCE_SHARE_ARN, "arn:share/old", "arn:share/parked", "arn:share/new")], [COOLDOWN, RECREATE, PARKED, RECREATE])
+
+    def test_retries_are_never_suppressed(self):
+        """
+        Tests that the retries of failed shares are never suppressed.
+        """
+        history = RemediationHistory(self.ddb_manager, ONE_HOUR_IN_SECS, 1)
+        history.entries = {RESOURCE_SHARE_ARN: (int(time.time()), 1)}
+
+        shares = list(history.filter([(RESOURCE_SHARE_ARN, {"210987654321"}, True), (RESOURCE_SHARE_ARN, {"345678901234"}, False)]))
+
+        self.assertEqual(shares, [(RESOURCE_SHARE_ARN, {"210987654321"}, True)])
+        self.assertEqual(history.as_dict()["parked_shares"], [{"resource_share_arn": RESOURCE_SHARE_ARN, "principals": ["345678901234"], "cycle_count": 1}])
+
+    def test_warm_invocations_only_read_the_new_history(self):
+        """
+        Tests that warm invocations only read the history that was written since the last load.
+        """
+        self.ddb_manager.save_remediation_history({"arn:share/1": (int(time.time()) - ONE_HOUR_IN_SECS, 2)})
+        cold_history = RemediationHistory(self.ddb_manager, ONE_HOUR_IN_SECS)
+        cold_history.load()
+        cold_history.record({"arn:share/1": {"210987654321"}, "arn:share/2": {"345678901234"}})
+
+        warm_history = RemediationHistory(self.ddb_manager, ONE_HOUR_IN_SECS)
+        warm_history.load()
+
+        self.assertEqual(cold_history.read_count, 1)
+        self.assertEqual({resource_share_arn: cycle_count for resource_share_arn, (_, cycle_count) in warm_history.entries.items()}, {"arn:share/1": 3, "arn:share/2": 1})
+        # The entry that was read on the cold start is not read again.
+        self.assertEqual(warm_history.read_count, 2)
+
+
+class TestHandlerRemediationHistory(SimulatedHandlerTestCase):
+    """
+    Test the churn suppression of the handler, with invitations that are never accepted.
+    """
+
+    def setUp(self):
+        remediation_history_module._history_cache.clear()  # pylint: disable=protected-access
+        self.inventory = SimulatedInventory()
+        twelve_hours_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+        for index in range(2):
+            self.inventory.add_resource_share(f"LakeFormation-V4-chronic-{index}", ["210987654321"], twelve_hours_ago)
+        self.session = self.simulate(self.inventory)
+
+    def invoke(self, context=None, **parameters) -> dict:
+        """
+        Run the handler, and let the invitations it recreated expire.
+        """
+        response = super().invoke(context, **parameters)
+        # The recreated invitations are not accepted either, and have expired by the next run.
+        twelve_hours_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+        with self.inventory.lock:
+            for associations in self.inventory.associations.values():
+                for principal, association in associations.items():
+                    associations[principal] = {**association, "creationTime": twelve_hours_ago}
+        return response
+
+    def test_skips_shares_in_their_cooldown(self):
+        """
+        Tests that the handler skips the shares it recreated within the cooldown.
+        """
+        first_response = self.invoke(churn_cooldown_in_seconds=ONE_HOUR_IN_SECS)
+        second_response = self.invoke(churn_cooldown_in_seconds=ONE_HOUR_IN_SECS)
+
+        self.assertEqual(first_response["recreated_count"], 2)
+        self.assertEqual((second_response["recreated_count"], second_response["churn"]["cooldown_count"]), (0, 2))
+        self.assertEqual(self.session.stats.calls["AssociateResourceShare"], 2)
+
+    def test_parks_shares_past_the_cycle_limit(self):
+        """
+        Tests that the handler parks the shares that were recreated as often as the cycle limit.
+        """
+        responses = [self.invoke(max_recreate_cycles=2) for _ in range(3)]
+
+        self.assertEqual([response["recreated_count"] for response in responses], [2, 2, 0])
+        self.assertEqual(responses[2]["churn"]["parked_count"], 2)
+        self.assertIn("Parked = 2", responses[2]["message"])
+        self.assertEqual({parked["cycle_count"] for parked in responses[2]["churn"]["parked_shares"]}, {2})
+
+    def test_workers_record_the_history_of_the_coordinator(self):
+        """
+        Tests that workers record the history the coordinator sent them, and only the coordinator loads it.
+        """
+        with patch.object(RemediationHistory, "load", autospec=True, side_effect=RemediationHistory.load) as load:
+            responses = [self.invoke(max_recreate_cycles=2, mode="coordinator", dispatcher="local", shard_count=2) for _ in range(3)]
+
+        self.assertEqual([sum(shard["recreated_count"] for shard in response["shards"]) for response in responses], [2, 2, 0])
+        self.assertEqual(responses[2]["churn"]["parked_count"], 2)
+        self.assertEqual(load.call_count, 3)
+
+    def test_dry_runs_do_not_record_the_history(self):
+        """
+        Tests that a dry run, which does not change RAM, does not count as a recreation.
+        """
+        responses = [self.invoke(max_recreate_cycles=1, dry_run=True) for _ in range(2)]
+
+        self.assertEqual([response["recreated_count"] for response in responses], [2, 2])
+        self.assertEqual(responses[1]["churn"]["parked_count"], 0)
+
+    def test_history_is_not_used_by_default(self):
+        """
+        Tests that the history is neither read nor written by default.
+        """
+        self.invoke()
+        self.invoke()
+
+        self.assertEqual(self.session.stats.calls["AssociateResourceShare"], 4)
+        items = self.session.client("dynamodb").scan(TableName=DDB_TABLE_NAME)["Items"]
+        self.assertFalse([item for item in items if item["resourceShareArn"]["S"].startswith("history#")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the scheduler.py file.
+"""
+
+import datetime
+import json
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import boto3
+from moto import mock_aws
+
+from lf_stale_ram_invite_monitor.scheduler import NEXT_RUN_SCHEDULE_NAME_ENV, NEXT_RUN_SCHEDULER_ROLE_ARN_ENV, NextRunScheduler, choose_next_run_at
+from tests.simulator import SimulatedInventory
+from tests.simulator.handler import DDB_TABLE_NAME, ELEVEN_HOURS_IN_SECS, SimulatedHandlerTestCase
+
+FUNCTION_ARN = "arn:aws:lambda:us-east-1:123456789012:function:stack-MonitorForExpiredRAMInvites"
+ROLE_ARN = "arn:aws:iam::123456789012:role/stack-NextRunSchedulerRole"
+
+
+class TestChooseNextRunAt(unittest.TestCase):
+    """
+    Test the choice of the next run time.
+    """
+
+    def test_earliest_due_time_within_bounds(self):
+        """
+        Tests that the earliest due time is chosen, within the minimum and maximum interval.
+        """
+        self.assertEqual(choose_next_run_at([2000, None, 1500], 300, 3600, now=1000), 1500)
+        self.assertEqual(choose_next_run_at([1100], 300, 3600, now=1000), 1300)
+        self.assertEqual(choose_next_run_at([9000], 300, 3600, now=1000), 4600)
+        self.assertEqual(choose_next_run_at([None], 300, 3600, now=1000), 4600)
+
+
+@mock_aws
+class TestNextRunScheduler(unittest.TestCase):
+    """
+    Test the one-time schedule against moto.
+    """
+
+    def test_creates_then_moves_the_schedule(self):
+        """
+        Tests that the one-time schedule is created once and then moved, without the resume depth in its input.
+        """
+        scheduler_client = boto3.client("scheduler", region_name="us-east-1")
+        scheduler = NextRunScheduler(scheduler_client, "stack-next-run", ROLE_ARN)
+
+        scheduler.schedule(1714557600, FUNCTION_ARN, {"ddb_table_name": DDB_TABLE_NAME, "resume_depth": 2})
+        scheduler.schedule(1714561200, FUNCTION_ARN, {"ddb_table_name": DDB_TABLE_NAME})
+
+        schedule = scheduler_client.get_schedule(Name="stack-next-run-standalone")
+        self.assertEqual(schedule["ScheduleExpression"], "at(2024-05-01T11:00:00)")
+        self.assertEqual(json.loads(schedule["Target"]["Input"]), {"ddb_table_name": DDB_TABLE_NAME})
+
+
+class TestHandlerNextRun(SimulatedHandlerTestCase):
+    """
+    Test the next run time the handler chooses, against the simulator.
+    """
+
+    def setUp(self):
+        self.inventory = SimulatedInventory()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.inventory.add_resource_share("LakeFormation-V4-expired", ["210987654321"], now - datetime.timedelta(hours=12))
+        self.inventory.add_resource_share("LakeFormation-V4-recent", ["345678901234"], now - datetime.timedelta(hours=8))
+        self.inventory.add_resource_share("LakeFormation-V4-new", ["456789012345"], now - datetime.timedelta(minutes=5))
+        self.expires_at = int((now - datetime.timedelta(hours=8)).timestamp()) + ELEVEN_HOURS_IN_SECS
+        self.session = self.simulate(self.inventory)
+
+    def test_next_run_when_the_next_invitation_expires(self):
+        """
+        Tests that the next run is chosen for when the next associating invitation reaches the timeout.
+        """
+        response = self.invoke()
+
+        self.assertEqual(response["recreated_count"], 1)
+        self.assertEqual(response["next_run_at"], self.expires_at)
+
+    def test_next_run_is_clamped_to_the_interval(self):
+        """
+        Tests that the next run is never later than the maximum interval.
+        """
+        response = self.invoke(next_run_max_interval_in_seconds=3600)
+
+        self.assertAlmostEqual(response["next_run_at"], time.time() + 3600, delta=60)
+
+    def test_schedules_the_next_run(self):
+        """
+        Tests that predictive scheduling moves the one-time schedule to the next run.
+        """
+        scheduler_client = MagicMock()
+        self.session.clients["scheduler"] = scheduler_client
+        context = MagicMock(invoked_function_arn=FUNCTION_ARN, get_remaining_time_in_millis=MagicMock(return_value=300000))
+        with patch.dict(os.environ, {NEXT_RUN_SCHEDULE_NAME_ENV: "stack-next-run", NEXT_RUN_SCHEDULER_ROLE_ARN_ENV: ROLE_ARN}):
+            self.invoke(context, predictive_scheduling="true")
+
+        parameters = scheduler_client.update_schedule.call_args.kwargs
+        self.assertEqual(parameters["Name"], "stack-next-run-standalone")
+        self.assertEqual(parameters["Target"]["Arn"], FUNCTION_ARN)
+        self.assertEqual(parameters["ScheduleExpression"], f"at({datetime.datetime.fromtimestamp(self.expires_at, tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')})")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the share_index.py file.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from lf_stale_ram_invite_monitor import ddb_manager as ddb_manager_module
+from lf_stale_ram_invite_monitor import ram_manager as ram_manager_module
+from lf_stale_ram_invite_monitor.ddb_manager import DdbManager
+from lf_stale_ram_invite_monitor.lf_permission_fixer import RECREATE, LakeFormationPermissionFixer
+from lf_stale_ram_invite_monitor.ram_manager import EnumerationOptions, RamManager
+from lf_stale_ram_invite_monitor.share_index import DdbShareIndexStore, FileShareIndexStore, ShareIndex, lake_formation_resource
+from tests.simulator import SimulatedSession, build_inventory
+
+DDB_TABLE_NAME = "lf_stale_ram_invite_monitor"
+ELEVEN_HOURS_IN_SECS = 11 * 60 * 60
+
+
+class TestShareIndex(unittest.TestCase):
+    """
+    Test the share index against the simulator.
+    """
+
+    def setUp(self):
+        self.inventory = build_inventory(50, principals_per_share=2, lake_formation_ratio=0.5, seed=3)
+        self.session = SimulatedSession(self.inventory)
+        self.session.create_retry_queue_table(DDB_TABLE_NAME)
+        # The share list is not cached, so every refresh sees the changes of the test.
+        self.addCleanup(ram_manager_module._lake_formation_share_cache.clear)  # pylint: disable=protected-access
+        self.ram_manager = RamManager(self.session.client("ram"), ELEVEN_HOURS_IN_SECS, False, enumeration=EnumerationOptions(share_cache_ttl_in_secs=0))
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.index_path = os.path.join(directory.name, "index.json")
+
+    def share_index(self, store) -> ShareIndex:
+        """
+        A share index over the simulated RAM and Lake Formation clients.
+        """
+        return ShareIndex(store, self.ram_manager, self.session.client("lakeformation"))
+
+    def expected_principals(self) -> dict[str, set[str]]:
+        """
+        The principals of every resource share according to the Lake Formation permissions of the inventory.
+        """
+        shared_principals: dict[str, set[str]] = {}
+        for permission in self.inventory.permissions:
+            for resource_share_arn in permission["AdditionalDetails"]["ResourceShare"]:
+                shared_principals.setdefault(resource_share_arn, set()).add(permission["Principal"]["DataLakePrincipalIdentifier"])
+        return shared_principals
+
+    def test_lake_formation_resource(self):
+        """
+        Tests that Glue arns are turned into Lake Formation resources.
+        """
+        self.assertEqual(lake_formation_resource("arn:aws:glue:us-east-1:123456789012:database/sales"), {"Database": {"CatalogId": "123456789012", "Name": "sales"}})
+        self.assertEqual(lake_formation_resource("arn:aws:glue:us-east-1:123456789012:table/sales/orders"), {"Table": {"CatalogId": "123456789012", "DatabaseName": "sales", "Name": "orders"}})
+        self.assertEqual(lake_formation_resource("arn:aws:glue:us-east-1:123456789012:table/sales/*"), {"Table": {"CatalogId": "123456789012", "DatabaseName": "sales", "TableWildcard": {}}})
+        self.assertIsNone(lake_formation_resource("arn:aws:glue:us-east-1:123456789012:catalog"))
+        self.assertIsNone(lake_formation_resource("arn:aws:s3:::bucket"))
+
+    def test_builds_and_refreshes_incrementally(self):
+        """
+        Tests that a refresh only looks up the resources of changed shares.
+        """
+        counts = self.share_index(FileShareIndexStore(self.index_path)).refresh()
+        self.assertTrue(counts["full_refresh"])
+
+        # A new principal on an existing share only re-lists the permissions of the resource of that share.
+        resource_share_arn = sorted(self.expected_principals())[0]
+        self.inventory.grant(resource_share_arn, "999999999999")
+        list_permission_calls = self.session.stats.calls["ListPermissions"]
+        share_index = self.share_index(FileShareIndexStore(self.index_path))
+        counts = share_index.refresh()
+
+        self.assertFalse(counts["full_refresh"])
+        self.assertEqual(counts["changed_count"], 1)
+        self.assertEqual(self.session.stats.calls["ListPermissions"] - list_permission_calls, 1)
+        self.assertEqual(share_index.get_shared_principals(), self.expected_principals())
+        self.assertIn("999999999999", share_index.get_shared_principals()[resource_share_arn])
+
+    def test_many_changes_rebuild_the_index(self):
+        """
+        Tests that too many changed shares rebuild the whole index.
+        """
+        self.share_index(FileShareIndexStore(self.index_path)).refresh()
+        for resource_share_arn in sorted(self.expected_principals())[:10]:
+            self.inventory.grant(resource_share_arn, "999999999999")
+
+        self.assertTrue(self.share_index(FileShareIndexStore(self.index_path)).refresh()["full_refresh"])
+
+    def test_ddb_store_round_trip(self):
+        """
+        Tests that the index saved in DDB is read back unchanged.
+        """
+        store = DdbShareIndexStore(DdbManager(self.session.client("dynamodb"), DDB_TABLE_NAME))
+        share_index = self.share_index(store)
+        share_index.refresh()
+        self.assertIsNone(share_index.refresh_if_older_than(3600))
+
+        reloaded = self.share_index(DdbShareIndexStore(DdbManager(self.session.client("dynamodb"), DDB_TABLE_NAME)))
+        self.assertEqual(reloaded.get_shared_principals(), self.expected_principals())
+        self.assertEqual(reloaded.metadata, share_index.metadata)
+        # The entries are queried, the table is never scanned.
+        self.assertEqual(self.session.stats.calls.get("Scan", 0), 0)
+
+    def test_entries_without_a_queue_rebuild_the_index(self):
+        """
+        Tests that entries written without a queue are not read and rebuild the index.
+        """
+        ddb_client = self.session.client("dynamodb")
+        self.share_index(DdbShareIndexStore(DdbManager(ddb_client, DDB_TABLE_NAME))).refresh()
+        # Entries written before they were queued are not read.
+        for item in ddb_client.scan(TableName=DDB_TABLE_NAME)["Items"]:
+            if item["resourceShareArn"]["S"].startswith("index#"):
+                ddb_client.put_item(TableName=DDB_TABLE_NAME, Item={key: value for key, value in item.items() if key not in ("retry_queue", "next_attempt_at")})
+
+        share_index = self.share_index(DdbShareIndexStore(DdbManager(ddb_client, DDB_TABLE_NAME)))
+        self.assertTrue(share_index.refresh_if_older_than(3600)["full_refresh"])
+        self.assertEqual(share_index.get_shared_principals(), self.expected_principals())
+
+    def test_recent_index_only_reads_the_arns(self):
+        """
+        Tests that a recent index only reads its stored arns, and that the chunks follow the index.
+        """
+        ddb_client = self.session.client("dynamodb")
+        with patch.object(ddb_manager_module, "MAX_SHARE_INDEX_ARNS_PER_ITEM", 7):
+            self.share_index(DdbShareIndexStore(DdbManager(ddb_client, DDB_TABLE_NAME))).refresh()
+            query_calls = self.session.stats.calls["Query"]
+
+            share_index = self.share_index(DdbShareIndexStore(DdbManager(ddb_client, DDB_TABLE_NAME)))
+            self.assertEqual(share_index.recent_resource_share_arns(3600), sorted(self.expected_principals()))
+            self.assertFalse(share_index.loaded)
+            self.assertEqual(self.session.stats.calls["Query"], query_calls)
+
+            # A full refresh with fewer shares drops the chunks that are no longer needed.
+            removed_resource_share_arns = sorted(self.expected_principals())[:10]
+            for permission in list(self.inventory.permissions):
+                if set(permission["AdditionalDetails"]["ResourceShare"]) & set(removed_resource_share_arns):
+                    self.inventory.permissions.remove(permission)
+            self.share_index(DdbShareIndexStore(DdbManager(ddb_client, DDB_TABLE_NAME))).refresh(full=True)
+
+            share_index = self.share_index(DdbShareIndexStore(DdbManager(ddb_client, DDB_TABLE_NAME)))
+            self.assertEqual(share_index.recent_resource_share_arns(3600), sorted(self.expected_principals()))
+            chunk_keys = [item["resourceShareArn"]["S"] for item in ddb_client.scan(TableName=DDB_TABLE_NAME)["Items"] if item["resourceShareArn"]["S"].startswith(ddb_manager_module.SHARE_INDEX_ARNS_KEY_PREFIX)]
+            self.assertEqual(len(chunk_keys), share_index.store.load_metadata()["arn_chunk_count"])
+
+        # An older index is refreshed first.
+        self.assertEqual(self.share_index(DdbShareIndexStore(DdbManager(ddb_client, DDB_TABLE_NAME))).recent_resource_share_arns(0), sorted(self.expected_principals()))
+
+    def test_fixer_reads_the_index(self):
+        """
+        Tests that the fixer takes the shared principals from the index instead of Lake Formation.
+        """
+        share_index = self.share_index(FileShareIndexStore(self.index_path))
+        share_index.refresh()
+        list_permission_calls = self.session.stats.calls["ListPermissions"]
+
+        actions = LakeFormationPermissionFixer(self.session.client("lakeformation"), self.ram_manager, True, share_index=share_index).run()
+
+        self.assertEqual(self.session.stats.calls["ListPermissions"], list_permission_calls)
+        self.assertEqual({(action.resource_share_arn, action.account_id) for action in actions if action.action == RECREATE}, {(arn, principal) for arn, principals in self.inventory.expired_invitations(ELEVEN_HOURS_IN_SECS).items() for principal in principals})
+
+
+if __name__ == "__main__":
+    unittest.main()
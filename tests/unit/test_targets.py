@@ -0,0 +1,111 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the targets.py file.
+"""
+
+import datetime
+import time
+import unittest
+
+import botocore.exceptions
+
+from lf_stale_ram_invite_monitor.ddb_manager import DdbManager
+from lf_stale_ram_invite_monitor.targets import Target, parse_targets
+from tests.simulator import SimulatedInventory, SimulatedSession
+from tests.simulator.handler import DDB_TABLE_NAME, SimulatedHandlerTestCase
+
+HOME_ACCOUNT_ID = "111122223333"
+REMOTE_ROLE_ARN = "arn:aws:iam::444455556666:role/lf-stale-ram-invite-monitor"
+DENIED_ROLE_ARN = "arn:aws:iam::777788889999:role/lf-stale-ram-invite-monitor"
+
+
+class TestTargets(unittest.TestCase):
+    """
+    Test the parsing of the sweep targets.
+    """
+
+    def test_parse_targets(self):
+        """
+        Tests that the targets are parsed, deduplicated and validated.
+        """
+        targets = parse_targets([{"region": "us-east-1"}, {"region": "eu-west-1", "role_arn": REMOTE_ROLE_ARN, "external_id": "monitor"}, {"region": "us-east-1"}])
+
+        self.assertEqual([target.name for target in targets], ["self/us-east-1", "444455556666/eu-west-1"])
+        self.assertEqual(targets[1].external_id, "monitor")
+        with self.assertRaises(ValueError):
+            Target.from_dict({"role_arn": REMOTE_ROLE_ARN})
+
+    def test_retries_are_filtered_by_resource_share_arn_prefix(self):
+        """
+        Tests that a target only retries the resource shares of its region and account.
+        """
+        session = SimulatedSession(SimulatedInventory())
+        session.create_retry_queue_table(DDB_TABLE_NAME)
+        now = int(time.time())
+        for resource_share_arn in ("arn:aws:ram:us-east-1:111122223333:resource-share/a", "arn:aws:ram:eu-west-1:111122223333:resource-share/b"):
+            item = DdbManager._retry_item(resource_share_arn, {"210987654321"}, 1, now, now - 600)  # pylint: disable=protected-access
+            session.client("dynamodb").put_item(TableName=DDB_TABLE_NAME, Item=item)
+
+        ddb_manager = DdbManager(session.client("dynamodb"), DDB_TABLE_NAME, "arn:aws:ram:eu-west-1:111122223333:")
+
+        self.assertEqual(ddb_manager.get_previously_failed_accounts_for_resource_share(), {"arn:aws:ram:eu-west-1:111122223333:resource-share/b": {"210987654321"}})
+
+
+class TestHandlerSweep(SimulatedHandlerTestCase):
+    """
+    Test the sweep mode of the handler against one simulated account and region per target.
+    """
+
+    def setUp(self):
+        twelve_hours_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+        self.home_inventory = SimulatedInventory("us-east-1", HOME_ACCOUNT_ID)
+        self.remote_inventory = SimulatedInventory("eu-west-1", "444455556666")
+        for index in range(2):
+            self.home_inventory.add_resource_share(f"LakeFormation-V4-home-{index}", ["210987654321"], twelve_hours_ago)
+        for index in range(3):
+            self.remote_inventory.add_resource_share(f"LakeFormation-V4-remote-{index}", ["345678901234"], twelve_hours_ago)
+        self.home_session = self.simulate(self.home_inventory)
+        self.remote_session = SimulatedSession(self.remote_inventory)
+        self.patch_handler("create_target_clients", self.create_target_clients)
+
+    def create_target_clients(self, target: Target):
+        """
+        The simulated session of a target, or an access denied error for the denied role.
+        """
+        if target.role_arn == DENIED_ROLE_ARN:
+            raise botocore.exceptions.ClientError({"Error": {"Code": "AccessDenied", "Message": "Not authorized to perform sts:AssumeRole"}}, "AssumeRole")
+        return self.remote_session if target.role_arn == REMOTE_ROLE_ARN else self.home_session
+
+    def sweep(self, **parameters) -> dict:
+        """
+        Run the handler in sweep mode.
+        """
+        return self.invoke(mode="sweep", **parameters)
+
+    def test_sweeps_every_target(self):
+        """
+        Tests that every target is remediated, and that a target that fails does not stop the others.
+        """
+        targets = [{"region": "us-east-1"}, {"region": "eu-west-1", "role_arn": REMOTE_ROLE_ARN}, {"region": "eu-west-1", "role_arn": DENIED_ROLE_ARN}]
+
+        response = self.sweep(targets=targets, max_parallel_targets=2)
+
+        self.assertEqual((response["target_count"], response["recreated_count"], response["failed_target_count"]), (3, 5, 1))
+        self.assertEqual([(result["target"], result["recreated_count"]) for result in response["targets"]], [("self/us-east-1", 2), ("444455556666/eu-west-1", 3), ("777788889999/eu-west-1", 0)])
+        self.assertIn("AccessDenied", response["targets"][2]["error"])
+        self.assertEqual(self.remote_session.stats.calls["AssociateResourceShare"], 3)
+        self.assertEqual(self.home_session.stats.calls["AssociateResourceShare"], 2)
+        self.assertEqual(response["targets"][1]["verification"]["verified_count"], 3)
+
+    def test_rejects_the_share_index_strategy(self):
+        """
+        Tests that the sweep mode rejects the share_index enumeration strategy.
+        """
+        with self.assertRaises(ValueError):
+            self.sweep(targets=[{"region": "us-east-1"}], enumeration_strategy="share_index")
+
+
+if __name__ == "__main__":
+    unittest.main()
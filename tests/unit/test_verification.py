@@ -0,0 +1,120 @@
+"""
+Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+SPDX-License-Identifier: MIT-0
+
+Tests for the verification.py file.
+"""
+
+import datetime
+import unittest
+from unittest.mock import patch
+
+from lf_stale_ram_invite_monitor import verification as verification_module
+from lf_stale_ram_invite_monitor.ddb_manager import DdbManager
+from lf_stale_ram_invite_monitor.ram_manager import RamManager
+from lf_stale_ram_invite_monitor.verification import RemediationVerifier
+from tests.simulator import SimulatedInventory, SimulatedSession
+from tests.simulator.handler import DDB_TABLE_NAME, ELEVEN_HOURS_IN_SECS, SimulatedHandlerTestCase
+
+
+class TestRemediationVerifier(unittest.TestCase):
+    """
+    Test the verification phase against the simulator.
+    """
+
+    def setUp(self):
+        self.inventory = SimulatedInventory()
+        twelve_hours_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+        self.associated_arn = self.inventory.add_resource_share("LakeFormation-V4-associated", ["210987654321", "345678901234"], twelve_hours_ago)
+        self.failed_arn = self.inventory.add_resource_share("LakeFormation-V4-failed", ["456789012345"], twelve_hours_ago)
+        self.session = SimulatedSession(self.inventory)
+        self.session.create_retry_queue_table(DDB_TABLE_NAME)
+        self.ram_manager = RamManager(self.session.client("ram"), ELEVEN_HOURS_IN_SECS, False)
+        self.ddb_manager = DdbManager(self.session.client("dynamodb"), DDB_TABLE_NAME)
+
+    def retry_item(self, resource_share_arn: str) -> dict:
+        """
+        The retry queue item of a resource share.
+        """
+        return self.session.client("dynamodb").get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": resource_share_arn}})
+
+    def test_failed_and_unknown_invitations_are_queued_for_a_retry(self):
+        """
+        Tests that invitations that failed, or that RAM no longer reports, are queued for a retry.
+        """
+        self.inventory.set_association_status(self.associated_arn, ["210987654321"], "ASSOCIATING")
+        self.inventory.set_association_status(self.associated_arn, ["345678901234"], "ASSOCIATED")
+        self.inventory.set_association_status(self.failed_arn, ["456789012345"], "FAILED")
+
+        summary = RemediationVerifier(self.ram_manager, self.ddb_manager).verify({self.associated_arn: {"210987654321", "345678901234"}, self.failed_arn: {"456789012345", "567890123456"}})
+
+        self.assertEqual((summary.verified_count, summary.pending_count, summary.failed_count, summary.round_count), (2, 0, 2, 1))
+        # Both shares were polled with a single call.
+        self.assertEqual(self.session.stats.calls["GetResourceShareAssociations"], 1)
+        self.assertEqual(set(self.retry_item(self.failed_arn)["Item"]["principals"]["SS"]), {"456789012345", "567890123456"})
+        self.assertNotIn("Item", self.retry_item(self.associated_arn))
+
+    def test_polls_with_backoff_until_the_budget_runs_out(self):
+        """
+        Tests that pending invitations are polled with an exponential backoff until the budget runs out.
+        """
+        self.inventory.set_association_status(self.associated_arn, ["210987654321", "345678901234"], "DISASSOCIATED")
+        sleeps = []
+
+        def sleep(seconds: float):
+            sleeps.append(seconds)
+            # The first invitation lands after the first round, the second one never does.
+            self.inventory.set_association_status(self.associated_arn, ["210987654321"], "ASSOCIATING")
+
+        with patch.object(verification_module.time, "sleep", side_effect=sleep), patch.object(verification_module.time, "monotonic", side_effect=lambda: sum(sleeps)):
+            summary = RemediationVerifier(self.ram_manager, self.ddb_manager, budget_in_secs=10).verify({self.associated_arn: {"210987654321", "345678901234"}})
+
+        self.assertEqual(sleeps, [1.0, 2.0, 4.0])
+        self.assertEqual((summary.verified_count, summary.pending_count, summary.failed_count, summary.round_count), (1, 1, 0, 4))
+        self.assertNotIn("Item", self.retry_item(self.associated_arn))
+
+
+class TestHandlerVerification(SimulatedHandlerTestCase):
+    """
+    Test the verification counts of the handler, against the simulator.
+    """
+
+    def setUp(self):
+        self.inventory = SimulatedInventory()
+        twelve_hours_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=12)
+        self.resource_share_arn = self.inventory.add_resource_share("LakeFormation-V4-expired", ["210987654321", "345678901234"], twelve_hours_ago)
+        self.inventory.failing_principals.add("345678901234")
+        self.session = self.simulate(self.inventory)
+
+    def test_reports_the_verification(self):
+        """
+        Tests that the handler reports the verification and queues the failed invitation for a retry.
+        """
+        response = self.invoke()
+
+        self.assertEqual(response["recreated_count"], 2)
+        self.assertEqual({key: response["verification"][key] for key in ("verified_count", "pending_count", "failed_count")}, {"verified_count": 1, "pending_count": 0, "failed_count": 1})
+        item = self.session.client("dynamodb").get_item(TableName=DDB_TABLE_NAME, Key={"resourceShareArn": {"S": self.resource_share_arn}})
+        self.assertEqual(item["Item"]["principals"]["SS"], ["345678901234"])
+
+    def test_verification_can_be_turned_off(self):
+        """
+        Tests that a verification budget of 0 turns the verification off.
+        """
+        response = self.invoke(verification_budget_in_seconds=0)
+
+        self.assertNotIn("verification", response)
+
+    def test_dry_run_does_not_change_or_verify_ram(self):
+        """
+        Tests that a dry run, with the flag as the template passes it, does not call RAM.
+        """
+        response = self.invoke(dry_run="true")
+
+        self.assertEqual(response["recreated_count"], 2)
+        self.assertNotIn("verification", response)
+        self.assertEqual((self.session.stats.calls["DisassociateResourceShare"], self.session.stats.calls["AssociateResourceShare"]), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Copyright 2024 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of
+the Software, and to permit persons to whom the Software is furnished to do so.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+Script Purpose:
+=====================================================================================
+Copies the resource shares that failed to be recreated from the table of an earlier
+version of the monitor into the retry queue table, where they are retried by the next run.
+With the retry queue table as the source too, it moves the items from before the retry
+queue that were written to that table into the queue. The monitor itself never scans for them.
+The work is done by lf_stale_ram_invite_monitor.ddb_manager, this script only parses
+the arguments and creates the client.
+
+"""
+
+# pylint: disable=logging-fstring-interpolation
+import argparse
+import logging
+
+import boto3
+from aws_lambda_powertools import Logger
+
+from lf_stale_ram_invite_monitor.ddb_manager import DdbManager
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    """
+    Parse the arguments and copy the items of the old table into the retry queue table.
+    """
+    argParser = argparse.ArgumentParser(description="A utility that copies the resource shares of the table of an earlier version of the monitor into the retry queue table.")
+    argParser.add_argument("--source-table", help="The table of the earlier version, named after the DynamoDbTableName parameter.", required=True)
+    argParser.add_argument("--target-table", help="The retry queue table, <DynamoDbTableName>-retry-queue.", required=True)
+    argParser.add_argument("--log_level", "-l", help="log level as DEBUG, INFO, WARN, ERROR. ", default="INFO", required=False)
+    namespace = argParser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s:%(message)s", level=namespace.log_level)
+    Logger().setLevel(namespace.log_level)
+
+    ddb_manager = DdbManager(boto3.session.Session().client("dynamodb"), namespace.target_table)
+    copied_count = ddb_manager.copy_legacy_items(namespace.source_table)
+    logger.info(f"Copied {copied_count} resource shares from {namespace.source_table} to {namespace.target_table}")
+
+
+if __name__ == "__main__":
+    main()